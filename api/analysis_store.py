@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_whitespace_pattern = re.compile(r"\s+")
+
+def analysis_name(ingredient):
+    #Only case and whitespace are folded: unlike the embedding cache key, additive codes such as "(E102)"
+    #or "(INS 471)" are kept, since one class name covers additives with very different analyses
+    return _whitespace_pattern.sub(" ", ingredient.lower()).strip(" ,.;:")
+
+class AnalysisStore:
+    """
+    Two-tier store of finished ingredient analyses: an in-memory LRU in front of a SQLite table shared
+    by the workers on the host. Entries are keyed by ingredient name (additive code included), the retrieved
+    article set and the analysis version (mode, model and prompt version), and are refreshed after ttl seconds.
+    """
+
+    def __init__(self, path, version, ttl, capacity=4096):
+        self.path = path
+        self.version = version
+        self.ttl = ttl
+        self.capacity = capacity
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _db(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, ingredient TEXT, analysis TEXT, refs TEXT, not_found INTEGER, created_at REAL)")
+            self._connection.commit()
+        return self._connection
+
+    def key(self, ingredient, file_paths):
+        return hashlib.sha256(json.dumps([analysis_name(ingredient), sorted(file_paths), self.version]).encode("utf-8")).hexdigest()
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get(self, ingredient, file_paths):
+        #(ingredient_analysis, refs, is_ingredient_not_found_in_doc) of a fresh entry, None otherwise
+        key = self.key(ingredient, file_paths)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[3] <= self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[:3]
+            row = self._db().execute("SELECT analysis, refs, not_found, created_at FROM analyses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[3] <= self.ttl:
+                entry = (row[0], json.loads(row[1]), bool(row[2]), row[3])
+                self._remember(key, entry)
+                self.disk_hits += 1
+                return entry[:3]
+            self.misses += 1
+            return None
+
+    def put(self, ingredient, file_paths, ingredient_analysis, refs, is_ingredient_not_found_in_doc):
+        key = self.key(ingredient, file_paths)
+        entry = (ingredient_analysis, list(refs), bool(is_ingredient_not_found_in_doc), time.time())
+        with self._lock:
+            self._remember(key, entry)
+            self._db().execute(
+                "INSERT OR REPLACE INTO analyses (key, ingredient, analysis, refs, not_found, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, ingredient, entry[0], json.dumps(entry[1]), int(entry[2]), entry[3]),
+            )
+            self._db().commit()
+            self.stores += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
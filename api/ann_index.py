@@ -0,0 +1,121 @@
+import os
+import numpy as np
+from .retrieval import matrix_hash, normalize_rows, to_float32_matrix, top_k, SCORE_BLOCK_ROWS
+
+#Persisted next to the embedding store, e.g. docs/embeddings.ivf.npz (built by utils/build_corpus.py or utils/build_ann_index.py)
+IVF_FORMAT_VERSION = 2
+
+def _block_scores(matrix, queries, start):
+    block = matrix[start:start + SCORE_BLOCK_ROWS]
+    return block.astype(np.float32, copy=False) @ queries.T
+
+def assign_to_lists(matrix, centroids):
+    #Index of the most similar centroid for every row, computed block by block
+    assignments = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+        scores = _block_scores(matrix, centroids, start)
+        assignments[start:start + scores.shape[0]] = np.argmax(scores, axis=1)
+    return assignments
+
+def spherical_kmeans(matrix, n_lists, iterations=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = normalize_rows(np.asarray(matrix[np.sort(rng.choice(matrix.shape[0], n_lists, replace=False))], dtype=np.float32))
+    for _ in range(iterations):
+        assignments = assign_to_lists(matrix, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=n_lists)
+        non_empty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty]
+        sums = np.add.reduceat(np.asarray(matrix[order], dtype=np.float32), starts, axis=0)
+        centroids[non_empty] = normalize_rows(sums)
+        #Lists that lost every member are re-seeded from random rows
+        empty = np.flatnonzero(counts == 0)
+        if len(empty) > 0:
+            centroids[empty] = normalize_rows(np.asarray(matrix[rng.choice(matrix.shape[0], len(empty), replace=False)], dtype=np.float32))
+    return centroids, assign_to_lists(matrix, centroids)
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest neighbour index over a TitleMatrix. Rows are clustered
+    into n_lists spherical k-means lists; a query is scored against the centroids and only the
+    rows of the n_probe closest lists are scored exactly. n_probe is the recall/latency knob:
+    n_probe == n_lists is equivalent to the exact search. The index records the matrix_hash of the
+    embeddings it was built from and only loads over the same embeddings.
+    """
+
+    def __init__(self, title_matrix, centroids, order, offsets, n_probe=8, content_hash=None):
+        self.title_matrix = title_matrix
+        self.content_hash = content_hash
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.n_probe = n_probe
+
+    @classmethod
+    def build(cls, title_matrix, n_lists=None, iterations=10, seed=0, n_probe=8, content_hash=None):
+        #content_hash is the "matrix_hash" of the .emb header when there is one, computed otherwise
+        matrix = title_matrix.matrix
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(matrix.shape[0])))
+        n_lists = min(n_lists, matrix.shape[0])
+        centroids, assignments = spherical_kmeans(matrix, n_lists, iterations, seed)
+        order = np.argsort(assignments, kind="stable").astype(np.int32)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=n_lists)))).astype(np.int64)
+        return cls(title_matrix, centroids, order, offsets, n_probe, content_hash or matrix_hash(matrix))
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return len(self.title_matrix)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path, version=IVF_FORMAT_VERSION, rows=len(self), matrix_hash=self.content_hash,
+            centroids=self.centroids, order=self.order, offsets=self.offsets,
+        )
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def read_content_hash(path):
+        #matrix_hash the index at path was built from, None for an unreadable or older index
+        try:
+            data = np.load(path)
+            if int(data["version"]) != IVF_FORMAT_VERSION:
+                return None
+            return str(data["matrix_hash"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @classmethod
+    def load(cls, path, title_matrix, n_probe=8, content_hash=None):
+        data = np.load(path)
+        if int(data["version"]) != IVF_FORMAT_VERSION:
+            raise ValueError(f"{path} has unsupported IVF format version {int(data['version'])}")
+        if int(data["rows"]) != len(title_matrix):
+            raise ValueError(f"{path} indexes {int(data['rows'])} rows but the embedding matrix has {len(title_matrix)}")
+        #Same row count is not enough: a rebuilt corpus with as many titles has different rows
+        content_hash = content_hash or matrix_hash(title_matrix.matrix)
+        if str(data["matrix_hash"]) != content_hash:
+            raise ValueError(f"{path} was built from other embeddings (matrix hash {str(data['matrix_hash'])[:12]}, expected {content_hash[:12]})")
+        return cls(title_matrix, data["centroids"], data["order"], data["offsets"], n_probe, content_hash)
+
+    def candidates(self, query, n_probe=None):
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        lists = top_k(self.centroids @ query, n_probe)
+        return np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+
+    def search(self, query, N=2, n_probe=None):
+        return self.search_batch(query, N, n_probe)[0]
+
+    def search_batch(self, queries, N=2, n_probe=None):
+        #Same output as TitleMatrix.search_batch: one [(row, cosine_sim)] list per query, best first
+        queries = normalize_rows(to_float32_matrix(queries).reshape(-1, self.centroids.shape[1]))
+        results = []
+        for query in queries:
+            rows = np.sort(self.candidates(query, n_probe))
+            scores = np.asarray(self.title_matrix.matrix[rows], dtype=np.float32) @ query
+            results.append([(int(rows[i]), float(scores[i])) for i in top_k(scores, N)])
+        return results
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+class AssistantPool:
+    """
+    Bounded LRU of remote assistants (with their vector stores) keyed by the retrieved file set and the
+    model/prompt version. Leased assistants are never deleted under a running analysis: an evicted or
+    expired entry that is still leased is deleted when its last lease is released. Concurrent misses
+    for the same key wait for a single creation instead of each building their own assistant.
+    """
+
+    def __init__(self, max_size=64, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._creating = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, entry, now):
+        return now - entry["created_at"] > self.ttl
+
+    def _evict(self, key):
+        #Called with the lock held; returns the entry when it can be deleted right away
+        entry = self._entries.pop(key)
+        entry["evicted"] = True
+        self.evictions += 1
+        return entry if entry["leases"] == 0 else None
+
+    def _trim(self, now):
+        #Called with the lock held: expired idle entries go first, then least recently used idle entries over max_size
+        to_delete = []
+        for key in [key for key, entry in self._entries.items() if self._expired(entry, now) and entry["leases"] == 0]:
+            to_delete.append(self._evict(key))
+        for key in [key for key, entry in self._entries.items() if entry["leases"] == 0][:max(0, len(self._entries) - self.max_size)]:
+            to_delete.append(self._evict(key))
+        return to_delete
+
+    def _delete(self, entries):
+        for entry in entries:
+            try:
+                entry["delete"]()
+            except Exception as e:
+                print(f"Failed to delete pooled assistant {entry['assistant'].id} : {e}")
+
+    def _acquire(self, key, create_fn, delete_fn):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                entry = self._entries.get(key)
+                if entry is not None and not self._expired(entry, now):
+                    self._entries.move_to_end(key)
+                    entry["leases"] += 1
+                    self.hits += 1
+                    return entry
+                to_delete = [self._evict(key)] if entry is not None else []
+                creation = self._creating.get(key)
+                is_creator = creation is None
+                if is_creator:
+                    creation = self._creating[key] = Future()
+            self._delete([entry for entry in to_delete if entry is not None])
+            if not is_creator:
+                #Another request is building this assistant; take it from the pool once it is there
+                try:
+                    creation.result()
+                except Exception:
+                    pass
+                continue
+
+            try:
+                assistant, resources = create_fn()
+            except Exception as e:
+                with self._lock:
+                    del self._creating[key]
+                creation.set_exception(e)
+                raise
+            entry = {
+                "assistant": assistant,
+                "delete": lambda: delete_fn(assistant, resources),
+                "created_at": time.monotonic(),
+                "leases": 1,
+                "evicted": False,
+            }
+            with self._lock:
+                del self._creating[key]
+                self._entries[key] = entry
+                self.misses += 1
+                to_delete = self._trim(entry["created_at"])
+            creation.set_result(None)
+            self._delete([entry for entry in to_delete if entry is not None])
+            return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry["leases"] -= 1
+            ready = entry["evicted"] and entry["leases"] == 0
+        if ready:
+            self._delete([entry])
+
+    @contextmanager
+    def lease(self, key, create_fn, delete_fn):
+        #create_fn() -> (assistant, resources); delete_fn(assistant, resources) removes them remotely on eviction
+        entry = self._acquire(key, create_fn, delete_fn)
+        try:
+            yield entry["assistant"]
+        finally:
+            self._release(entry)
+
+    def clear(self):
+        #Deletes every idle pooled assistant, e.g. on shutdown; leased ones are deleted when released
+        with self._lock:
+            to_delete = [self._evict(key) for key in list(self._entries)]
+        self._delete([entry for entry in to_delete if entry is not None])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "leased": sum(1 for entry in self._entries.values() if entry["leases"] > 0),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
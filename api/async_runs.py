@@ -0,0 +1,66 @@
+#Assistant runs on AsyncOpenAI: threads are created, run and polled without blocking the event loop,
+#so one loop can drive many concurrent runs instead of one worker thread per run.
+import asyncio
+import random
+import re
+from .config import RUN_POLL_INITIAL_SECONDS, RUN_POLL_MAX_SECONDS, RUN_TIMEOUT_SECONDS
+
+RUN_TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired", "incomplete", "requires_action")
+
+#Runs report rate limits as a failed status, e.g. "Rate limit reached for gpt-4o ... Please try again in 6.5s."
+_try_again_pattern = re.compile(r"try again in (\d+(?:\.\d+)?)(ms|s)")
+
+class RunRateLimited(Exception):
+    #A run that failed with rate_limit_exceeded; retry_after is the delay the error message asks for, if any
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def run_retry_after(message):
+    match = _try_again_pattern.search(message or "")
+    if match is None:
+        return None
+    return float(match.group(1)) / (1000 if match.group(2) == "ms" else 1)
+
+async def poll_run(client, thread_id, run_id, initial=RUN_POLL_INITIAL_SECONDS, maximum=RUN_POLL_MAX_SECONDS, timeout=RUN_TIMEOUT_SECONDS):
+    #Polls quickly at first, since short runs finish in a few seconds, then backs off with jitter up to maximum
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = initial
+    while True:
+        run = await client.beta.threads.runs.retrieve(run_id=run_id, thread_id=thread_id)
+        if run.status in RUN_TERMINAL_STATUSES:
+            return run
+        if loop.time() + delay > deadline:
+            #An abandoned run keeps consuming tokens; cancel it, but report the timeout whatever the cancel does
+            try:
+                await client.beta.threads.runs.cancel(run_id=run_id, thread_id=thread_id)
+            except Exception as e:
+                print(f"Failed to cancel run {run_id} : {e}")
+            raise TimeoutError(f"Run {run_id} still {run.status} after {timeout}s")
+        await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+        delay = min(delay * 1.6, maximum)
+
+async def run_thread(client, assistant_id, user_prompt, context, **run_options):
+    """
+    Creates a thread with user_prompt, runs assistant_id on it and returns the text content of the
+    first reply message. context names the analysis in errors, like the sync polling loops did.
+    """
+    thread = await client.beta.threads.create(messages=[{"role": "user", "content": user_prompt}])
+    run = await client.beta.threads.runs.create(thread_id=thread.id, assistant_id=assistant_id, **run_options)
+    run = await poll_run(client, thread.id, run.id)
+    if run.status == "failed" and run.last_error is not None and run.last_error.code == "rate_limit_exceeded":
+        raise RunRateLimited(f"{context} : run {run.id} was rate limited ({run.last_error.message})", run_retry_after(run.last_error.message))
+    if run.status != "completed":
+        raise RuntimeError(f"{context} : run {run.id} ended with status {run.status} ({run.last_error})")
+
+    # The reply can lag the run status by a moment; wait for it with the same backoff as the run
+    delay = RUN_POLL_INITIAL_SECONDS
+    for _ in range(10):
+        messages = (await client.beta.threads.messages.list(thread_id=thread.id, run_id=run.id)).data
+        if messages:
+            return messages[0].content[0].text
+        await asyncio.sleep(delay)
+        delay = min(delay * 1.6, RUN_POLL_MAX_SECONDS)
+    raise TimeoutError(f"{context} : No messages were returned after polling.")
@@ -0,0 +1,235 @@
+import os
+import re
+import threading
+import numpy as np
+from .retrieval import top_k
+from .passages import read_article_words, split_passages, passage_text
+from .citation_index import list_article_ids
+
+#Built offline by utils/build_bm25_index.py
+BM25_INDEX_FILE = "docs/bm25_index.npz"
+BM25_FORMAT_VERSION = 1
+
+_token_pattern = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""a an and are as at be but by for from has have in is it its of on or that the this to was were will with
+you your can may also more than not which their they these those there been into about such other some""".split())
+
+def tokenize(text):
+    return [token for token in _token_pattern.findall(text.lower()) if token not in STOPWORDS]
+
+#Label noise in ingredient queries: additive codes ("INS 500(ii)", "E150d"), roman numerals, bare numbers and
+#regulatory wording match article text only by accident
+_additive_code_pattern = re.compile(r"\b(?:ins|e)\s*-?\s*\d+[a-z]?(?:\s*\(\s*[ivx]+\s*\))?")
+_bare_code_pattern = re.compile(r"\d+[a-z]?")
+LABEL_NOISE = frozenset("ins i ii iii iv v vi vii viii ix x permitted class contains".split())
+#Functional classes and label categories. Next to an additive code they describe any additive ("Emulsifier (INS 471)"),
+#and on their own ("Raising Agents", "Spices & Condiments") they name no ingredient, so neither is searched
+_additive_class_pattern = re.compile(
+    r"\b(?:emulsifiers?|stabili[sz]ers?|thickeners?|preservatives?|colou?rs?|antioxidants?|acidity regulators?|"
+    r"(?:raising|leavening|anti-?caking|firming|glazing|gelling|bulking|foaming|flour treatment) agents?|"
+    r"flavou?r enhancers?|sweeteners?|humectants?|sequestrants?|improvers?|spices?|condiments?|herbs?)\b"
+)
+
+def query_terms(query):
+    #Distinct BM25 terms of an ingredient name without its label noise; empty when nothing specific is left
+    text = query.lower()
+    coded = _additive_code_pattern.search(text) is not None
+    text = _additive_code_pattern.sub(" ", text)
+    terms = {token for token in tokenize(text) if token not in LABEL_NOISE and not _bare_code_pattern.fullmatch(token)}
+    specific = {token for token in tokenize(_additive_class_pattern.sub(" ", text)) if token in terms}
+    return sorted(specific if coded or not specific else terms)
+
+def score_cutoff(scores, relative_score, min_score):
+    #Score an article must beat for one query: a fraction of the query's best score, and at least min_score.
+    #BM25 scales with the IDF of the query terms, so one fixed cutoff cannot serve "sugar" and "xanthan gum" alike.
+    #It only ranks hits that already cover the query (see Bm25Index.scores); it cannot tell a match from noise
+    return max(min_score, relative_score * max(scores, default=0.0))
+
+def encode_varints(values):
+    #LEB128-style unsigned varints, 7 bits per byte, high bit set on every byte but the last
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+def decode_varints(buf):
+    #Vectorized inverse of encode_varints over a uint8 array
+    if len(buf) == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(buf < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = 7 * (np.arange(len(buf)) - starts[group])
+    return np.bincount(group, weights=(buf & 0x7F).astype(np.float64) * np.exp2(shifts), minlength=len(ends)).astype(np.int64)
+
+class Bm25Index:
+    """
+    BM25 index over passages of the article bodies. Each term's postings are stored as varint
+    pairs (passage id delta, term frequency) in one byte blob, addressed by per-term offsets.
+    """
+
+    def __init__(self, terms, term_offsets, postings, doc_freq, passage_lengths, passage_sources, passage_articles, passage_spans, sources, k1=1.2, b=0.75):
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.term_offsets = term_offsets
+        self.postings = postings
+        self.doc_freq = doc_freq
+        self.passage_lengths = passage_lengths
+        self.passage_sources = passage_sources
+        self.passage_articles = passage_articles
+        self.passage_spans = passage_spans
+        self.sources = sources
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(passage_lengths.mean()) if len(passage_lengths) else 0.0
+
+    def __len__(self):
+        return len(self.passage_lengths)
+
+    @classmethod
+    def build(cls, specs, window=120):
+        postings_by_term = {}
+        passage_lengths, passage_sources, passage_articles, passage_spans = [], [], [], []
+        sources = [spec["source"] for spec in specs]
+        for source_id, spec in enumerate(specs):
+            for article_id in list_article_ids(spec["folder_name"]):
+                words = read_article_words(f"{spec['folder_name']}/article{article_id}.txt")
+                for start, end in split_passages(words, window):
+                    passage_id = len(passage_lengths)
+                    tokens = tokenize(" ".join(words[start:end]))
+                    counts = {}
+                    for token in tokens:
+                        counts[token] = counts.get(token, 0) + 1
+                    for token, tf in counts.items():
+                        postings_by_term.setdefault(token, []).append((passage_id, tf))
+                    passage_lengths.append(len(tokens))
+                    passage_sources.append(source_id)
+                    passage_articles.append(article_id)
+                    passage_spans.append((start, end))
+            print(f"Tokenized {spec['folder_name']} : {len(passage_lengths)} passages so far")
+
+        terms = sorted(postings_by_term)
+        blob = bytearray()
+        term_offsets = [0]
+        doc_freq = []
+        for term in terms:
+            values = []
+            previous = 0
+            for passage_id, tf in postings_by_term[term]:
+                values.extend((passage_id - previous, tf))
+                previous = passage_id
+            blob.extend(encode_varints(values))
+            term_offsets.append(len(blob))
+            doc_freq.append(len(postings_by_term[term]))
+
+        return cls(
+            terms,
+            np.array(term_offsets, dtype=np.int64),
+            np.frombuffer(bytes(blob), dtype=np.uint8),
+            np.array(doc_freq, dtype=np.int32),
+            np.array(passage_lengths, dtype=np.int32),
+            np.array(passage_sources, dtype=np.int8),
+            np.array(passage_articles, dtype=np.int32),
+            np.array(passage_spans, dtype=np.int32).reshape(-1, 2),
+            sources,
+        )
+
+    def save(self, path=BM25_INDEX_FILE):
+        terms = sorted(self.term_ids, key=self.term_ids.get)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            version=BM25_FORMAT_VERSION,
+            terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+            term_offsets=self.term_offsets,
+            postings=self.postings,
+            doc_freq=self.doc_freq,
+            passage_lengths=self.passage_lengths,
+            passage_sources=self.passage_sources,
+            passage_articles=self.passage_articles,
+            passage_spans=self.passage_spans,
+            sources=np.array(self.sources),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=BM25_INDEX_FILE):
+        data = np.load(path)
+        if int(data["version"]) != BM25_FORMAT_VERSION:
+            raise ValueError(f"{path} has unsupported BM25 format version {int(data['version'])}")
+        terms = bytes(data["terms"]).decode("utf-8").split("\n")
+        return cls(
+            terms, data["term_offsets"], data["postings"], data["doc_freq"], data["passage_lengths"],
+            data["passage_sources"], data["passage_articles"], data["passage_spans"], [str(source) for source in data["sources"]],
+        )
+
+    def term_postings(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return None, None
+        values = decode_varints(self.postings[self.term_offsets[term_id]:self.term_offsets[term_id + 1]])
+        return np.cumsum(values[0::2]), values[1::2]
+
+    def scores(self, query, min_coverage=0.0):
+        """
+        BM25 score of every passage for the query_terms of query. Passages matching less than min_coverage
+        of the query's IDF mass score 0, so a passage that only shares the commonest word of a multi-word
+        name is not a match. Terms absent from the corpus carry no mass: no passage could match them.
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        coverage = np.zeros(len(self), dtype=np.float32)
+        idf_mass = 0.0
+        n_passages = len(self)
+        for term in query_terms(query):
+            passages, tfs = self.term_postings(term)
+            if passages is None:
+                continue
+            df = self.doc_freq[self.term_ids[term]]
+            idf = np.log(1 + (n_passages - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.passage_lengths[passages] / self.avg_length)
+            scores[passages] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+            coverage[passages] += idf
+            idf_mass += idf
+        if min_coverage > 0 and idf_mass > 0:
+            scores[coverage < min_coverage * idf_mass] = 0
+        return scores
+
+    def search(self, query, k=10, min_coverage=0.0):
+        #[(passage id, bm25 score)] of the k best passages with a non-zero score
+        scores = self.scores(query, min_coverage)
+        return [(int(passage_id), float(scores[passage_id])) for passage_id in top_k(scores, k) if scores[passage_id] > 0]
+
+    def search_articles(self, query, N=2, candidates=50, min_coverage=0.0):
+        #[(source, article id, best passage score, passage id)] for the N best articles, one entry per article
+        results = []
+        seen = set()
+        for passage_id, score in self.search(query, max(candidates, N), min_coverage):
+            source, article_id = self.sources[self.passage_sources[passage_id]], int(self.passage_articles[passage_id])
+            if (source, article_id) in seen:
+                continue
+            seen.add((source, article_id))
+            results.append((source, article_id, score, passage_id))
+            if len(results) == N:
+                break
+        return results
+
+    def passage(self, passage_id, folder_by_source):
+        #Text of a passage, re-read from its article
+        source = self.sources[self.passage_sources[passage_id]]
+        start, end = self.passage_spans[passage_id]
+        return passage_text(f"{folder_by_source[source]}/article{int(self.passage_articles[passage_id])}.txt", int(start), int(end))
+
+_bm25_index = None
+_bm25_lock = threading.Lock()
+
+def get_bm25_index():
+    #Loaded once per process; None when the index has not been built
+    global _bm25_index
+    if _bm25_index is None and os.path.exists(BM25_INDEX_FILE):
+        with _bm25_lock:
+            if _bm25_index is None:
+                print(f"Reading {BM25_INDEX_FILE}")
+                _bm25_index = Bm25Index.load(BM25_INDEX_FILE)
+    return _bm25_index
@@ -0,0 +1,84 @@
+import gzip
+import json
+import os
+import re
+
+#Built offline by utils/build_citation_index.py from the "References:" section of every article
+CITATION_INDEX_FILE = "docs/citations.json.gz"
+
+#Some scraped lines glue two URLs together (https://www.healthline.comhttps://pubmed...), so hosts stop at the next scheme
+_host_pattern = re.compile(r"https?://((?:(?!https?://)[^\s/?#])+)")
+
+def parse_references(article_path):
+    #Lines after the first "References:" marker, exactly as find_relevant_file_paths used to collect them
+    references = []
+    start = 0
+    with open(article_path, 'r') as f:
+        for line in f:
+            if line.strip() == "References:" and start == 0:
+                start = 1
+                continue
+            if start == 1 and line.strip() != "":
+                references.append(line.strip())
+    return references
+
+def reference_domain(line):
+    #Domain of the last URL on the line, i.e. the actual cited source
+    hosts = _host_pattern.findall(line)
+    if not hosts:
+        return ""
+    return hosts[-1].lower()
+
+def list_article_ids(folder_name):
+    article_ids = []
+    for file_name in os.listdir(folder_name):
+        if file_name.startswith("article") and file_name.endswith(".txt") and file_name[7:-4].isdigit():
+            article_ids.append(int(file_name[7:-4]))
+    return sorted(article_ids)
+
+def build_citation_index(specs):
+    corpora = {}
+    for spec in specs:
+        folder_name = spec["folder_name"]
+        articles = {}
+        for article_id in list_article_ids(folder_name):
+            references = parse_references(f"{folder_name}/article{article_id}.txt")
+            articles[str(article_id)] = [[reference_domain(line), line] for line in references]
+        corpora[spec["source"]] = {"folder_name": folder_name, "articles": articles}
+        print(f"Indexed references of {len(articles)} articles from {folder_name}")
+    return {"version": 1, "corpora": corpora}
+
+def write_citation_index(index, path=CITATION_INDEX_FILE):
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+class CitationTable:
+    """
+    Reference lines of every article of one corpus, keyed by article number. Each entry keeps
+    the domain of the cited URL (e.g. www.ncbi.nlm.nih.gov) alongside the line itself.
+    """
+
+    def __init__(self, source, folder_name, articles):
+        self.source = source
+        self.folder_name = folder_name
+        self.articles = {int(article_id): tuple((domain, line) for domain, line in entries) for article_id, entries in articles.items()}
+
+    def __contains__(self, article_id):
+        return article_id in self.articles
+
+    def refs(self, article_id, journal_str=None, domain=None):
+        #Same filter as the old file scan: no journal_str means no citations
+        if journal_str is None and domain is None:
+            return []
+        return [line for line_domain, line in self.articles.get(article_id, ())
+                if (journal_str is None or journal_str in line) and (domain is None or domain in line_domain)]
+
+def load_citation_index(path=CITATION_INDEX_FILE):
+    #Returns {source: CitationTable}, or {} when the index has not been built yet
+    if not os.path.exists(path):
+        return {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        index = json.load(f)
+    return {source: CitationTable(source, corpus["folder_name"], corpus["articles"]) for source, corpus in index["corpora"].items()}
@@ -1,48 +1,24 @@
 import sys
 import os
 import json
+import time
+import asyncio
 from typing import List, Dict, Any
-import torch
-from openai import OpenAI
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from openai import OpenAI, AsyncOpenAI
+from .static_assistants import get_static_assistant, run_with_static_assistant
+from .async_runs import run_thread
+from .scheduler import llm_scheduler
 
-def create_assistant(client):
-    assistant3 = client.beta.assistants.create(
-      name="Misleading Claims",
-      instructions="You are an expert dietician. Use your knowledge base to answer questions about the misleading claims about food product.",
-      model="gpt-4o",
-      tools=[{"type": "file_search"}],
-      temperature=0,
-      top_p = 0.85
-      )
-
-    # Create a vector store
-    vector_store3 = client.beta.vector_stores.create(name="Misleading Claims Vec")
-    
-    # Ready the files for upload to OpenAI
-    file_paths = ["docs/MisLeading_Claims.docx"]
-    file_streams = [open(path, "rb") for path in file_paths]
-    
-    # Use the upload and poll SDK helper to upload the files, add them to the vector store,
-    # and poll the status of the file batch for completion.
-    file_batch3 = client.beta.vector_stores.file_batches.upload_and_poll(
-      vector_store_id=vector_store3.id, files=file_streams
-    )
-
-    #Misleading Claims
-    assistant3 = client.beta.assistants.update(
-      assistant_id=assistant3.id,
-      tool_resources={"file_search": {"vector_store_ids": [vector_store3.id]}},
-    )
+app = FastAPI()
 
-    return assistant3
+def create_assistant(client):
+    #The MisLeading_Claims.docx assistant is created once per deployment and reused across requests and restarts
+    return get_static_assistant(client, "claims")
   
-def analyze_claims(claims, ingredients, assistant_id, client):
-    
-    thread = client.beta.threads.create(
-        messages=[
-            {
-                "role": "user",
-                "content": "A food product named has the following claims: " + ', '.join(claims) + " and ingredients: " + ', '.join(ingredients) + """. Please evaluate the validity of each claim as well as assess if the product name is misleading.
+def claims_prompt(claims, ingredients):
+    return "A food product named has the following claims: " + ', '.join(claims) + " and ingredients: " + ', '.join(ingredients) + """. Please evaluate the validity of each claim as well as assess if the product name is misleading.
 The output must be in JSON format as follows: 
 
 {
@@ -53,6 +29,14 @@ The output must be in JSON format as follows:
   }
 }
 """
+
+def analyze_claims(claims, ingredients, assistant_id, client):
+    
+    thread = client.beta.threads.create(
+        messages=[
+            {
+                "role": "user",
+                "content": claims_prompt(claims, ingredients)
             }
                 ]
     )
@@ -103,9 +87,12 @@ The output must be in JSON format as follows:
     #              claims_not_found_in_doc.append(key)
     #    print(f"Claims not found in the doc are {','.join(claims_not_found_in_doc)}")
     #claims_analysis = json.loads(message_content.value.replace("```", "").replace("json", "").replace("(NOT FOUND IN DOCUMENT) ", ""))
+    return parse_claims_analysis(message_content.value)
+
+def parse_claims_analysis(message_value):
     claims_analysis = {}
-    if message_content.value != "":
-        claims_analysis = json.loads(message_content.value.replace("```", "").replace("json", ""))
+    if message_value != "":
+        claims_analysis = json.loads(message_value.replace("```", "").replace("json", ""))
 
     claims_analysis_str = ""
     for key, value in claims_analysis.items():
@@ -113,6 +100,21 @@ The output must be in JSON format as follows:
     
     return claims_analysis_str
 
+async def analyze_claims_async(claims, ingredients, assistant_id, client):
+    #AsyncOpenAI version of analyze_claims: the run is polled without blocking the event loop
+    message_content = await run_thread(
+        client,
+        assistant_id,
+        claims_prompt(claims, ingredients),
+        "Processing Claims",
+        include=["step_details.tool_calls[*].file_search.results[*].content"]
+    )
+    for annotation in message_content.annotations:
+        if getattr(annotation, "file_citation", None):
+            message_content.value = message_content.value.replace(annotation.text, "")
+
+    return parse_claims_analysis(message_content.value)
+
 def get_claims_analysis(product_info_from_db):
     
     if product_info_from_db:
@@ -134,3 +136,32 @@ def get_claims_analysis(product_info_from_db):
             print(f"Returning claims_analysis : {claims_analysis}")
             
         return {'claims_analysis' : claims_analysis}
+
+async def get_claims_analysis_async(product_info_from_db):
+    #Async version of get_claims_analysis
+    if product_info_from_db:
+        claims_list = product_info_from_db.get("claims", [])
+        ingredients_list = [ingredient["name"] for ingredient in product_info_from_db.get("ingredients", [])]
+
+        claims_analysis = ""
+        
+        if len(claims_list) > 0:
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) as async_client:
+                #The persisted assistant is looked up with the sync client, off the event loop, and recreated if it was deleted
+                claims_analysis = await llm_scheduler.run(lambda: run_with_static_assistant(
+                    client, "claims", lambda assistant_id: analyze_claims_async(claims_list, ingredients_list, assistant_id, async_client)
+                ))
+            print(f"Returning claims_analysis : {claims_analysis}")
+            
+        return {'claims_analysis' : claims_analysis}
+
+class ClaimsAnalysisRequest(BaseModel):
+    product_info_from_db: dict
+
+@app.post("/api/claims-analysis")
+async def claims_analysis_endpoint(request: ClaimsAnalysisRequest):
+    try:
+        return await get_claims_analysis_async(request.product_info_from_db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
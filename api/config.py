@@ -4,3 +4,122 @@ MONGODB_URL = os.getenv("MONGODB_URL")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 LABEL_READER_PROMPT = os.getenv("LABEL_READER_PROMPT")
+
+#Cross-request micro-batching of MiniLM encodes (see api/embedding_batcher.py)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+
+#Ingredient embedding cache (see api/embedding_cache.py)
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", "cache/ingredient_embeddings.sqlite")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+#Title search backend: "exact" scans every title, "ivf" uses the prebuilt approximate index when present (see api/ann_index.py)
+RETRIEVAL_INDEX = os.getenv("RETRIEVAL_INDEX", "exact")
+#Number of IVF lists probed per query; higher is slower with better recall
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+
+#Coarse search on a quantized copy of the title embeddings with float32 rescoring: "none", "float16" or "int8" (see api/quantization.py).
+#Rescoring reads the memory-mapped float32 store (docs/embeddings.emb); without it the pickle is not loaded, and the
+#quantized scores are used unrescored (a warning is logged), so no private float32 copy sits in RAM next to the quantized one
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "none")
+QUANTIZED_RESCORE_K = int(os.getenv("QUANTIZED_RESCORE_K", "32"))
+
+#Unix socket of the shared embedding sidecar (python -m api.embedding_server); unset means in-process encoding.
+#When set, workers skip the model warmup, send title searches to the sidecar, and only load corpora from
+#normalized memory-mapped .emb stores, so the title matrices are shared through the page cache
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET")
+
+#Article retrieval for ingredients: "dense" title embeddings, "lexical" BM25 over article passages (see api/bm25.py)
+#or "hybrid" rank fusion of both (see api/hybrid_retrieval.py)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+#An article's best BM25 passage must contain at least BM25_MIN_COVERAGE of the IDF mass of the ingredient's terms
+#(additive codes, roman numerals and class names like "Emulsifier" next to a code are not searched, and names made
+#only of class or category words search nothing and fall back to Ingredients.docx; see api/bm25.py), then score above BM25_RELATIVE_SCORE times the query's top score and above BM25_MIN_SCORE.
+#Scores follow the IDF of the query terms: on the article corpora common label ingredients top out low
+#("Sugar" 3.8, "Water" 4.9) while multi-word names reach 10 to 25 ("Xanthan Gum" 22.6), so the score cutoff is
+#relative; coverage is what rejects articles matching only the commonest word of a multi-word name
+BM25_MIN_COVERAGE = float(os.getenv("BM25_MIN_COVERAGE", "0.6"))
+BM25_MIN_SCORE = float(os.getenv("BM25_MIN_SCORE", "1.0"))
+BM25_RELATIVE_SCORE = float(os.getenv("BM25_RELATIVE_SCORE", "0.5"))
+#Hybrid retrieval: candidates taken from each retriever per corpus, minimum title cosine similarity of a dense candidate,
+#reciprocal rank fusion constant and the time the dense search waits for the lexical search
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "10"))
+HYBRID_DENSE_THRES = float(os.getenv("HYBRID_DENSE_THRES", "0.5"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_BUDGET_MS = float(os.getenv("HYBRID_BUDGET_MS", "250"))
+
+#Dense passage search alongside the title search (see api/passage_index.py); articles whose best passage scores above PASSAGE_THRES are also used
+PASSAGE_SEARCH = os.getenv("PASSAGE_SEARCH", "false").lower() == "true"
+PASSAGE_THRES = float(os.getenv("PASSAGE_THRES", "0.6"))
+
+#Ingredient analysis backend: "assistants" uploads the retrieved articles to a vector store per ingredient,
+#"local" sends the best passages of the retrieved articles inline with one chat completion (see api/local_rag.py)
+INGREDIENT_ANALYSIS_MODE = os.getenv("INGREDIENT_ANALYSIS_MODE", "assistants")
+LOCAL_RAG_PASSAGES = int(os.getenv("LOCAL_RAG_PASSAGES", "6"))
+LOCAL_RAG_MODEL = os.getenv("LOCAL_RAG_MODEL", "gpt-4o")
+
+#Registry of uploaded OpenAI file IDs keyed by content hash (see api/file_registry.py): "sqlite" on this host or "mongo" shared.
+#The static assistant registry (see api/static_assistants.py) is kept in the same backend
+FILE_REGISTRY_BACKEND = os.getenv("FILE_REGISTRY_BACKEND", "sqlite")
+FILE_REGISTRY_FILE = os.getenv("FILE_REGISTRY_FILE", "cache/file_registry.sqlite")
+#Registered files are re-uploaded after FILE_REGISTRY_TTL_DAYS and checked against the API at most every FILE_REGISTRY_VERIFY_SECONDS
+FILE_REGISTRY_TTL_DAYS = float(os.getenv("FILE_REGISTRY_TTL_DAYS", "30"))
+FILE_REGISTRY_VERIFY_SECONDS = float(os.getenv("FILE_REGISTRY_VERIFY_SECONDS", "3600"))
+
+#Pool of per-file-set ingredient assistants (see api/assistant_pool.py). The model and prompt version are part of the pool key,
+#so bump INGREDIENT_PROMPT_VERSION when the assistant instructions change
+ASSISTANT_POOL_SIZE = int(os.getenv("ASSISTANT_POOL_SIZE", "64"))
+ASSISTANT_POOL_TTL_SECONDS = float(os.getenv("ASSISTANT_POOL_TTL_SECONDS", "21600"))
+INGREDIENT_ASSISTANT_MODEL = os.getenv("INGREDIENT_ASSISTANT_MODEL", "gpt-4o")
+INGREDIENT_PROMPT_VERSION = os.getenv("INGREDIENT_PROMPT_VERSION", "1")
+
+#Knowledge document ingredients fall back to when retrieval finds no article for them
+DOCX_FALLBACK_FILE = "docs/Ingredients.docx"
+
+#Persisted IDs of the Ingredients, Misleading Claims and Processing Level assistants (see api/static_assistants.py)
+STATIC_ASSISTANTS_FILE = os.getenv("STATIC_ASSISTANTS_FILE", "cache/static_assistants.sqlite")
+STATIC_ASSISTANT_MODEL = os.getenv("STATIC_ASSISTANT_MODEL", "gpt-4o")
+
+#Ledger of created assistants, vector stores and files, and the background sweeper that deletes expired ones (see api/resource_ledger.py)
+RESOURCE_LEDGER_FILE = os.getenv("RESOURCE_LEDGER_FILE", "cache/resource_ledger.sqlite")
+RESOURCE_SWEEPER = os.getenv("RESOURCE_SWEEPER", "true").lower() == "true"
+RESOURCE_SWEEP_INTERVAL_SECONDS = float(os.getenv("RESOURCE_SWEEP_INTERVAL_SECONDS", "600"))
+RESOURCE_SWEEP_BATCH_SIZE = int(os.getenv("RESOURCE_SWEEP_BATCH_SIZE", "50"))
+#Maximum deletes per second, well under the API rate limits
+RESOURCE_SWEEP_RATE = float(os.getenv("RESOURCE_SWEEP_RATE", "2"))
+
+#Polling of assistant runs on AsyncOpenAI (see api/async_runs.py): first delay, backoff cap and give-up time
+RUN_POLL_INITIAL_SECONDS = float(os.getenv("RUN_POLL_INITIAL_SECONDS", "0.5"))
+RUN_POLL_MAX_SECONDS = float(os.getenv("RUN_POLL_MAX_SECONDS", "5"))
+RUN_TIMEOUT_SECONDS = float(os.getenv("RUN_TIMEOUT_SECONDS", "300"))
+
+#Admission control for LLM calls shared by all requests of a process (see api/scheduler.py): concurrent calls,
+#calls and estimated tokens per minute (0 disables a budget), retries after a 429, and the per-request cap on concurrent ingredients
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_REQUEST_CONCURRENCY = int(os.getenv("LLM_REQUEST_CONCURRENCY", "8"))
+#Estimated tokens of one ingredient analysis (prompt, retrieved chunks and answer), charged against LLM_TOKENS_PER_MINUTE
+INGREDIENT_ANALYSIS_TOKENS = int(os.getenv("INGREDIENT_ANALYSIS_TOKENS", "4000"))
+
+#Adaptive batching of ingredients into shared analysis runs on the async path (see api/ingredient_batching.py).
+#A group's estimate is base tokens plus per-ingredient tokens and must fit INGREDIENT_BATCH_TOKEN_BUDGET;
+#INGREDIENT_BATCH_MAX_FILES bounds the union of articles a group's vector store is built from
+INGREDIENT_BATCHING = os.getenv("INGREDIENT_BATCHING", "false").lower() == "true"
+INGREDIENT_BATCH_TOKEN_BUDGET = int(os.getenv("INGREDIENT_BATCH_TOKEN_BUDGET", "8000"))
+INGREDIENT_BATCH_BASE_TOKENS = int(os.getenv("INGREDIENT_BATCH_BASE_TOKENS", "3000"))
+INGREDIENT_BATCH_PER_INGREDIENT_TOKENS = int(os.getenv("INGREDIENT_BATCH_PER_INGREDIENT_TOKENS", "500"))
+INGREDIENT_BATCH_MAX_FILES = int(os.getenv("INGREDIENT_BATCH_MAX_FILES", "8"))
+
+#Finished ingredient analyses reused across products (see api/analysis_store.py), keyed by normalized ingredient name,
+#retrieved articles and analysis version; entries older than ANALYSIS_STORE_TTL_DAYS are analyzed again
+ANALYSIS_STORE = os.getenv("ANALYSIS_STORE", "true").lower() == "true"
+ANALYSIS_STORE_FILE = os.getenv("ANALYSIS_STORE_FILE", "cache/ingredient_analyses.sqlite")
+ANALYSIS_STORE_TTL_DAYS = float(os.getenv("ANALYSIS_STORE_TTL_DAYS", "30"))
+ANALYSIS_STORE_SIZE = int(os.getenv("ANALYSIS_STORE_SIZE", "4096"))
+
+#Near-duplicate reuse of stored analyses (see api/semantic_cache.py): an ingredient missing from the analysis store
+#reuses the analysis of a stored ingredient whose name embedding has at least this cosine similarity
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
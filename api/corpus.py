@@ -0,0 +1,170 @@
+import os
+import pickle
+import threading
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from .retrieval import TitleMatrix
+from .embedding_store import open_embedding_store, quantized_store_path
+from .quantization import QuantizedTitleMatrix
+from .citation_index import CitationTable, load_citation_index
+from .ann_index import IVFIndex
+from .config import RETRIEVAL_INDEX, ANN_NPROBE, EMBEDDING_QUANTIZATION, QUANTIZED_RESCORE_K, EMBEDDING_SERVER_SOCKET
+
+#store_file is the memory-mapped embedding store (see utils/convert_embeddings.py); embeddings_file is the legacy pickle
+CORPUS_SPECS = [
+    {
+        "source": "ncbi",
+        "store_file": "docs/embeddings.emb",
+        "ann_index_file": "docs/embeddings.ivf.npz",
+        "embeddings_file": "docs/embeddings.pkl",
+        "titles_file": "docs/titles.txt",
+        "folder_name": "docs/articles",
+        "journal_str": ".ncbi.",
+    },
+    {
+        "source": "harvard",
+        "store_file": "docs/embeddings_harvard.emb",
+        "ann_index_file": "docs/embeddings_harvard.ivf.npz",
+        "embeddings_file": "docs/embeddings_harvard.pkl",
+        "titles_file": "docs/titles_harvard.txt",
+        "folder_name": "docs/articles_harvard",
+        "journal_str": None,
+    },
+]
+
+@dataclass(frozen=True)
+class Corpus:
+    source: str
+    titles: Tuple[str, ...]
+    folder_name: str
+    journal_str: Optional[str]
+    #None when only a quantized store is used (see load_corpus)
+    title_matrix: Optional[TitleMatrix]
+    citations: Optional[CitationTable] = None
+    ann_index: Optional[IVFIndex] = None
+    quantized_matrix: Optional[QuantizedTitleMatrix] = None
+    #"matrix_hash" of the float32 store's header; None for pickled embeddings, whose hash is computed when needed
+    content_hash: Optional[str] = None
+
+    @property
+    def title_search(self):
+        #Searcher used for retrieval: the approximate index, then the quantized scan, else the exact float32 scan
+        if self.ann_index is not None:
+            return self.ann_index
+        if self.quantized_matrix is not None:
+            return self.quantized_matrix
+        return self.title_matrix
+
+_corpora = None
+_corpora_lock = threading.Lock()
+
+def load_ann_index(ann_index_file, title_matrix, content_hash=None):
+    if RETRIEVAL_INDEX != "ivf" or not os.path.exists(ann_index_file):
+        return None
+    if title_matrix is None:
+        print(f"Ignoring {ann_index_file} : the IVF index scores the float32 store, which is not loaded")
+        return None
+    try:
+        return IVFIndex.load(ann_index_file, title_matrix, n_probe=ANN_NPROBE, content_hash=content_hash)
+    except ValueError as e:
+        #A stale index (built from other embeddings) falls back to the exact search
+        print(f"Ignoring {ann_index_file} : {e}")
+        return None
+
+def open_quantized_store(store_file):
+    if EMBEDDING_QUANTIZATION == "none":
+        return None
+    quantized_file = quantized_store_path(store_file, EMBEDDING_QUANTIZATION)
+    if not os.path.exists(quantized_file):
+        print(f"{quantized_file} not found, using the float32 title search")
+        return None
+    return open_embedding_store(quantized_file)
+
+def load_quantized_matrix(quantized_store, title_matrix, content_hash=None):
+    if quantized_store is None:
+        return None
+    quantized_hash = quantized_store.header.get("matrix_hash")
+    if title_matrix is not None and content_hash is not None and quantized_hash != content_hash:
+        #Quantized from other embeddings: the shortlist would be rescored against the wrong rows
+        print(f"Ignoring {quantized_store.path} : it was not written from the embeddings in the float32 store")
+        return None
+    try:
+        return QuantizedTitleMatrix(quantized_store.matrix, title_matrix, scales=quantized_store.scales, rescore_k=QUANTIZED_RESCORE_K)
+    except ValueError as e:
+        print(f"Ignoring {quantized_store.path} : {e}")
+        return None
+
+def require_shared_matrix(reason):
+    #With the embedding sidecar every API worker loads the corpora too; only memory-mapped stores are shared
+    #between them through the page cache, an unpickled or normalized copy would be private to each worker
+    if EMBEDDING_SERVER_SOCKET:
+        raise ValueError(f"{reason}; EMBEDDING_SERVER_SOCKET requires normalized .emb stores (python -m utils.convert_embeddings)")
+
+def load_corpus(source, store_file, ann_index_file, embeddings_file, titles_file, folder_name, journal_str, citations=None):
+    quantized_store = open_quantized_store(store_file)
+    if quantized_store is not None and not os.path.exists(store_file):
+        #Rescoring from the pickle would hold a private float32 copy of the matrix in RAM next to the quantized one,
+        #so without the memory-mapped store the quantized scores are used as they are
+        print(f"WARNING : {store_file} not found, searching {quantized_store.path} without float32 rescoring")
+        title_matrix = None
+        titles = quantized_store.titles
+        content_hash = None
+    elif os.path.exists(store_file):
+        print(f"Mapping {store_file}")
+        store = open_embedding_store(store_file)
+        if store.scales is not None:
+            raise ValueError(f"{store_file} is int8; quantized stores are loaded through EMBEDDING_QUANTIZATION")
+        if store.header.get("normalized"):
+            title_matrix = TitleMatrix.from_normalized(store.matrix)
+            content_hash = store.header.get("matrix_hash")
+        else:
+            require_shared_matrix(f"{store_file} is not normalized, so its matrix would be copied")
+            title_matrix = TitleMatrix(store.matrix)
+            content_hash = None
+        titles = store.titles
+    else:
+        require_shared_matrix(f"{store_file} not found")
+        print(f"Reading {embeddings_file}")
+        with open(embeddings_file, 'rb') as f:
+            loaded_data = pickle.load(f)
+        title_matrix = TitleMatrix(loaded_data['embeddings'])
+        content_hash = None
+
+        with open(titles_file, 'r') as file:
+            titles = tuple(line.strip() for line in file.readlines())
+
+    #Handles are shared by every request, so the matrix must not be modified in place
+    if title_matrix is not None:
+        title_matrix.matrix.flags.writeable = False
+
+    #A citation table built for another folder is stale; references are then read from the article files
+    if citations is not None and citations.folder_name != folder_name:
+        citations = None
+
+    return Corpus(
+        source, titles, folder_name, journal_str, title_matrix, citations,
+        load_ann_index(ann_index_file, title_matrix, content_hash),
+        load_quantized_matrix(quantized_store, title_matrix, content_hash),
+        content_hash,
+    )
+
+def load_corpora():
+    citation_index = load_citation_index()
+    return tuple(load_corpus(**spec, citations=citation_index.get(spec["source"])) for spec in CORPUS_SPECS)
+
+def get_corpora():
+    #Loads every corpus once per process; later calls return the same immutable handles
+    global _corpora
+    if _corpora is None:
+        with _corpora_lock:
+            if _corpora is None:
+                _corpora = load_corpora()
+    return _corpora
+
+def reload_corpora():
+    #Call after the files in docs/ change; requests already holding the old handles keep using them
+    global _corpora
+    corpora = load_corpora()
+    with _corpora_lock:
+        _corpora = corpora
+    return corpora
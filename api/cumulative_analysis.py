@@ -1,7 +1,11 @@
 from openai import OpenAI
 import json, os, asyncio
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
 from .calc_consumption_context import get_consumption_context
+
+app = FastAPI()
     
 def generate_final_analysis(request):
     if not request.get('brand_name') or not request.get('product_name'):
@@ -116,3 +120,28 @@ Claims Analysis for the product is as follows ->
     #    return f"Brand: {brand_name}\n\nProduct: {product_name}\n\nAnalysis:\n\n{completion.choices[0].message.content}\n\nTop Citations:\n\n{refs_str}"
     #else:
     #    return f"Brand: {brand_name}\n\nProduct: {product_name}\n\nAnalysis:\n\n{completion.choices[0].message.content}"
+
+class CumulativeAnalysisRequest(BaseModel):
+    brand_name: str
+    product_name: str
+    nutritional_level: Optional[str] = ""
+    processing_level: Optional[str] = ""
+    all_ingredient_analysis: Optional[str] = ""
+    claims_analysis: Optional[str] = ""
+    refs: Optional[List[str]] = []
+
+@app.post("/api/cumulative-analysis")
+async def cumulative_analysis_endpoint(request: CumulativeAnalysisRequest):
+    payload = {
+        "brand_name": request.brand_name,
+        "product_name": request.product_name,
+        "nutritional_level": request.nutritional_level,
+        "processing_level": request.processing_level,
+        "all_ingredient_analysis": request.all_ingredient_analysis,
+        "claims_analysis": request.claims_analysis,
+        "refs": request.refs,
+    }
+    try:
+        return await asyncio.to_thread(generate_final_analysis, payload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -6,23 +6,41 @@ from openai import OpenAI
 import os
 import json
 import re
+import threading
+import asyncio
 from typing import List, Dict, Any
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
 
 # Move configuration and constants to separate files
 from .config import MONGODB_URL, OPENAI_API_KEY
 from .schemas import label_reader_schema
 
-# Initialize clients
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-print(f"MONGODB_URL is {MONGODB_URL}")
-mongodb_client = MongoClient(MONGODB_URL)
-db = mongodb_client.consumeWise
-collection = db.products
-print(f"collection is {collection}")
+app = FastAPI()
+
+# Clients are created on first use instead of at import time, so the app imports without credentials
+openai_client = None
+# The MongoDB client is created on first use (or by the startup warmup) instead of at import time
+mongodb_client = None
+_mongodb_lock = threading.Lock()
+
+def get_collection():
+    global mongodb_client
+    if mongodb_client is None:
+        with _mongodb_lock:
+            if mongodb_client is None:
+                print(f"MONGODB_URL is {MONGODB_URL}")
+                mongodb_client = MongoClient(MONGODB_URL)
+    return mongodb_client.consumeWise.products
+
+def ping_db():
+    get_collection().database.client.admin.command("ping")
 
 
 def extract_information(images_list: List[Any]) -> Dict[str, Any]:
     global openai_client
+    if openai_client is None:
+        openai_client = OpenAI(api_key=OPENAI_API_KEY)
     print(f"DEBUG - openai_client : {openai_client}")
 
     valid_image_files = images_list
@@ -86,7 +104,7 @@ def extract_data(images_list_json: Dict[str, List[Any]]):
     
     try:
         extracted_data = extract_information(images_list_json["images_list"])
-        result = collection.insert_one(extracted_data)
+        result = get_collection().insert_one(extracted_data)
         extracted_data["_id"] = str(result.inserted_id)
         return extracted_data
     except Exception as e:
@@ -105,7 +123,7 @@ def find_product(product_name: str):
         for term in search_terms:
             query = {"productName": {"$regex": f".*{re.escape(term)}.*", "$options": "i"}}
             # Use .to_list() to fetch all results
-            products = collection.find(query).to_list(length=None)
+            products = get_collection().find(query).to_list(length=None)
             #async for product in collection.find(query)
             for product in products:
                 brand_product_name = f"{product['productName']} by {product['brandName']}"
@@ -123,7 +141,7 @@ def get_product(product_name: str):
         raise Exception("Please provide a valid product name")
     
     try:
-        product = collection.find_one({"productName": product_name})
+        product = get_collection().find_one({"productName": product_name})
         if not product:
             raise Exception("Product not found")
         
@@ -132,3 +150,27 @@ def get_product(product_name: str):
         return product
     except Exception as e:
         raise Exception(f"An error occurred {e}") from e
+
+class ExtractDataRequest(BaseModel):
+    image_links: List[Any]
+
+@app.post("/api/extract-data")
+async def extract_data_endpoint(request: ExtractDataRequest):
+    try:
+        return await asyncio.to_thread(extract_data, {"images_list": request.image_links})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/find-product")
+async def find_product_endpoint(product_name: str):
+    try:
+        return await asyncio.to_thread(find_product, product_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/get-product")
+async def get_product_endpoint(product_name: str):
+    try:
+        return await asyncio.to_thread(get_product, product_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
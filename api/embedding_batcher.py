@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+class EmbeddingBatcher:
+    """
+    Collects encode requests from every in-flight analysis and runs them through the model in
+    micro-batches on a single worker thread. A batch is flushed once it holds max_batch_size texts
+    or max_wait_ms after its first request arrived, whichever comes first.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=64, max_wait_ms=10):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._texts = 0
+        self._requests = 0
+        self._max_batch = 0
+        self._encode_seconds = 0.0
+
+    def submit(self, texts):
+        #Returns a Future resolving to a (len(texts), dim) float32 array
+        future = Future()
+        if len(texts) == 0:
+            future.set_result(np.empty((0, 0), dtype=np.float32))
+            return future
+        self._ensure_worker()
+        self._queue.put((list(texts), future))
+        return future
+
+    def encode(self, texts, timeout=None):
+        return self.submit(texts).result(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": self._batches,
+                "texts": self._texts,
+                "avg_batch_size": self._texts / self._batches if self._batches else 0.0,
+                "max_batch_size": self._max_batch,
+                "avg_encode_ms": 1000 * self._encode_seconds / self._batches if self._batches else 0.0,
+            }
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        size = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            texts = [text for item_texts, _ in pending for text in item_texts]
+            started = time.monotonic()
+            try:
+                embeddings = np.asarray(self.encode_fn(texts), dtype=np.float32)
+            except Exception as exc:
+                for _, future in pending:
+                    future.set_exception(exc)
+                continue
+
+            with self._stats_lock:
+                self._requests += len(pending)
+                self._batches += 1
+                self._texts += len(texts)
+                self._max_batch = max(self._max_batch, len(texts))
+                self._encode_seconds += time.monotonic() - started
+
+            offset = 0
+            for item_texts, future in pending:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
@@ -0,0 +1,100 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+#Bracketed additive codes such as "(INS 211)", "[INS 503(ii)]" or "(E 330)" say nothing the embedding needs
+_ins_code_pattern = re.compile(r"[\(\[]\s*(?:ins|e)\s*-?\s*\d+[^\(\)\[\]]*(?:\([^\(\)]*\)[^\(\)\[\]]*)*[\)\]]")
+_whitespace_pattern = re.compile(r"\s+")
+
+def normalize_ingredient_name(name):
+    name = _ins_code_pattern.sub(" ", name.lower())
+    return _whitespace_pattern.sub(" ", name).strip(" ,.;:")
+
+class EmbeddingCache:
+    """
+    Two-tier cache of ingredient embeddings keyed by normalized ingredient name: an in-memory LRU
+    in front of a SQLite table that survives restarts and is shared by every worker on the host.
+    Entries are namespaced by model so that switching models never returns stale vectors.
+    """
+
+    def __init__(self, path, namespace, capacity=4096):
+        self.path = path
+        self.namespace = namespace
+        self.capacity = capacity
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _db(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (namespace TEXT, name TEXT, vector BLOB, PRIMARY KEY (namespace, name))")
+            self._connection.commit()
+        return self._connection
+
+    def _remember(self, name, vector):
+        self._memory[name] = vector
+        self._memory.move_to_end(name)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get_many(self, names, encode_fn):
+        #Returns a (len(names), dim) float32 array; only names missing from both tiers are passed to encode_fn
+        keys = [normalize_ingredient_name(name) for name in names]
+        if len(keys) == 0:
+            return np.empty((0, 0), dtype=np.float32)
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory and key not in vectors:
+                    self._memory.move_to_end(key)
+                    vectors[key] = self._memory[key]
+                    self.memory_hits += 1
+
+            pending = sorted(set(keys) - set(vectors))
+            if pending:
+                placeholders = ",".join("?" * len(pending))
+                rows = self._db().execute(
+                    f"SELECT name, vector FROM embeddings WHERE namespace = ? AND name IN ({placeholders})",
+                    [self.namespace, *pending],
+                ).fetchall()
+                for name, blob in rows:
+                    vectors[name] = np.frombuffer(blob, dtype=np.float32)
+                    self._remember(name, vectors[name])
+                    self.disk_hits += 1
+
+        missing = sorted(set(keys) - set(vectors))
+        if missing:
+            encoded = np.asarray(encode_fn(missing), dtype=np.float32)
+            with self._lock:
+                self.misses += len(missing)
+                for name, vector in zip(missing, encoded):
+                    vectors[name] = np.ascontiguousarray(vector)
+                    self._remember(name, vectors[name])
+                self._db().executemany(
+                    "INSERT OR REPLACE INTO embeddings (namespace, name, vector) VALUES (?, ?, ?)",
+                    [(self.namespace, name, vectors[name].tobytes()) for name in missing],
+                )
+                self._db().commit()
+
+        return np.stack([vectors[key] for key in keys])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
@@ -0,0 +1,192 @@
+#Local embedding sidecar: one process owns the MiniLM model and the retrieval indexes and serves
+#encode and top-k title queries to every API worker over a Unix socket.
+#Start it with: python -m api.embedding_server --socket /tmp/foodlabel-embeddings.sock
+#and point the workers at it with EMBEDDING_SERVER_SOCKET=/tmp/foodlabel-embeddings.sock.
+#
+#Wire format, all integers little-endian. Every message is framed as uint32 payload length + payload.
+#  request  : uint8 op | body
+#    OP_ENCODE body : uint32 count | count x (uint32 byte length | utf-8 text)
+#    OP_SEARCH body : uint16 corpus position | uint16 N | uint32 rows | uint32 dim | rows x dim float32
+#  response : uint8 status (STATUS_OK / STATUS_ERROR) | body
+#    OP_ENCODE ok    : uint32 rows | uint32 dim | rows x dim float32
+#    OP_SEARCH ok    : per query: uint16 hits | hits x (uint32 row | float32 cosine_sim)
+#    STATUS_ERROR    : utf-8 message
+import argparse
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import numpy as np
+
+OP_ENCODE = 1
+OP_SEARCH = 2
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding server connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def send_frame(sock, payload):
+    sock.sendall(struct.pack("<I", len(payload)) + payload)
+
+def recv_frame(sock):
+    (size,) = struct.unpack("<I", _recv_exact(sock, 4))
+    return _recv_exact(sock, size)
+
+def encode_texts_request(texts):
+    parts = [struct.pack("<BI", OP_ENCODE, len(texts))]
+    for text in texts:
+        data = text.encode("utf-8")
+        parts.append(struct.pack("<I", len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+def decode_texts_request(body):
+    (count,) = struct.unpack_from("<I", body, 0)
+    offset = 4
+    texts = []
+    for _ in range(count):
+        (size,) = struct.unpack_from("<I", body, offset)
+        offset += 4
+        texts.append(body[offset:offset + size].decode("utf-8"))
+        offset += size
+    return texts
+
+def encode_matrix(matrix):
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(len(matrix), -1)
+    return struct.pack("<II", *matrix.shape) + matrix.tobytes()
+
+def decode_matrix(body, offset=0):
+    rows, dim = struct.unpack_from("<II", body, offset)
+    data = np.frombuffer(body, dtype=np.float32, count=rows * dim, offset=offset + 8)
+    return data.reshape(rows, dim)
+
+def encode_hits(results):
+    parts = []
+    for hits in results:
+        parts.append(struct.pack("<H", len(hits)))
+        for row, cosine_sim in hits:
+            parts.append(struct.pack("<If", row, cosine_sim))
+    return b"".join(parts)
+
+def decode_hits(body, n_queries):
+    results = []
+    offset = 0
+    for _ in range(n_queries):
+        (count,) = struct.unpack_from("<H", body, offset)
+        offset += 2
+        hits = []
+        for _ in range(count):
+            row, cosine_sim = struct.unpack_from("<If", body, offset)
+            offset += 8
+            hits.append((row, cosine_sim))
+        results.append(hits)
+    return results
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    #One connection per client thread; requests on a connection are answered in order
+
+    def handle(self):
+        while True:
+            try:
+                payload = recv_frame(self.request)
+            except ConnectionError:
+                return
+            try:
+                reply = bytes([STATUS_OK]) + self.server.dispatch(payload[0], payload[1:])
+            except Exception as e:
+                reply = bytes([STATUS_ERROR]) + str(e).encode("utf-8")
+            send_frame(self.request, reply)
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, encode_fn, corpora):
+        self.encode_fn = encode_fn
+        self.corpora = corpora
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, EmbeddingRequestHandler)
+
+    def dispatch(self, op, body):
+        if op == OP_ENCODE:
+            return encode_matrix(self.encode_fn(decode_texts_request(body)))
+        if op == OP_SEARCH:
+            position, N = struct.unpack_from("<HH", body, 0)
+            queries = decode_matrix(body, 4)
+            return encode_hits(self.corpora[position].title_search.search_batch(queries, N))
+        raise ValueError(f"Unknown op {op}")
+
+class EmbeddingClient:
+    """
+    Client for the embedding sidecar. Keeps one connection per thread. After a connection
+    failure the sidecar is considered down for retry_interval seconds, so callers fall
+    back to in-process encoding without paying a connect timeout on every request.
+    """
+
+    def __init__(self, socket_path, timeout=10.0, retry_interval=30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _request(self, payload):
+        try:
+            sock = self._connection()
+            send_frame(sock, payload)
+            reply = recv_frame(sock)
+        except OSError:
+            sock = getattr(self._local, "sock", None)
+            if sock is not None:
+                sock.close()
+            self._local.sock = None
+            self._down_until = time.monotonic() + self.retry_interval
+            raise
+        if reply[0] != STATUS_OK:
+            raise RuntimeError(f"Embedding server error : {reply[1:].decode('utf-8')}")
+        return reply[1:]
+
+    def encode(self, texts):
+        return decode_matrix(self._request(encode_texts_request(list(texts))))
+
+    def search_batch(self, corpus_position, queries, N=2):
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(len(queries), -1)
+        payload = struct.pack("<BHH", OP_SEARCH, corpus_position, N) + encode_matrix(queries)
+        return decode_hits(self._request(payload), len(queries))
+
+if __name__ == "__main__":
+    from .ingredients_analysis import embedding_batcher
+    from .corpus import get_corpora
+
+    parser = argparse.ArgumentParser(description="Serve MiniLM encodes and title top-k queries over a Unix socket")
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SERVER_SOCKET", "/tmp/foodlabel-embeddings.sock"))
+    args = parser.parse_args()
+
+    #The sidecar always encodes in-process through the local batcher
+    corpora = get_corpora()
+    embedding_batcher.encode(["warmup"])
+    server = EmbeddingServer(args.socket, embedding_batcher.encode, corpora)
+    print(f"Embedding server listening on {args.socket}")
+    server.serve_forever()
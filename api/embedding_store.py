@@ -0,0 +1,112 @@
+import json
+import os
+import struct
+import numpy as np
+from .retrieval import matrix_hash, normalize_rows, to_float32_matrix
+
+#On-disk layout of a .emb file:
+#  8 bytes magic | uint64 little-endian header length | JSON header | zero padding to DATA_ALIGNMENT | rows x dim raw array (C order)
+#  int8 stores are followed by one float32 scale per row (header "scales": true); row i decodes to codes[i] * scales[i].
+#  The header's "matrix_hash" is the matrix_hash of the float32 rows before any quantization, so a store and the
+#  quantized copies written from the same embeddings carry the same hash.
+#Row labels (titles, or passage ids) live in a "<path>.titles" sidecar with one label per line.
+MAGIC = b"FLAEMB01"
+DATA_ALIGNMENT = 64
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+QUANTIZED_DTYPES = ("float16", "int8")
+
+def quantize_int8(matrix):
+    #Symmetric per-vector quantization: each row is scaled so that its largest component maps to 127
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def quantized_store_path(path, dtype):
+    #docs/embeddings.emb -> docs/embeddings.int8.emb
+    base, ext = os.path.splitext(path)
+    return f"{base}.{dtype}{ext}"
+
+class EmbeddingStore:
+    """
+    Read-only view of a .emb file. The matrix is an np.memmap, so every worker that opens
+    the same file shares one page-cache copy instead of holding a private unpickled tensor.
+    """
+
+    def __init__(self, path, header, matrix, titles, scales=None):
+        self.path = path
+        self.header = header
+        self.matrix = matrix
+        self.titles = titles
+        self.scales = scales
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+def titles_path(path):
+    return f"{path}.titles"
+
+def write_embedding_store(path, embeddings, titles, dtype="float32", normalize=True, extra_header=None):
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype {dtype}, expected one of {SUPPORTED_DTYPES}")
+
+    matrix = to_float32_matrix(embeddings)
+    if normalize:
+        matrix = normalize_rows(matrix)
+    content_hash = matrix_hash(matrix)
+    scales = None
+    if dtype == "int8":
+        matrix, scales = quantize_int8(matrix)
+    matrix = np.ascontiguousarray(matrix, dtype=dtype)
+    if len(titles) != matrix.shape[0]:
+        raise ValueError(f"{len(titles)} titles given for {matrix.shape[0]} embeddings")
+
+    header = {"version": 1, "dtype": dtype, "rows": int(matrix.shape[0]), "dim": int(matrix.shape[1]), "normalized": bool(normalize), "scales": scales is not None, "matrix_hash": content_hash}
+    header.update(extra_header or {})
+    header_bytes = json.dumps(header).encode("utf-8")
+    prefix_len = len(MAGIC) + 8 + len(header_bytes)
+    padding = (-prefix_len) % DATA_ALIGNMENT
+
+    #Write to temporary files and rename so that readers never map a half-written store
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * padding)
+        f.write(matrix.tobytes(order="C"))
+        if scales is not None:
+            f.write(scales.tobytes())
+    with open(f"{titles_path(path)}.tmp", "w", encoding="utf-8") as f:
+        for title in titles:
+            f.write(title.replace("\n", " ") + "\n")
+    os.replace(tmp_path, path)
+    os.replace(f"{titles_path(path)}.tmp", titles_path(path))
+    return header
+
+def read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an embedding store")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    prefix_len = len(MAGIC) + 8 + header_len
+    return header, prefix_len + (-prefix_len) % DATA_ALIGNMENT
+
+def open_embedding_store(path):
+    header, data_offset = read_header(path)
+    if header["dtype"] not in SUPPORTED_DTYPES:
+        raise ValueError(f"{path} has unsupported dtype {header['dtype']}")
+    shape = (header["rows"], header["dim"])
+    matrix = np.memmap(path, dtype=header["dtype"], mode="r", offset=data_offset, shape=shape)
+    scales = None
+    if header.get("scales"):
+        scales_offset = data_offset + matrix.nbytes
+        scales = np.memmap(path, dtype=np.float32, mode="r", offset=scales_offset, shape=(header["rows"],))
+
+    with open(titles_path(path), "r", encoding="utf-8") as f:
+        titles = tuple(line.rstrip("\n") for line in f)
+    if len(titles) != header["rows"]:
+        raise ValueError(f"{titles_path(path)} has {len(titles)} titles but {path} has {header['rows']} rows")
+
+    return EmbeddingStore(path, header, matrix, titles, scales)
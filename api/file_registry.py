@@ -0,0 +1,195 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import openai
+from .resource_ledger import get_resource_ledger
+from .config import MONGODB_URL, FILE_REGISTRY_BACKEND, FILE_REGISTRY_FILE, FILE_REGISTRY_TTL_DAYS, FILE_REGISTRY_VERIFY_SECONDS
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class SqliteFileStore:
+    #Registry records in a local SQLite table, shared by the workers on one host
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _db(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS uploaded_files (content_hash TEXT PRIMARY KEY, file_id TEXT, path TEXT, uploaded_at REAL, verified_at REAL)")
+            self._connection.commit()
+        return self._connection
+
+    def get(self, content_hash):
+        with self._lock:
+            row = self._db().execute("SELECT file_id, path, uploaded_at, verified_at FROM uploaded_files WHERE content_hash = ?", (content_hash,)).fetchone()
+        if row is None:
+            return None
+        return {"content_hash": content_hash, "file_id": row[0], "path": row[1], "uploaded_at": row[2], "verified_at": row[3]}
+
+    def put(self, record):
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO uploaded_files (content_hash, file_id, path, uploaded_at, verified_at) VALUES (?, ?, ?, ?, ?)",
+                (record["content_hash"], record["file_id"], record["path"], record["uploaded_at"], record["verified_at"]),
+            )
+            self._db().commit()
+
+    def delete(self, content_hash):
+        with self._lock:
+            self._db().execute("DELETE FROM uploaded_files WHERE content_hash = ?", (content_hash,))
+            self._db().commit()
+
+class MongoFileStore:
+    #Registry records in MongoDB, shared by every host of the deployment
+
+    def __init__(self, url, database="consumeWise", collection="uploaded_files"):
+        self.url = url
+        self.database = database
+        self.collection_name = collection
+        self._collection = None
+        self._lock = threading.Lock()
+
+    def _records(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    from pymongo import MongoClient
+                    self._collection = MongoClient(self.url)[self.database][self.collection_name]
+        return self._collection
+
+    def get(self, content_hash):
+        return self._records().find_one({"content_hash": content_hash}, {"_id": 0})
+
+    def put(self, record):
+        self._records().replace_one({"content_hash": record["content_hash"]}, record, upsert=True)
+
+    def delete(self, content_hash):
+        self._records().delete_one({"content_hash": content_hash})
+
+class FileRegistry:
+    """
+    Maps local files to OpenAI file IDs by content hash, so a file is uploaded once and attached to any
+    number of vector stores by ID. Registered IDs are checked against the API at most once per
+    verify_interval and re-uploaded when the remote file is gone or the record is older than ttl.
+    """
+
+    def __init__(self, store, ttl=FILE_REGISTRY_TTL_DAYS * 86400, verify_interval=FILE_REGISTRY_VERIFY_SECONDS, max_workers=4):
+        self.store = store
+        self.ttl = ttl
+        self.verify_interval = verify_interval
+        self.max_workers = max_workers
+        #(path, size, mtime) -> content hash, so unchanged files are not re-read on every lookup
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.uploads = 0
+
+    def content_hash(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        content_hash = self._hashes.get(key)
+        if content_hash is None:
+            content_hash = file_sha256(path)
+            self._hashes[key] = content_hash
+        return content_hash
+
+    def _upload(self, client, path, content_hash):
+        with open(path, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="assistants")
+        #The ledger expires the upload a day after the registry stops handing it out
+        get_resource_ledger().record("file", uploaded.id, "file_registry", ttl=self.ttl + 86400)
+        now = time.time()
+        self.store.put({"content_hash": content_hash, "file_id": uploaded.id, "path": path, "uploaded_at": now, "verified_at": now})
+        with self._lock:
+            self.uploads += 1
+        print(f"Uploaded {path} as {uploaded.id}")
+        return uploaded.id
+
+    def _is_live(self, client, record):
+        now = time.time()
+        if now - record["uploaded_at"] > self.ttl:
+            return False
+        if now - record["verified_at"] <= self.verify_interval:
+            return True
+        try:
+            client.files.retrieve(record["file_id"])
+        except openai.NotFoundError:
+            return False
+        self.store.put({**record, "verified_at": now})
+        return True
+
+    def file_id(self, client, path):
+        content_hash = self.content_hash(path)
+        record = self.store.get(content_hash)
+        if record is not None and self._is_live(client, record):
+            with self._lock:
+                self.hits += 1
+            return record["file_id"]
+        return self._upload(client, path, content_hash)
+
+    def file_ids(self, client, paths):
+        #Misses are uploaded concurrently
+        if len(paths) <= 1:
+            return [self.file_id(client, path) for path in paths]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths))) as executor:
+            return list(executor.map(lambda path: self.file_id(client, path), paths))
+
+    def invalidate(self, paths):
+        for path in paths:
+            content_hash = self.content_hash(path)
+            record = self.store.get(content_hash)
+            if record is not None:
+                #Vector stores already built on the old upload may still be leased, so it outlives them before being swept
+                get_resource_ledger().expire(record["file_id"], delay=86400)
+            self.store.delete(content_hash)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.uploads
+            return {"hits": self.hits, "uploads": self.uploads, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+_file_registry = None
+_file_registry_lock = threading.Lock()
+
+def get_file_registry():
+    global _file_registry
+    if _file_registry is None:
+        with _file_registry_lock:
+            if _file_registry is None:
+                store = MongoFileStore(MONGODB_URL) if FILE_REGISTRY_BACKEND == "mongo" else SqliteFileStore(FILE_REGISTRY_FILE)
+                _file_registry = FileRegistry(store)
+    return _file_registry
+
+def attach_files(client, vector_store_id, file_paths):
+    #Adds file_paths to a vector store by registered file ID, uploading only files the registry does not hold
+    registry = get_file_registry()
+    file_ids = registry.file_ids(client, file_paths)
+    file_batch = client.beta.vector_stores.file_batches.create_and_poll(vector_store_id=vector_store_id, file_ids=file_ids)
+    if file_batch.file_counts.failed:
+        #A registered file may have been deleted since it was last verified; fresh copies of the failed files
+        #only are uploaded and attached once, the files already attached stay as they are
+        failed_ids = {
+            vector_store_file.id
+            for vector_store_file in client.beta.vector_stores.file_batches.list_files(vector_store_id=vector_store_id, batch_id=file_batch.id)
+            if vector_store_file.status == "failed"
+        }
+        failed_paths = list(dict.fromkeys(path for path, file_id in zip(file_paths, file_ids) if file_id in failed_ids))
+        print(f"{file_batch.file_counts.failed} registered files failed to attach, re-uploading {failed_paths}")
+        if failed_paths:
+            registry.invalidate(failed_paths)
+            file_batch = client.beta.vector_stores.file_batches.create_and_poll(vector_store_id=vector_store_id, file_ids=registry.file_ids(client, failed_paths))
+    return file_batch
@@ -0,0 +1,55 @@
+#Hybrid article retrieval: dense title (and passage) rankings are fused with BM25 article rankings by
+#reciprocal rank fusion, so exact additive names and INS codes that embed poorly still surface their articles.
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+#BM25 scoring is numpy-bound, a few threads are enough to overlap it with the dense search
+_lexical_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+
+def reciprocal_rank_fusion(rankings, k=60):
+    #rankings are lists of keys, best first; a key's fused score is the sum of 1 / (k + rank) over the rankings it appears in
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def fuse_article_hits(dense_hits, lexical_hits, N, dense_thres, lexical_min_score, passage_hits=(), passage_thres=1.0, k=60):
+    """
+    Fuses the (row, score) hits of one corpus, each list best first, into the N best [(row, fused score)].
+    Hits under their retriever's threshold are dropped before fusion, so an article needs at least one
+    confident retriever to be kept; a row found by several retrievers is counted once with the summed score.
+    """
+    rankings = [
+        [row for row, cosine_sim in dense_hits if cosine_sim > dense_thres],
+        [row for row, cosine_sim in passage_hits if cosine_sim > passage_thres],
+        [row for row, score in lexical_hits if score > lexical_min_score],
+    ]
+    return reciprocal_rank_fusion(rankings, k)[:N]
+
+class LexicalSearches:
+    """
+    BM25 article searches for a batch of queries, started on a thread pool so they run while the
+    caller does the dense search. results() waits no longer than the latency budget. min_coverage is the
+    absolute gate (see Bm25Index.scores): relative score cutoffs alone would fuse the top hits of any query.
+    """
+
+    def __init__(self, bm25_index, queries, n, budget_ms, min_coverage, candidates=200):
+        self.deadline = time.monotonic() + budget_ms / 1000
+        self.futures = [_lexical_executor.submit(bm25_index.search_articles, query, n, candidates, min_coverage) for query in queries]
+
+    def results(self):
+        #One [(source, article id, score, passage id)] list per query; a search that misses the budget
+        #gives no lexical hits, and its query is ranked by the dense retrievers alone
+        results = []
+        late = 0
+        for future in self.futures:
+            try:
+                results.append(future.result(timeout=max(0.0, self.deadline - time.monotonic())))
+            except FutureTimeoutError:
+                future.cancel()
+                results.append([])
+                late += 1
+        if late:
+            print(f"Lexical search over budget for {late} of {len(self.futures)} queries, using dense ranking only")
+        return results
@@ -0,0 +1,68 @@
+#Groups a product's ingredients into shared analysis runs. Ingredients whose retrieval returned overlapping
+#article sets can be answered from one vector store (or one set of passages), and ingredients that fell back
+#to Ingredients.docx all use the same default assistant, so each group needs a single LLM call.
+import re
+from .analysis_store import analysis_name
+from .config import DOCX_FALLBACK_FILE
+
+#Additive codes as labels and models spell them: "INS 471", "INS471", "E-471", "E471", "INS 500(ii)"
+_additive_code_pattern = re.compile(r"\b(?:ins|e)\s*-?\s*(\d+[a-z]?)(?:\s*\(\s*([ivx]+)\s*\))?")
+
+def code_name(name):
+    #analysis_name with every additive code spelled "ins <number>(<roman>)"; E numbers are the INS numbers
+    return _additive_code_pattern.sub(
+        lambda match: f"ins {match.group(1)}" + (f"({match.group(2)})" if match.group(2) else ""), analysis_name(name)
+    )
+
+def batch_token_estimate(n_ingredients, base_tokens, per_ingredient_tokens):
+    #Retrieved context and instructions are paid once per run, the answer grows with every ingredient
+    return base_tokens + n_ingredients * per_ingredient_tokens
+
+def group_ingredients(retrieved_files_list, token_budget, base_tokens, per_ingredient_tokens, max_files):
+    """
+    Greedy grouping over (file_paths, refs) per ingredient, in label order. An ingredient joins the first
+    group of the same kind (articles or docx fallback) that shares an article with it, as long as the
+    group's article union stays within max_files and its token estimate within token_budget.
+    Returns lists of ingredient positions.
+    """
+    groups = []
+    for position, (file_paths, _) in enumerate(retrieved_files_list):
+        files = set(file_paths)
+        fallback = file_paths[0] == DOCX_FALLBACK_FILE
+        for group in groups:
+            if group["fallback"] != fallback or (not fallback and not group["files"] & files):
+                continue
+            if len(group["files"] | files) > max_files:
+                continue
+            if batch_token_estimate(len(group["members"]) + 1, base_tokens, per_ingredient_tokens) > token_budget:
+                continue
+            group["files"] |= files
+            group["members"].append(position)
+            break
+        else:
+            groups.append({"fallback": fallback, "files": files, "members": [position]})
+    return [group["members"] for group in groups]
+
+def match_results(ingredients, results):
+    """
+    Maps each ingredient to its key in the JSON answer of a batched run: the exact name first, then the
+    name up to case and whitespace, then up to the spelling of its additive codes ("E471" for "INS 471"),
+    so the codes themselves must agree. Ingredients whose key the model reworded are treated as missing
+    from the answer and analyzed on their own; pairing them by position would hand out another
+    ingredient's analysis whenever the model reorders its keys.
+    """
+    by_name = {}
+    by_code_name = {}
+    for key in results:
+        by_name.setdefault(analysis_name(key), key)
+        by_code_name.setdefault(code_name(key), key)
+    matched = {}
+    used = set()
+    for ingredient in ingredients:
+        key = ingredient if ingredient in results else by_name.get(analysis_name(ingredient))
+        if key is None or key in used:
+            key = by_code_name.get(code_name(ingredient))
+        if key is not None and key not in used:
+            matched[ingredient] = key
+            used.add(key)
+    return matched
@@ -3,45 +3,125 @@ import sys, pickle
 from functools import wraps
 import os
 import json
-from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer, util
-import torch
+import time
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-from openai import OpenAI
+from fastapi import FastAPI, HTTPException
+from openai import OpenAI, AsyncOpenAI
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import asyncio
+import threading
+from contextlib import contextmanager
+from .retrieval import TitleMatrix
+from .corpus import get_corpora
+from .embedding_batcher import EmbeddingBatcher
+from .embedding_cache import EmbeddingCache
+from .embedding_server import EmbeddingClient
+from .bm25 import get_bm25_index, score_cutoff
+from .passage_index import get_passage_index
+from .local_rag import select_context_passages, format_context
+from .hybrid_retrieval import LexicalSearches, fuse_article_hits
+from .file_registry import attach_files
+from .assistant_pool import AssistantPool
+from .static_assistants import get_static_assistant, run_with_static_assistant
+from .resource_ledger import get_resource_ledger
+from .async_runs import run_thread
+from .scheduler import llm_scheduler
+from .ingredient_batching import batch_token_estimate, group_ingredients, match_results
+from .analysis_store import AnalysisStore
+from .semantic_cache import SemanticAnalysisCache
+from .config import EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS, EMBEDDING_CACHE_FILE, EMBEDDING_CACHE_SIZE, EMBEDDING_SERVER_SOCKET
+from .config import RETRIEVAL_MODE, BM25_MIN_COVERAGE, BM25_MIN_SCORE, BM25_RELATIVE_SCORE, PASSAGE_SEARCH, PASSAGE_THRES
+from .config import INGREDIENT_ANALYSIS_MODE, LOCAL_RAG_PASSAGES, LOCAL_RAG_MODEL
+from .config import HYBRID_CANDIDATES, HYBRID_DENSE_THRES, HYBRID_RRF_K, HYBRID_BUDGET_MS
+from .config import LLM_REQUEST_CONCURRENCY, INGREDIENT_ANALYSIS_TOKENS
+from .config import INGREDIENT_BATCHING, INGREDIENT_BATCH_TOKEN_BUDGET, INGREDIENT_BATCH_BASE_TOKENS, INGREDIENT_BATCH_PER_INGREDIENT_TOKENS, INGREDIENT_BATCH_MAX_FILES
+from .config import ASSISTANT_POOL_SIZE, ASSISTANT_POOL_TTL_SECONDS, INGREDIENT_ASSISTANT_MODEL, INGREDIENT_PROMPT_VERSION
+from .config import ANALYSIS_STORE, ANALYSIS_STORE_FILE, ANALYSIS_STORE_TTL_DAYS, ANALYSIS_STORE_SIZE, STATIC_ASSISTANT_MODEL
+from .config import SEMANTIC_CACHE, SEMANTIC_CACHE_THRESHOLD, DOCX_FALLBACK_FILE
+
+app = FastAPI()
+
+# The pre-trained model (and torch) is loaded on first use or by the startup warmup, not at import time
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(MODEL_NAME)
+    return model
+
+# All encodes go through one batcher so concurrent analyses share forward passes instead of contending for torch threads
+embedding_batcher = EmbeddingBatcher(lambda texts: get_model().encode(texts, convert_to_numpy=True), max_batch_size=EMBEDDING_BATCH_SIZE, max_wait_ms=EMBEDDING_BATCH_WAIT_MS)
+
+# Most products reuse the same few hundred ingredient names, so their embeddings are cached across requests and restarts
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_FILE, MODEL_NAME, capacity=EMBEDDING_CACHE_SIZE)
+
+# The same ingredient retrieves the same articles in most products, so its analysis is kept and reused;
+# a new mode, model or prompt version starts a fresh set of entries
+analysis_store = AnalysisStore(
+    ANALYSIS_STORE_FILE,
+    f"{INGREDIENT_ANALYSIS_MODE}:{LOCAL_RAG_MODEL if INGREDIENT_ANALYSIS_MODE == 'local' else INGREDIENT_ASSISTANT_MODEL}:{STATIC_ASSISTANT_MODEL}:{INGREDIENT_PROMPT_VERSION}",
+    ANALYSIS_STORE_TTL_DAYS * 86400,
+    capacity=ANALYSIS_STORE_SIZE,
+)
+
+# Other spellings of a stored ingredient ("Iodized salt" for "Iodised Salt") reuse its analysis
+semantic_cache = SemanticAnalysisCache(ANALYSIS_STORE_FILE, analysis_store, threshold=SEMANTIC_CACHE_THRESHOLD)
+
+def store_ingredient_analysis(ingredient, file_paths, ingredient_analysis, refs_ingredient, is_ingredient_not_found_in_doc):
+    if ANALYSIS_STORE:
+        analysis_store.put(ingredient, file_paths, ingredient_analysis, refs_ingredient, is_ingredient_not_found_in_doc)
+        if SEMANTIC_CACHE:
+            semantic_cache.add(ingredient, file_paths, encode_ingredients([ingredient])[0])
+
+# Workers share one model through the embedding sidecar when it is configured
+embedding_client = EmbeddingClient(EMBEDDING_SERVER_SOCKET) if EMBEDDING_SERVER_SOCKET else None
+
+def encode_texts(texts):
+    #Prefer the sidecar; fall back to the in-process model when it is not configured or unreachable
+    if embedding_client is not None and embedding_client.available():
+        try:
+            return embedding_client.encode(texts)
+        except (OSError, RuntimeError) as e:
+            print(f"Embedding server unavailable, encoding in-process : {e}")
+    return embedding_batcher.encode(texts)
 
-# Load the pre-trained model
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+def search_titles(corpus_position, corpus, queries, N):
+    if embedding_client is not None and embedding_client.available():
+        try:
+            return embedding_client.search_batch(corpus_position, queries, N)
+        except (OSError, RuntimeError) as e:
+            print(f"Embedding server unavailable, searching in-process : {e}")
+    return corpus.title_search.search_batch(queries, N)
 
-def find_relevant_file_paths(ingredient, embeddings, titles, folder_name, journal_str = None, N=2, thres=0.7):
-    global model
+def encode_ingredients(ingredients):
+    return embedding_cache.get_many(ingredients, encode_texts)
+
+def select_relevant_files(ingredient, hits, titles, folder_name, journal_str = None, thres=0.7, citations = None):
     file_paths = []
     file_titles = []
     refs = []
 
-    embedding_ingredient = model.encode(ingredient, convert_to_tensor=True)
-    cosine_sims_dict = {}
-    cosine_sims_title = {}
-  
-    title_num = 0
-    for embedding in embeddings:
-        # Compute cosine similarity
-        title_num += 1
-        cosine_sim = util.pytorch_cos_sim(embedding_ingredient, embedding)
-        cosine_sims_dict.update({title_num:cosine_sim})
-        cosine_sims_title.update({titles[title_num-1]:cosine_sim})
-
-    #Sort cosine_sims_dict based on value of cosine_sim
-    top_n_cosine_sims_dict = dict(sorted(cosine_sims_dict.items(), key=lambda item: item[1], reverse=True)[:N])
-    top_n_cosine_sims_title = dict(sorted(cosine_sims_title.items(), key=lambda item: item[1], reverse=True)[:N])
+    #hits are (row, cosine_sim) pairs, best first; keys are 1-based article numbers
+    top_n_cosine_sims_dict = {row + 1: cosine_sim for row, cosine_sim in hits}
+    top_n_cosine_sims_title = {titles[key-1]: cosine_sim for key, cosine_sim in top_n_cosine_sims_dict.items()}
 
     print(f"DEBUG : Ingredient {ingredient} top_n_cosine_sims_dict : {top_n_cosine_sims_dict} top_n_cosine_sims_title : {top_n_cosine_sims_title}")
     
     for key, value in top_n_cosine_sims_dict.items():
-        if value.item() > thres:
+        if value > thres:
             file_paths.append(f"{folder_name}/article{key}.txt")
             file_titles.append(titles[key-1])
+            if citations is not None and key in citations:
+                #Reference lines come from the prebuilt citation index, no file is opened
+                refs.extend(citations.refs(key, journal_str))
+                continue
             #Read lines after "References:" from {folder_name}/article{key}.txt
             start = 0
             for line in open(f"{folder_name}/article{key}.txt").readlines():
@@ -55,52 +135,166 @@ def find_relevant_file_paths(ingredient, embeddings, titles, folder_name, journa
     print(f"Returning citations : {list(set(sorted(refs)))}")    
     return file_paths, file_titles, list(set(sorted(refs)))
 
-def get_files_with_ingredient_info(ingredient, embeddings_titles_list, N=1):
+def find_relevant_file_paths(ingredient, embeddings, titles, folder_name, journal_str = None, N=2, thres=0.7, citations = None):
+    embedding_ingredient = encode_ingredients([ingredient])[0]
 
-    embeddings_titles_1 = embeddings_titles_list[0]
-    with open('docs/titles.txt', 'r') as file:
-        lines = file.readlines()
-    
-    titles = [line.strip() for line in lines]
-    folder_name_1 = "docs/articles"
-    #Apply cosine similarity between embedding of ingredient name and title of all files
-    file_paths_abs_1, file_titles_1, refs_1 = find_relevant_file_paths(ingredient, embeddings_titles_1, titles, folder_name_1, journal_str = ".ncbi.", N=N)
-
-    embeddings_titles_2 = embeddings_titles_list[1]
-    with open('docs/titles_harvard.txt', 'r') as file:
-        lines = file.readlines()
-    
-    titles = [line.strip() for line in lines]
-    folder_name_2 = "docs/articles_harvard"
-    #Apply cosine similarity between embedding of ingredient name and title of all files
-    file_paths_abs_2, file_titles_2, refs_2 = find_relevant_file_paths(ingredient, embeddings_titles_2, titles, folder_name_1, N=N)
+    #embeddings is normally a prebuilt TitleMatrix or IVFIndex; raw .pkl embeddings are converted on the fly
+    title_matrix = embeddings if hasattr(embeddings, "search") else TitleMatrix(embeddings)
 
+    #Score all titles with one matmul and partially select the top N
+    hits = title_matrix.search(embedding_ingredient, N)
+    return select_relevant_files(ingredient, hits, titles, folder_name, journal_str = journal_str, thres = thres, citations = citations)
+
+def combine_relevant_files(corpus_results):
+    #corpus_results holds one (file_paths, file_titles, refs) tuple per corpus
     #Fine top N titles that are the most similar to the ingredient's name
     #Find file names for those titles
     file_paths = []
     refs = []
-    if len(file_paths_abs_1) == 0 and len(file_paths_abs_2) == 0:
-        file_paths.append("docs/Ingredients.docx")
+    if all(len(file_paths_abs) == 0 for file_paths_abs, _, _ in corpus_results):
+        file_paths.append(DOCX_FALLBACK_FILE)
     else:
-        for file_path in file_paths_abs_1:
-            file_paths.append(file_path)
-        refs.extend(refs_1)
-        for file_path in file_paths_abs_2:
-            file_paths.append(file_path)
-        refs.extend(refs_2)
-
-        print(f"Titles are {file_titles_1} and {file_titles_2}")
+        for file_paths_abs, _, corpus_refs in corpus_results:
+            file_paths.extend(file_paths_abs)
+            refs.extend(corpus_refs)
+
+        print(f"Titles are {' and '.join(str(file_titles) for _, file_titles, _ in corpus_results)}")
             
     return file_paths, refs
+
+def find_relevant_file_paths_lexical(ingredient, bm25_index, corpora, N=2, min_score=BM25_MIN_SCORE, relative_score=BM25_RELATIVE_SCORE, min_coverage=BM25_MIN_COVERAGE):
+    #BM25 over article passages instead of title embeddings; one (file_paths, file_titles, refs) tuple per corpus
+    hits_by_source = {corpus.source: [] for corpus in corpora}
+    article_hits = bm25_index.search_articles(ingredient, N * len(corpora), candidates=200, min_coverage=min_coverage)
+    cutoff = score_cutoff([score for _, _, score, _ in article_hits], relative_score, min_score)
+    for source, article_id, score, _ in article_hits:
+        if source in hits_by_source and len(hits_by_source[source]) < N:
+            hits_by_source[source].append((article_id - 1, score))
+    return [
+        select_relevant_files(ingredient, hits_by_source[corpus.source], corpus.titles, corpus.folder_name, journal_str = corpus.journal_str, thres = cutoff, citations = corpus.citations)
+        for corpus in corpora
+    ]
+
+def find_relevant_file_paths_hybrid(ingredient, dense_hits, passage_hits, lexical_hits, corpora, N=2):
+    #Rank fusion of the title, passage and BM25 hits; one (file_paths, file_titles, refs) tuple per corpus
+    #dense_hits holds one [(row, cosine_sim)] list per corpus, passage_hits and lexical_hits are [(source, article id, score, passage id)].
+    #lexical_hits must come from a coverage-gated search (LexicalSearches with BM25_MIN_COVERAGE); the relative
+    #cutoff below only trims the tail of hits that already match the ingredient
+    corpus_results = []
+    lexical_cutoff = score_cutoff([score for _, _, score, _ in lexical_hits], BM25_RELATIVE_SCORE, BM25_MIN_SCORE)
+    for corpus, corpus_dense_hits in zip(corpora, dense_hits):
+        corpus_passage_hits = [(article_id - 1, score) for source, article_id, score, _ in passage_hits if source == corpus.source]
+        corpus_lexical_hits = [(article_id - 1, score) for source, article_id, score, _ in lexical_hits if source == corpus.source]
+        fused_hits = fuse_article_hits(
+            corpus_dense_hits, corpus_lexical_hits, N, HYBRID_DENSE_THRES, lexical_cutoff,
+            passage_hits = corpus_passage_hits, passage_thres = PASSAGE_THRES, k = HYBRID_RRF_K,
+        )
+        #fused hits are already filtered by each retriever's threshold
+        corpus_results.append(select_relevant_files(ingredient, fused_hits, corpus.titles, corpus.folder_name, journal_str = corpus.journal_str, thres = -1.0, citations = corpus.citations))
+    return corpus_results
+
+def get_lexical_index():
+    return get_bm25_index() if RETRIEVAL_MODE == "lexical" else None
+
+def get_hybrid_lexical_index():
+    #Hybrid mode degrades to dense retrieval when the BM25 index has not been built
+    return get_bm25_index() if RETRIEVAL_MODE == "hybrid" else None
+
+def get_files_with_ingredient_info(ingredient, corpora, N=1):
+    bm25_index = get_lexical_index()
+    if bm25_index is not None:
+        return combine_relevant_files(find_relevant_file_paths_lexical(ingredient, bm25_index, corpora, N))
+
+    return get_files_with_ingredients_info([ingredient], corpora, N)[0]
+
+def merge_title_and_passage_hits(title_hits, passage_hits, N, thres=0.7, passage_thres=PASSAGE_THRES):
+    #Keeps title hits above thres and passage hits above passage_thres, one entry per article with its best score
+    best = {}
+    for hits, min_score in ((title_hits, thres), (passage_hits, passage_thres)):
+        for row, cosine_sim in hits:
+            if cosine_sim > min_score and cosine_sim > best.get(row, -1.0):
+                best[row] = cosine_sim
+    return sorted(best.items(), key=lambda item: item[1], reverse=True)[:N]
+
+def get_files_with_ingredients_info(ingredients, corpora, N=1):
+    #Batched version of get_files_with_ingredient_info: the whole ingredient list is encoded in one call
+    #and scored against each corpus with one matrix product. Returns one (file_paths, refs) per ingredient.
+    if len(ingredients) == 0:
+        return []
+    if get_lexical_index() is not None:
+        return [get_files_with_ingredient_info(ingredient, corpora, N) for ingredient in ingredients]
+
+    #In hybrid mode the BM25 searches run in the background while the ingredients are encoded and searched densely
+    hybrid_index = get_hybrid_lexical_index()
+    if hybrid_index is not None:
+        lexical_searches = LexicalSearches(hybrid_index, ingredients, HYBRID_CANDIDATES * len(corpora), HYBRID_BUDGET_MS, BM25_MIN_COVERAGE)
+
+    embeddings_ingredients = encode_ingredients(list(ingredients))
+    hits_per_corpus = [search_titles(position, corpus, embeddings_ingredients, HYBRID_CANDIDATES if hybrid_index is not None else N) for position, corpus in enumerate(corpora)]
+
+    #Titles are weak proxies for article content, so matching passages can add articles the title search missed
+    passage_index = get_passage_index() if PASSAGE_SEARCH else None
+    if passage_index is not None:
+        passage_hits = passage_index.search_articles_batch(embeddings_ingredients, 2 * N * len(corpora))
+
+    if hybrid_index is not None:
+        lexical_hits = lexical_searches.results()
+        return [
+            combine_relevant_files(find_relevant_file_paths_hybrid(
+                ingredient, [hits[i] for hits in hits_per_corpus], passage_hits[i] if passage_index is not None else [], lexical_hits[i], corpora, N
+            ))
+            for i, ingredient in enumerate(ingredients)
+        ]
+
+    results = []
+    for i, ingredient in enumerate(ingredients):
+        corpus_results = []
+        for corpus, hits in zip(corpora, hits_per_corpus):
+            if passage_index is None:
+                corpus_results.append(select_relevant_files(ingredient, hits[i], corpus.titles, corpus.folder_name, journal_str = corpus.journal_str, citations = corpus.citations))
+                continue
+            corpus_passage_hits = [(article_id - 1, cosine_sim) for source, article_id, cosine_sim, _ in passage_hits[i] if source == corpus.source]
+            merged_hits = merge_title_and_passage_hits(hits[i], corpus_passage_hits, N)
+            #merged hits are already filtered by their own thresholds
+            corpus_results.append(select_relevant_files(ingredient, merged_hits, corpus.titles, corpus.folder_name, journal_str = corpus.journal_str, thres = -1.0, citations = corpus.citations))
+        results.append(combine_relevant_files(corpus_results))
+    return results
   
-def analyze_harmful_ingredients(ingredient_list = [], ingredient = "", assistant_id = 0, client = None):
-    
-    is_ingredient_not_found_in_doc = False
-    
+def harmful_ingredients_prompt(ingredient_list = [], ingredient = ""):
     if len(ingredient_list) == 0 and ingredient != "":
         user_prompt = "A food product has ingredient: " + ingredient + ". Is this ingredient safe to eat? The output must be in JSON format: {<ingredient_name>: <information from the document about why ingredient is harmful>}. If information about an ingredient is not found in the documents, the value for that ingredient must start with the prefix '(NOT FOUND IN DOCUMENT)' followed by the LLM's response based on its own knowledge."
     else:
         user_prompt = "A food product has ingredients: " + ", ".join(ingredient_list) + ". Is each ingredient safe to eat? The output must be in JSON format: {<ingredient_name>: <information from the document about why ingredient is harmful>}. If information about an ingredient is not found in the documents, the value for that ingredient must start with the prefix '(NOT FOUND IN DOCUMENT)' followed by the LLM's response based on its own knowledge."
+    return user_prompt
+
+def parse_harmful_ingredients_results(message_value):
+    #JSON answer -> {ingredient key: (analysis without the not-found prefix, whether it was not found in the documents)}
+    results = {}
+    for key, value in json.loads(message_value.replace("```", "").replace("json", "")).items():
+        results[key.replace("(NOT FOUND IN DOCUMENT) ", "")] = (value.replace("(NOT FOUND IN DOCUMENT) ", ""), value.startswith("(NOT FOUND IN DOCUMENT)"))
+    return results
+
+def parse_harmful_ingredients_analysis(message_value):
+    #JSON answer -> ("<ingredient>: <analysis>" lines, whether any ingredient was not found in the documents)
+    is_ingredient_not_found_in_doc = False
+    ingredients_not_found_in_doc = []        
+    print(message_value)
+    for key, value in json.loads(message_value.replace("```", "").replace("json", "")).items():
+        if value.startswith("(NOT FOUND IN DOCUMENT)"):
+            ingredients_not_found_in_doc.append(key)
+            is_ingredient_not_found_in_doc = True
+    print(f"Ingredients not found in database {','.join(ingredients_not_found_in_doc)}")
+    
+    harmful_ingredient_analysis = json.loads(message_value.replace("```", "").replace("json", "").replace("(NOT FOUND IN DOCUMENT) ", ""))
+        
+    harmful_ingredient_analysis_str = ""
+    for key, value in harmful_ingredient_analysis.items():
+      harmful_ingredient_analysis_str += f"{key}: {value}\n"
+    return harmful_ingredient_analysis_str, is_ingredient_not_found_in_doc
+
+def analyze_harmful_ingredients(ingredient_list = [], ingredient = "", assistant_id = 0, client = None):
+    
+    user_prompt = harmful_ingredients_prompt(ingredient_list, ingredient)
 
     thread = client.beta.threads.create(
         messages=[
@@ -183,80 +377,78 @@ def analyze_harmful_ingredients(ingredient_list = [], ingredient = "", assistant
           #citations.append(f"[{index}] {cited_file.filename}")
           message_content.value = message_content.value.replace(annotation.text, "")
   
-    ingredients_not_found_in_doc = []        
-    print(message_content.value)
-    for key, value in json.loads(message_content.value.replace("```", "").replace("json", "")).items():
-        if value.startswith("(NOT FOUND IN DOCUMENT)"):
-            ingredients_not_found_in_doc.append(key)
-            is_ingredient_not_found_in_doc = True
-    print(f"Ingredients not found in database {','.join(ingredients_not_found_in_doc)}")
-    
-    harmful_ingredient_analysis = json.loads(message_content.value.replace("```", "").replace("json", "").replace("(NOT FOUND IN DOCUMENT) ", ""))
-        
-    harmful_ingredient_analysis_str = ""
-    for key, value in harmful_ingredient_analysis.items():
-      harmful_ingredient_analysis_str += f"{key}: {value}\n"
-    return harmful_ingredient_analysis_str, is_ingredient_not_found_in_doc
+    return parse_harmful_ingredients_analysis(message_content.value)
 
+def analyze_harmful_ingredients_locally(ingredient, file_paths, client, corpora, ingredient_embedding = None):
+    #Same prompt and JSON contract as analyze_harmful_ingredients, with the best passages of file_paths sent inline
+    passages = select_context_passages(ingredient, file_paths, corpora, ingredient_embedding, max_passages=LOCAL_RAG_PASSAGES)
+    print(f"DEBUG : Analyzing ingredient {ingredient} with {len(passages)} local passages from {file_paths}")
+    
+    response = client.chat.completions.create(**local_analysis_request(ingredient, passages))
+    return parse_harmful_ingredients_analysis(response.choices[0].message.content)
+
+def local_analysis_request(ingredient, passages, ingredient_list = []):
+    #One ingredient, or several with ingredient_list for a batched analysis
+    subject = f"the ingredients {', '.join(ingredient_list)}" if ingredient_list else f"the ingredient {ingredient}"
+    return dict(
+        model=LOCAL_RAG_MODEL,
+        temperature=0,
+        top_p=0.85,
+        messages=[
+            {
+                "role": "system",
+                "content": f"You are an expert dietician. Use the documents below to answer questions about {subject} in a food product.\n\nDocuments:\n{format_context(passages)}",
+            },
+            {
+                "role": "user",
+                "content": harmful_ingredients_prompt(ingredient_list, ingredient),
+            }
+        ]
+    )
 
-def get_assistant_for_ingredient(ingredient, client, embeddings_titles_list, default_assistant, N=2):
-  
-    #Harmful Ingredients
-    assistant2 = client.beta.assistants.create(
-      name="Harmful Ingredients",
-      instructions=f"You are an expert dietician. Use your knowledge base to answer questions about the ingredient {ingredient} in a food product.",
-      model="gpt-4o",
-      tools=[{"type": "file_search"}],
-      temperature=0,
-      top_p = 0.85
-      )
-
-    # Create a vector store
-    vector_store2 = client.beta.vector_stores.create(
-     name="Harmful Ingredients Vec",
-     chunking_strategy={
-        "type": "static",
-        "static": {
-            "max_chunk_size_tokens": 400,  # Set your desired max chunk size
-            "chunk_overlap_tokens": 200    # Set your desired overlap size
+async def analyze_harmful_ingredients_locally_async(ingredient, file_paths, client, corpora, ingredient_embedding = None):
+    #AsyncOpenAI version of analyze_harmful_ingredients_locally; the passages are read off the event loop
+    passages = await asyncio.to_thread(select_context_passages, ingredient, file_paths, corpora, ingredient_embedding, LOCAL_RAG_PASSAGES)
+    print(f"DEBUG : Analyzing ingredient {ingredient} with {len(passages)} local passages from {file_paths}")
+
+    response = await client.chat.completions.create(**local_analysis_request(ingredient, passages))
+    return parse_harmful_ingredients_analysis(response.choices[0].message.content)
+
+async def analyze_harmful_ingredients_async(ingredient_list = [], ingredient = "", assistant_id = 0, client = None):
+    #AsyncOpenAI version of analyze_harmful_ingredients: the run is polled without blocking the event loop
+    return parse_harmful_ingredients_analysis(await run_harmful_ingredients_async(ingredient_list, ingredient, assistant_id, client))
+
+async def run_harmful_ingredients_async(ingredient_list = [], ingredient = "", assistant_id = 0, client = None):
+    #Raw JSON answer of the harmful ingredients run, citation markers removed
+    message_content = await run_thread(
+        client,
+        assistant_id,
+        harmful_ingredients_prompt(ingredient_list, ingredient),
+        "Processing Ingredients",
+        include=["step_details.tool_calls[*].file_search.results[*].content"],
+        tools=[{
+        "type": "file_search",
+        "file_search": {
+            "max_num_results": 5
         }
-    }
+        }]
     )
 
-    # Ready the files for upload to OpenAI.     
-    file_paths, refs = get_files_with_ingredient_info(ingredient, embeddings_titles_list, N)
-    if file_paths[0] == "docs/Ingredients.docx":
-        print(f"Using Ingredients.docx for analyzing ingredient {ingredient}")
-        return default_assistant, [], file_paths
-        
-    print(f"DEBUG : Creating vector store for files {file_paths} to analyze ingredient {ingredient}")
-    
-    file_streams = [open(path, "rb") for path in file_paths]
-    
-    # Use the upload and poll SDK helper to upload the files, add them to the vector store,
-    # and poll the status of the file batch for completion.
-    file_batch2 = client.beta.vector_stores.file_batches.upload_and_poll(
-      vector_store_id=vector_store2.id, files=file_streams
-    )
-    
-    # You can print the status and the file counts of the batch to see the result of this operation.
-    print(file_batch2.status)
-    print(file_batch2.file_counts)
+    for annotation in message_content.annotations:
+      if getattr(annotation, "file_citation", None):
+          message_content.value = message_content.value.replace(annotation.text, "")
 
-    #To make the files accessible to your assistant, update the assistant’s tool_resources with the new vector_store id.
-    assistant2 = client.beta.assistants.update(
-      assistant_id=assistant2.id,
-      tool_resources={"file_search": {"vector_store_ids": [vector_store2.id]}},
-    )
-        
-    return assistant2, refs, file_paths
+    print(message_content.value)
+    return message_content.value
 
-def create_default_assistant(client):
 
+def create_ingredient_assistant(client, file_paths):
+    #Assistant and vector store over file_paths; the instructions name no ingredient so the pool can share them across ingredients
+    #Harmful Ingredients
     assistant2 = client.beta.assistants.create(
       name="Harmful Ingredients",
-      instructions=f"You are an expert dietician. Use your knowledge base to answer questions about a given ingredient in a food product.",
-      model="gpt-4o",
+      instructions="You are an expert dietician. Use your knowledge base to answer questions about a given ingredient in a food product.",
+      model=INGREDIENT_ASSISTANT_MODEL,
       tools=[{"type": "file_search"}],
       temperature=0,
       top_p = 0.85
@@ -274,26 +466,62 @@ def create_default_assistant(client):
     }
     )
 
+    # The pool deletes them on eviction; the ledger's expiry covers a worker that exits without evicting
+    ledger = get_resource_ledger()
+    ledger.record("assistant", assistant2.id, "assistant_pool", ttl=ASSISTANT_POOL_TTL_SECONDS + 3600)
+    ledger.record("vector_store", vector_store2.id, "assistant_pool", ttl=ASSISTANT_POOL_TTL_SECONDS + 3600)
+
+    print(f"DEBUG : Creating vector store for files {file_paths}")
     
-    file_streams = [open("docs/Ingredients.docx", "rb")]
-    
-    # Use the upload and poll SDK helper to upload the files, add them to the vector store,
-    # and poll the status of the file batch for completion.
-    file_batch2 = client.beta.vector_stores.file_batches.upload_and_poll(
-      vector_store_id=vector_store2.id, files=file_streams
-    )
+    # Attach the articles by their registered file IDs; only articles never uploaded before (or expired) are uploaded.
+    # Poll the status of the file batch for completion.
+    file_batch2 = attach_files(client, vector_store2.id, file_paths)
     
     # You can print the status and the file counts of the batch to see the result of this operation.
     print(file_batch2.status)
     print(file_batch2.file_counts)
 
-    #harmful Ingredients
+    #To make the files accessible to your assistant, update the assistant’s tool_resources with the new vector_store id.
     assistant2 = client.beta.assistants.update(
       assistant_id=assistant2.id,
       tool_resources={"file_search": {"vector_store_ids": [vector_store2.id]}},
     )
+        
+    return assistant2, vector_store2.id
+
+def delete_ingredient_assistant(client, assistant, vector_store_id):
+    #The uploaded files stay: they belong to the file registry and are shared with other vector stores
+    ledger = get_resource_ledger()
+    ledger.delete_now(client, "assistant", assistant.id)
+    ledger.delete_now(client, "vector_store", vector_store_id)
+
+# Assistants are reused by every ingredient that retrieves the same articles, until evicted
+assistant_pool = AssistantPool(max_size=ASSISTANT_POOL_SIZE, ttl=ASSISTANT_POOL_TTL_SECONDS)
+
+@contextmanager
+def get_assistant_for_ingredient(ingredient, client, corpora, default_assistant, N=2, retrieved_files = None):
+    #Yields (assistant, refs, file_paths); the pooled assistant is leased until the with block exits
+
+    # Ready the files for the assistant. retrieved_files is the (file_paths, refs) already found by a batched lookup
+    if retrieved_files is None:
+        retrieved_files = get_files_with_ingredient_info(ingredient, corpora, N)
+    file_paths, refs = retrieved_files
+    if file_paths[0] == DOCX_FALLBACK_FILE:
+        print(f"Using Ingredients.docx for analyzing ingredient {ingredient}")
+        yield default_assistant, [], file_paths
+        return
+
+    key = (tuple(sorted(file_paths)), INGREDIENT_ASSISTANT_MODEL, INGREDIENT_PROMPT_VERSION)
+    with assistant_pool.lease(
+        key,
+        lambda: create_ingredient_assistant(client, file_paths),
+        lambda assistant, vector_store_id: delete_ingredient_assistant(client, assistant, vector_store_id),
+    ) as assistant2:
+        yield assistant2, refs, file_paths
 
-    return assistant2
+def create_default_assistant(client):
+    #The Ingredients.docx assistant is created once per deployment and reused across requests and restarts
+    return get_static_assistant(client, "ingredients")
     
 def analyze_processing_level(ingredients, assistant_id, client):
     
@@ -342,48 +570,202 @@ def analyze_processing_level(ingredients, assistant_id, client):
     processing_level_str = message_content.value
     return processing_level_str
 
-def process_ingredient(ingredient, client, embeddings_titles_list, default_assistant):
+async def analyze_processing_level_async(ingredients, assistant_id, client):
+    #AsyncOpenAI version of analyze_processing_level
+    message_content = await run_thread(
+        client,
+        assistant_id,
+        "Categorize food product that has following ingredients: " + ', '.join(ingredients) + " into Group A, Group B, or Group C based on the document. The output must only be the group category name (Group A, Group B, or Group C) alongwith the reason behind assigning that respective category to the product. If the group category cannot be determined, output 'NOT FOUND'.",
+        "Processing Level",
+        include=["step_details.tool_calls[*].file_search.results[*].content"]
+    )
+    for annotation in message_content.annotations:
+        message_content.value = message_content.value.replace(annotation.text, "")
+
+    print(message_content.value)
+    return message_content.value
+
+def process_ingredient(ingredient, client, corpora, default_assistant, retrieved_files = None):
     ingredient_not_found_in_journal = ""
     
-    assistant_id_ingredient, refs_ingredient, file_paths = get_assistant_for_ingredient(ingredient, client, embeddings_titles_list, default_assistant, 2)
-    #if file_paths[0] == "docs/Ingredients.docx":
-    #    ingredient_not_found_in_journal = ingredient
+    if INGREDIENT_ANALYSIS_MODE == "local":
+        #No assistant or vector store: the passages are picked here and sent with one chat completion
+        if retrieved_files is None:
+            retrieved_files = get_files_with_ingredient_info(ingredient, corpora, 2)
+        file_paths, refs_ingredient = retrieved_files
+        ingredient_embedding = encode_ingredients([ingredient])[0]
+        ingredient_analysis, is_ingredient_in_doc = analyze_harmful_ingredients_locally(ingredient, file_paths, client, corpora, ingredient_embedding)
+    else:
+        with get_assistant_for_ingredient(ingredient, client, corpora, default_assistant, 2, retrieved_files) as (assistant_id_ingredient, refs_ingredient, file_paths):
+            #if file_paths[0] == "docs/Ingredients.docx":
+            #    ingredient_not_found_in_journal = ingredient
                     
-    ingredient_analysis, is_ingredient_in_doc = analyze_harmful_ingredients(ingredient_list = [], ingredient = ingredient, assistant_id = assistant_id_ingredient.id, client = client)
+            ingredient_analysis, is_ingredient_in_doc = analyze_harmful_ingredients(ingredient_list = [], ingredient = ingredient, assistant_id = assistant_id_ingredient.id, client = client)
     ingredient_analysis += "\n"
     
     if not is_ingredient_in_doc:
         refs_ingredient = []
+    store_ingredient_analysis(ingredient, file_paths, ingredient_analysis, refs_ingredient, is_ingredient_in_doc)
         
     #return ingredient_analysis, refs_ingredient, ingredient_not_found_in_journal
     return ingredient_analysis, refs_ingredient
 
+async def process_ingredient_async(ingredient, client, async_client, corpora, default_assistant, retrieved_files = None):
+    #process_ingredient with the LLM calls on AsyncOpenAI; the pooled assistant is leased and released
+    #on worker threads because its creation uses the sync client
+    if INGREDIENT_ANALYSIS_MODE == "local":
+        if retrieved_files is None:
+            retrieved_files = await asyncio.to_thread(get_files_with_ingredient_info, ingredient, corpora, 2)
+        file_paths, refs_ingredient = retrieved_files
+        ingredient_embedding = (await asyncio.to_thread(encode_ingredients, [ingredient]))[0]
+        ingredient_analysis, is_ingredient_in_doc = await analyze_harmful_ingredients_locally_async(ingredient, file_paths, async_client, corpora, ingredient_embedding)
+    else:
+        lease = get_assistant_for_ingredient(ingredient, client, corpora, default_assistant, 2, retrieved_files)
+        assistant_id_ingredient, refs_ingredient, file_paths = await asyncio.to_thread(lease.__enter__)
+        try:
+            ingredient_analysis, is_ingredient_in_doc = await analyze_harmful_ingredients_async(ingredient_list = [], ingredient = ingredient, assistant_id = assistant_id_ingredient.id, client = async_client)
+        finally:
+            await asyncio.to_thread(lease.__exit__, None, None, None)
+    ingredient_analysis += "\n"
+
+    if not is_ingredient_in_doc:
+        refs_ingredient = []
+    await asyncio.to_thread(store_ingredient_analysis, ingredient, file_paths, ingredient_analysis, refs_ingredient, is_ingredient_in_doc)
+
+    return ingredient_analysis, refs_ingredient
+
+async def process_ingredient_batch_async(ingredients, retrieved_files_list, client, async_client, corpora, default_assistant):
+    #One run (or completion) for a group of ingredients over the union of their articles.
+    #Returns one (ingredient_analysis, refs) per ingredient, None for ingredients missing from the answer
+    file_paths = sorted(set(path for paths, _ in retrieved_files_list for path in paths))
+    print(f"DEBUG : Analyzing ingredients {ingredients} together over {file_paths}")
+
+    if INGREDIENT_ANALYSIS_MODE == "local":
+        ingredient_embeddings = await asyncio.to_thread(encode_ingredients, ingredients)
+        per_ingredient = max(2, LOCAL_RAG_PASSAGES // len(ingredients))
+        passages = []
+        for ingredient, ingredient_embedding, (paths, _) in zip(ingredients, ingredient_embeddings, retrieved_files_list):
+            for passage in await asyncio.to_thread(select_context_passages, ingredient, paths, corpora, ingredient_embedding, per_ingredient):
+                if passage not in passages:
+                    passages.append(passage)
+        response = await async_client.chat.completions.create(**local_analysis_request("", passages, ingredient_list = ingredients))
+        message_value = response.choices[0].message.content
+    else:
+        lease = get_assistant_for_ingredient(", ".join(ingredients), client, corpora, default_assistant, 2, (file_paths, []))
+        assistant, _, _ = await asyncio.to_thread(lease.__enter__)
+        try:
+            message_value = await run_harmful_ingredients_async(ingredient_list = ingredients, assistant_id = assistant.id, client = async_client)
+        finally:
+            await asyncio.to_thread(lease.__exit__, None, None, None)
+
+    results = parse_harmful_ingredients_results(message_value)
+    matched = match_results(ingredients, results)
+    batch_results = []
+    for ingredient, (paths, refs_ingredient) in zip(ingredients, retrieved_files_list):
+        key = matched.get(ingredient)
+        if key is None:
+            batch_results.append(None)
+            continue
+        analysis, is_ingredient_in_doc = results[key]
+        #Same output and refs rules as process_ingredient
+        batch_results.append((f"{key}: {analysis}\n\n", refs_ingredient if is_ingredient_in_doc else []))
+        #Stored under the ingredient's own articles, which is what later products look it up by
+        await asyncio.to_thread(store_ingredient_analysis, ingredient, paths, *batch_results[-1], is_ingredient_in_doc)
+    return batch_results
+
 # Alternative Approach: Asynchronous Processing
-async def async_process_ingredients(ingredients_list, client, embeddings_titles_list, default_assistant):
-    async def process_single_ingredient(ingredient):
+async def async_process_ingredients(ingredients_list, client, corpora, default_assistant, async_client = None):
+    #Retrieve files for every ingredient with one batched encode instead of one encode per ingredient thread
+    retrieved_files_list = await asyncio.to_thread(get_files_with_ingredients_info, ingredients_list, corpora, 2)
+
+    #Ingredients analyzed for an earlier product over the same articles are answered from the analysis store
+    stored = [None] * len(ingredients_list)
+    if ANALYSIS_STORE:
+        stored = await asyncio.to_thread(lambda: [analysis_store.get(ingredient, file_paths) for ingredient, (file_paths, _) in zip(ingredients_list, retrieved_files_list)])
+    if ANALYSIS_STORE and SEMANTIC_CACHE and None in stored:
+        #Exact misses are matched against other spellings; their embeddings are already cached by the retrieval above
+        positions = [position for position, entry in enumerate(stored) if entry is None]
+        vectors = await asyncio.to_thread(encode_ingredients, [ingredients_list[position] for position in positions])
+        for position, vector in zip(positions, vectors):
+            stored[position] = await asyncio.to_thread(semantic_cache.lookup, ingredients_list[position], vector)
+    misses = [position for position, entry in enumerate(stored) if entry is None]
+    print(f"DEBUG : {len(ingredients_list) - len(misses)} of {len(ingredients_list)} ingredient analyses reused")
+    results = [(entry[0], entry[1]) if entry is not None else None for entry in stored]
+    ingredients_list = [ingredients_list[position] for position in misses]
+    retrieved_files_list = [retrieved_files_list[position] for position in misses]
+
+    #At most LLM_REQUEST_CONCURRENCY ingredients of this product are in flight, so one long label cannot take every global slot
+    request_slots = asyncio.Semaphore(LLM_REQUEST_CONCURRENCY)
+
+    async def process_single_ingredient(ingredient, retrieved_files):
         try:
+            if async_client is not None:
+                #Every ingredient's run is polled on the event loop instead of holding a worker thread,
+                #admitted by the shared scheduler and retried by it when rate limited
+                async with request_slots:
+                    return await llm_scheduler.run(
+                        lambda: process_ingredient_async(ingredient, client, async_client, corpora, default_assistant, retrieved_files),
+                        estimated_tokens=INGREDIENT_ANALYSIS_TOKENS,
+                    )
             return await asyncio.to_thread(
                 process_ingredient, 
                 ingredient, 
                 client, 
-                embeddings_titles_list, 
-                default_assistant
+                corpora, 
+                default_assistant,
+                retrieved_files
             )
         except Exception as exc:
             print(f'Processing {ingredient} generated an exception: {exc}')
             return None, []
 
-    tasks = [process_single_ingredient(ingredient) for ingredient in ingredients_list]
+    async def process_batch(positions):
+        batch = [ingredients_list[position] for position in positions]
+        batch_files = [retrieved_files_list[position] for position in positions]
+        try:
+            async with request_slots:
+                batch_results = await llm_scheduler.run(
+                    lambda: process_ingredient_batch_async(batch, batch_files, client, async_client, corpora, default_assistant),
+                    estimated_tokens=batch_token_estimate(len(batch), INGREDIENT_BATCH_BASE_TOKENS, INGREDIENT_BATCH_PER_INGREDIENT_TOKENS),
+                )
+        except Exception as exc:
+            print(f'Processing {batch} together generated an exception: {exc}')
+            batch_results = [None] * len(batch)
+        #Ingredients the batched answer left out are analyzed on their own
+        return await asyncio.gather(*[
+            asyncio.sleep(0, result) if result is not None else process_single_ingredient(ingredient, retrieved_files)
+            for ingredient, retrieved_files, result in zip(batch, batch_files, batch_results)
+        ])
+
+    if INGREDIENT_BATCHING and async_client is not None:
+        #Ingredients sharing articles (or all falling back to Ingredients.docx) are analyzed in one run per group
+        groups = group_ingredients(retrieved_files_list, INGREDIENT_BATCH_TOKEN_BUDGET, INGREDIENT_BATCH_BASE_TOKENS, INGREDIENT_BATCH_PER_INGREDIENT_TOKENS, INGREDIENT_BATCH_MAX_FILES)
+        print(f"DEBUG : {len(ingredients_list)} ingredients in {len(groups)} analysis runs")
+        group_results = await asyncio.gather(*[
+            process_batch(positions) if len(positions) > 1 else process_single_ingredient(ingredients_list[positions[0]], retrieved_files_list[positions[0]])
+            for positions in groups
+        ])
+        #Back in label order
+        for positions, result in zip(groups, group_results):
+            for position, ingredient_result in zip(positions, result if len(positions) > 1 else [result]):
+                results[misses[position]] = ingredient_result
+        return collect_ingredient_results(results)
+
+    tasks = [process_single_ingredient(ingredient, retrieved_files) for ingredient, retrieved_files in zip(ingredients_list, retrieved_files_list)]
     #tasks creates a list of coroutines (async functions)
     #asyncio.gather() runs these tasks concurrently
     #When a task is waiting (e.g., during an API call or I/O operation),
     #the event loop can switch to another task instead of sitting idle
-    results = await asyncio.gather(*tasks)
-    
+    for position, result in zip(misses, await asyncio.gather(*tasks)):
+        results[position] = result
+    return collect_ingredient_results(results)
+
+def collect_ingredient_results(results):
     all_ingredient_analysis = ""
     refs = []
     for result in results:
-        if result:
+        #Failed ingredients come back as None or (None, [])
+        if result and result[0] is not None:
             ingredient_analysis, refs_ingredient = result
             all_ingredient_analysis += ingredient_analysis
             refs.extend(refs_ingredient)
@@ -407,31 +789,38 @@ async def get_ingredient_analysis(payload):
         refs = []
         
         if len(ingredients_list) > 0:
-            #Create client
+            #Create clients: assistants and vector stores are managed with the sync client, runs and completions use the async one
             client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) as async_client:
 
-            #Create assistant for processing level
-            #assistant_p, embeddings_titles_list = create_assistant_and_embeddings(client, ['docs/embeddings.pkl', 'docs/embeddings_harvard.pkl'])
-            embeddings_file_list = ['docs/embeddings.pkl', 'docs/embeddings_harvard.pkl']
-            
-            embeddings_titles_list = []
-            for embeddings_file in embeddings_file_list:
-              embeddings_titles = []
-          
-              print(f"Reading {embeddings_file}")
-              # Load both sentences and embeddings
-              with open(embeddings_file, 'rb') as f:
-                  loaded_data = pickle.load(f)
-                  embeddings_titles = loaded_data['embeddings']
-                  embeddings_titles_list.append(embeddings_titles)
-          
-            processing_level = analyze_processing_level(ingredients_list, assistant_p_id, client) if ingredients_list else ""
-
-            print(f"DEBUG = processing level is {processing_level}")
-            
-            default_assistant = create_default_assistant(client)
-            print(f"Calling async_process_ingredients func of type {type(async_process_ingredients)}")
-            
-            refs, all_ingredient_analysis = await async_process_ingredients(ingredients_list, client, embeddings_titles_list, default_assistant)
+                #Retrieval indexes are loaded once per process and shared across requests
+                corpora = await asyncio.to_thread(get_corpora)
+
+                #The Ingredients.docx assistant is only needed when ingredients are analyzed through the Assistants API
+                #It is persisted, so this is a lookup after the first request of the deployment
+                default_assistant = await asyncio.to_thread(create_default_assistant, client) if INGREDIENT_ANALYSIS_MODE != "local" else None
+                print(f"Calling async_process_ingredients func of type {type(async_process_ingredients)}")
+
+                #The processing level run (on the caller's assistant, else the persisted one) and the ingredient runs are independent, so they are polled concurrently
+                processing_level, (refs, all_ingredient_analysis) = await asyncio.gather(
+                    llm_scheduler.run(lambda: run_with_static_assistant(
+                        client, "processing_level", lambda assistant_id: analyze_processing_level_async(ingredients_list, assistant_id, async_client), assistant_p_id
+                    )),
+                    async_process_ingredients(ingredients_list, client, corpora, default_assistant, async_client),
+                )
+
+                print(f"DEBUG = processing level is {processing_level}")
 
         return {'refs' : refs, 'all_ingredient_analysis' : all_ingredient_analysis, 'processing_level' : processing_level}
+
+class IngredientAnalysisRequest(BaseModel):
+    product_info_from_db: dict
+    #Processing Level assistant of the caller; the persisted static one is used when it is omitted or no longer exists
+    assistant_p_id: Optional[str] = None
+
+@app.post("/api/processing_level-ingredient-analysis")
+async def processing_level_ingredient_analysis_endpoint(request: IngredientAnalysisRequest):
+    try:
+        return await get_ingredient_analysis({"product_info_from_db": request.product_info_from_db, "assistant_p_id": request.assistant_p_id})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,59 @@
+import threading
+import time
+
+#Readiness of the heavy resources loaded by the startup warmup, plus import/startup timings for cold-start tracking
+_lock = threading.Lock()
+_components = {}
+_timings = {}
+
+def register_component(name):
+    with _lock:
+        _components.setdefault(name, {"ready": False, "seconds": None, "error": None})
+
+def record_timing(name, seconds):
+    with _lock:
+        _timings[name] = round(seconds, 3)
+
+def _run_step(name, step):
+    started = time.perf_counter()
+    try:
+        step()
+    except Exception as e:
+        print(f"Warmup of {name} failed : {e}")
+        with _lock:
+            _components[name]["error"] = str(e)
+        return False
+    with _lock:
+        _components[name] = {"ready": True, "seconds": round(time.perf_counter() - started, 3), "error": None}
+    return True
+
+def run_warmup(steps, started, retry_interval=5.0):
+    #steps is a list of (component name, callable). Failed steps are retried until every component is ready.
+    for name, _ in steps:
+        register_component(name)
+    pending = list(steps)
+    while pending:
+        pending = [(name, step) for name, step in pending if not _run_step(name, step)]
+        if pending:
+            time.sleep(retry_interval)
+    record_timing("startup_seconds", time.perf_counter() - started)
+    print(f"Warmup finished : {readiness()}")
+
+def start_warmup(steps, retry_interval=5.0):
+    #Runs the warmup on a daemon thread so that the server starts answering /healthz immediately
+    started = time.perf_counter()
+    for name, _ in steps:
+        register_component(name)
+    thread = threading.Thread(target=run_warmup, args=(steps, started, retry_interval), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+def readiness():
+    with _lock:
+        components = {name: dict(state) for name, state in _components.items()}
+        timings = dict(_timings)
+    return {
+        "ready": bool(components) and all(state["ready"] for state in components.values()),
+        "components": components,
+        "timings": timings,
+    }
@@ -0,0 +1,93 @@
+#Local retrieval-augmented analysis: the passages of the retrieved articles that best match an ingredient
+#are picked on this host and sent inline with a single chat completion, instead of uploading the articles
+#to a per-ingredient vector store for an assistant's file_search.
+import html
+import os
+import re
+import zipfile
+from functools import lru_cache
+from .retrieval import TitleMatrix
+from .bm25 import tokenize
+from .passages import read_article_words, split_passages
+from .passage_index import get_passage_index
+
+_article_name_pattern = re.compile(r"article(\d+)\.txt")
+_docx_paragraph_pattern = re.compile(r"<w:p[ >].*?</w:p>", re.S)
+_docx_text_pattern = re.compile(r"<w:t(?: [^>]*)?>([^<]*)</w:t>")
+
+@lru_cache(maxsize=8)
+def read_docx_words(path):
+    #Words of a .docx body, from the text runs of word/document.xml, one paragraph after another
+    with zipfile.ZipFile(path) as docx:
+        xml = docx.read("word/document.xml").decode("utf-8")
+    words = []
+    for paragraph in _docx_paragraph_pattern.findall(xml):
+        words.extend(html.unescape("".join(_docx_text_pattern.findall(paragraph))).split())
+    return tuple(words)
+
+def article_key(file_path, corpora):
+    #(source, article id) of a corpus article path, None for anything else (e.g. the .docx fallback)
+    folder, name = os.path.split(file_path)
+    match = _article_name_pattern.fullmatch(name)
+    if match is None:
+        return None
+    for corpus in corpora:
+        if corpus.folder_name == folder:
+            return corpus.source, int(match.group(1))
+    return None
+
+def rank_passages_lexically(ingredient, words, window):
+    #Spans ordered by the share of ingredient terms they contain; spans without any are dropped
+    query_tokens = set(tokenize(ingredient))
+    scored = []
+    for start, end in split_passages(words, window):
+        overlap = len(query_tokens & set(tokenize(" ".join(words[start:end]))))
+        if overlap > 0:
+            scored.append((overlap, start, end))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [(start, end) for _, start, end in scored]
+
+def rank_passages_densely(passage_index, rows, ingredient_embedding):
+    #Spans of the indexed passages of one article ordered by cosine similarity to the ingredient
+    scores = TitleMatrix.from_normalized(passage_index.passage_matrix.matrix[rows.start:rows.stop]).scores(ingredient_embedding)
+    order = sorted(range(len(rows)), key=lambda i: -scores[i])
+    return [tuple(int(x) for x in passage_index.passage_spans[rows.start + i]) for i in order]
+
+def select_context_passages(ingredient, file_paths, corpora, ingredient_embedding=None, max_passages=6, window=120):
+    """
+    Returns [(file_path, passage text)] to send with the prompt, at most max_passages. Articles are
+    ranked with the dense passage index when it is built, by ingredient term overlap otherwise.
+    Passages are taken round-robin by rank so every retrieved article contributes its best one first.
+    """
+    passage_index = get_passage_index() if ingredient_embedding is not None else None
+    ranked = []
+    for file_path in file_paths:
+        key = article_key(file_path, corpora)
+        if key is None:
+            if file_path.endswith(".docx"):
+                words = read_docx_words(file_path)
+                ranked.append((file_path, words, rank_passages_lexically(ingredient, words, window)))
+            continue
+
+        words = read_article_words(file_path)
+        rows = passage_index.article_passages(*key) if passage_index is not None else range(0)
+        if len(rows):
+            spans = rank_passages_densely(passage_index, rows, ingredient_embedding)
+        else:
+            #The article was retrieved as relevant, so its opening passage is used when no passage names the ingredient
+            spans = rank_passages_lexically(ingredient, words, window) or split_passages(words, window)[:1]
+        ranked.append((file_path, words, spans))
+
+    selected = []
+    for rank in range(max((len(spans) for _, _, spans in ranked), default=0)):
+        for file_path, words, spans in ranked:
+            if rank < len(spans):
+                start, end = spans[rank]
+                selected.append((file_path, " ".join(words[start:end])))
+                if len(selected) == max_passages:
+                    return selected
+    return selected
+
+def format_context(passages):
+    #Numbered document excerpts for the system prompt
+    return "\n\n".join(f"[{i}] ({file_path})\n{text}" for i, (file_path, text) in enumerate(passages, 1))
@@ -1,5 +1,11 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from openai import OpenAI
 
 # Import your individual API apps
 from .data_extractor import app as data_extractor_app
@@ -7,6 +13,16 @@ from .nutrient_analyzer import app as nutrient_analyzer_app
 from .ingredients_analysis import app as ingredients_analyzer_app
 from .claims_analysis import app as claims_analyzer_app
 from .cumulative_analysis import app as cumulative_analyzer_app
+from .corpus import get_corpora
+from .ingredients_analysis import embedding_batcher, embedding_cache, encode_texts, assistant_pool, analysis_store, semantic_cache
+from .data_extractor import ping_db
+from .file_registry import get_file_registry
+from .scheduler import llm_scheduler
+from .lifecycle import readiness, record_timing, start_warmup
+from .resource_ledger import get_resource_ledger, start_sweeper
+from .config import RESOURCE_SWEEPER, RESOURCE_SWEEP_INTERVAL_SECONDS, EMBEDDING_SERVER_SOCKET
+
+record_timing("import_seconds", time.perf_counter() - IMPORT_STARTED)
 
 main_app = FastAPI()
 
@@ -26,7 +42,78 @@ main_app.mount("/ingredient_analysis", ingredients_analyzer_app)
 main_app.mount("/claims_analysis", claims_analyzer_app)
 main_app.mount("/cumulative_analysis", cumulative_analyzer_app)
 
+# Heavy resources load in a background warmup; requests arriving earlier load them lazily on first use
+WARMUP_STEPS = [
+    ("corpora", get_corpora),
+    ("db", ping_db),
+]
+# With the embedding sidecar the model is loaded once in the sidecar, not in every worker
+if not EMBEDDING_SERVER_SOCKET:
+    WARMUP_STEPS.insert(0, ("model", lambda: encode_texts(["warmup"])))
+
+@main_app.on_event("startup")
+async def warmup():
+    start_warmup(WARMUP_STEPS)
+    if RESOURCE_SWEEPER:
+        start_sweeper(lambda: OpenAI(api_key=os.getenv("OPENAI_API_KEY")), RESOURCE_SWEEP_INTERVAL_SECONDS)
+
+# Pooled assistants are not reusable by the next process, so they are deleted on shutdown
+@main_app.on_event("shutdown")
+async def delete_pooled_assistants():
+    assistant_pool.clear()
+
+# Liveness: the process is up and serving
+@main_app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness: the model, the retrieval indexes and the DB connection are loaded
+@main_app.get("/readyz")
+async def readyz():
+    state = readiness()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
 # Optional: Add a root endpoint
 @main_app.get("/")
 async def root():
     return {"message": "Main application"}
+
+# Queue depth and batch size statistics of the shared MiniLM encoder
+@main_app.get("/embedding_batcher/stats")
+async def embedding_batcher_stats():
+    return embedding_batcher.stats()
+
+# Hit/miss counters of the ingredient embedding cache
+@main_app.get("/embedding_cache/stats")
+async def embedding_cache_stats():
+    return embedding_cache.stats()
+
+# Upload hits/misses of the registry of OpenAI file IDs
+@main_app.get("/file_registry/stats")
+async def file_registry_stats():
+    return get_file_registry().stats()
+
+# Size and hit rate of the pool of ingredient assistants
+@main_app.get("/assistant_pool/stats")
+async def assistant_pool_stats():
+    return assistant_pool.stats()
+
+# Live assistants, vector stores and files by kind and owner, and sweeper counters
+@main_app.get("/resource_ledger/stats")
+async def resource_ledger_stats():
+    return get_resource_ledger().stats()
+
+# Running and queued LLM calls, queue wait and rate-limit counters of the shared scheduler
+@main_app.get("/llm_scheduler/stats")
+async def llm_scheduler_stats():
+    return llm_scheduler.stats()
+
+# Reused versus recomputed ingredient analyses
+@main_app.get("/analysis_store/stats")
+async def analysis_store_stats():
+    return analysis_store.stats()
+
+# Near-duplicate hits, false-friend rejections and misses of the semantic layer over the analysis store
+@main_app.get("/semantic_cache/stats")
+async def semantic_cache_stats():
+    return semantic_cache.stats()
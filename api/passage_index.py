@@ -0,0 +1,103 @@
+import os
+import threading
+import numpy as np
+from .retrieval import TitleMatrix, top_k
+from .embedding_store import open_embedding_store
+from .passages import passage_text
+
+#Built by utils/build_corpus.py --passages: passage embeddings in a memory-mapped store plus the passage-to-article map
+PASSAGE_STORE_FILE = "docs/passages.emb"
+PASSAGE_MAP_FILE = "docs/passages.map.npz"
+
+def passage_label(source, article_id, start, end):
+    #Row label written to the store's .titles sidecar, e.g. ncbi/12:80-200
+    return f"{source}/{article_id}:{start}-{end}"
+
+def write_passage_map(path, sources, passage_sources, passage_articles, passage_spans):
+    #Passages are stored grouped by article, so article_offsets[i]:article_offsets[i + 1] are the passages of article_keys[i]
+    passage_sources = np.asarray(passage_sources, dtype=np.int8)
+    passage_articles = np.asarray(passage_articles, dtype=np.int32)
+    starts = np.flatnonzero(np.concatenate(([True], (passage_sources[1:] != passage_sources[:-1]) | (passage_articles[1:] != passage_articles[:-1]))))
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(
+        tmp_path,
+        sources=np.array(sources),
+        passage_sources=passage_sources,
+        passage_articles=passage_articles,
+        passage_spans=np.asarray(passage_spans, dtype=np.int32).reshape(-1, 2),
+        article_keys=np.stack([passage_sources[starts], passage_articles[starts]], axis=1).astype(np.int32),
+        article_offsets=np.append(starts, len(passage_articles)).astype(np.int64),
+    )
+    os.replace(tmp_path, path)
+
+class PassageIndex:
+    """
+    Dense index over overlapping article passages. Passage embeddings live in a memory-mapped,
+    row-normalized matrix; each row maps back to its corpus, article and word span.
+    """
+
+    def __init__(self, passage_matrix, sources, passage_sources, passage_articles, passage_spans, article_keys, article_offsets):
+        if len(passage_matrix) != len(passage_articles):
+            raise ValueError(f"{len(passage_matrix)} passage embeddings but {len(passage_articles)} mapped passages")
+        self.passage_matrix = passage_matrix
+        self.sources = sources
+        self.passage_sources = passage_sources
+        self.passage_articles = passage_articles
+        self.passage_spans = passage_spans
+        self.article_keys = article_keys
+        self.article_offsets = article_offsets
+
+    @classmethod
+    def load(cls, store_file=PASSAGE_STORE_FILE, map_file=PASSAGE_MAP_FILE):
+        store = open_embedding_store(store_file)
+        data = np.load(map_file)
+        return cls(
+            TitleMatrix.from_normalized(store.matrix), [str(source) for source in data["sources"]],
+            data["passage_sources"], data["passage_articles"], data["passage_spans"], data["article_keys"], data["article_offsets"],
+        )
+
+    def __len__(self):
+        return len(self.passage_matrix)
+
+    def search_articles_batch(self, queries, N=2, candidates=50):
+        #Per query: [(source, article id, best passage cosine_sim, passage id)] for the N best articles, one entry per article
+        results = []
+        for query_scores in self.passage_matrix.score_batch(queries):
+            hits = []
+            seen = set()
+            for passage_id in top_k(query_scores, max(candidates, N)):
+                key = (int(self.passage_sources[passage_id]), int(self.passage_articles[passage_id]))
+                if key in seen:
+                    continue
+                seen.add(key)
+                hits.append((self.sources[key[0]], key[1], float(query_scores[passage_id]), int(passage_id)))
+                if len(hits) == N:
+                    break
+            results.append(hits)
+        return results
+
+    def article_passages(self, source, article_id):
+        #Passage ids of one article, from the article offsets
+        source_id = self.sources.index(source)
+        matches = np.flatnonzero((self.article_keys[:, 0] == source_id) & (self.article_keys[:, 1] == article_id))
+        if len(matches) == 0:
+            return range(0)
+        return range(int(self.article_offsets[matches[0]]), int(self.article_offsets[matches[0] + 1]))
+
+    def passage(self, passage_id, folder_by_source):
+        source = self.sources[self.passage_sources[passage_id]]
+        start, end = self.passage_spans[passage_id]
+        return passage_text(f"{folder_by_source[source]}/article{int(self.passage_articles[passage_id])}.txt", int(start), int(end))
+
+_passage_index = None
+_passage_lock = threading.Lock()
+
+def get_passage_index():
+    #Loaded once per process; None when the passage index has not been built
+    global _passage_index
+    if _passage_index is None and os.path.exists(PASSAGE_STORE_FILE) and os.path.exists(PASSAGE_MAP_FILE):
+        with _passage_lock:
+            if _passage_index is None:
+                print(f"Mapping {PASSAGE_STORE_FILE}")
+                _passage_index = PassageIndex.load()
+    return _passage_index
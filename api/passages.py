@@ -0,0 +1,30 @@
+#Splits articles into word windows ("passages") for the local lexical and passage-level indexes.
+#Passages are identified by (article id, start word, end word) over the body returned by read_article_words,
+#so their text can always be re-read from the article without being stored in the index.
+
+def read_article_words(article_path):
+    #Words of the article body: everything before the "References:" marker, title line included
+    words = []
+    with open(article_path, 'r') as f:
+        for line in f:
+            if line.strip() == "References:":
+                break
+            words.extend(line.split())
+    return words
+
+def split_passages(words, window=120, overlap=0):
+    #[(start, end)] word ranges of consecutive windows; the last window may be shorter
+    if window <= overlap:
+        raise ValueError(f"window ({window}) must be larger than overlap ({overlap})")
+    spans = []
+    start = 0
+    while start < len(words):
+        end = min(start + window, len(words))
+        spans.append((start, end))
+        if end == len(words):
+            break
+        start = end - overlap
+    return spans
+
+def passage_text(article_path, start, end):
+    return " ".join(read_article_words(article_path)[start:end])
@@ -0,0 +1,52 @@
+import numpy as np
+from .retrieval import normalize_rows, to_float32_matrix, top_k, SCORE_BLOCK_ROWS
+
+class QuantizedTitleMatrix:
+    """
+    Coarse-to-fine title search. Every title is scored against a compact int8 (with per-vector
+    scales) or float16 copy of the embeddings, and only the best rescore_k rows are rescored
+    against the float32 TitleMatrix. The TitleMatrix must be the memory-mapped float32 store, so
+    only the shortlisted rows are ever paged in; without one (title_matrix None) the coarse scores
+    are returned as they are.
+    """
+
+    def __init__(self, codes, title_matrix, scales=None, rescore_k=32):
+        if title_matrix is not None and codes.shape != title_matrix.matrix.shape:
+            raise ValueError(f"Quantized matrix has shape {codes.shape} but the embedding matrix has {title_matrix.matrix.shape}")
+        self.codes = codes
+        self.scales = scales
+        self.title_matrix = title_matrix
+        self.rescore_k = rescore_k
+
+    @property
+    def matrix(self):
+        return self.title_matrix.matrix if self.title_matrix is not None else self.codes
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def coarse_scores(self, queries):
+        scores = np.empty((queries.shape[0], self.codes.shape[0]), dtype=np.float32)
+        for start in range(0, self.codes.shape[0], SCORE_BLOCK_ROWS):
+            block = self.codes[start:start + SCORE_BLOCK_ROWS]
+            block_scores = queries @ block.astype(np.float32).T
+            if self.scales is not None:
+                block_scores *= self.scales[start:start + block.shape[0]]
+            scores[:, start:start + block.shape[0]] = block_scores
+        return scores
+
+    def search(self, query, N=2):
+        return self.search_batch(query, N)[0]
+
+    def search_batch(self, queries, N=2):
+        #Same output as TitleMatrix.search_batch: one [(row, cosine_sim)] list per query, best first
+        queries = normalize_rows(to_float32_matrix(queries).reshape(-1, self.codes.shape[1]))
+        results = []
+        for query, query_scores in zip(queries, self.coarse_scores(queries)):
+            if self.title_matrix is None:
+                results.append([(int(row), float(query_scores[row])) for row in top_k(query_scores, N)])
+                continue
+            shortlist = np.sort(top_k(query_scores, max(N, self.rescore_k)))
+            exact = np.asarray(self.title_matrix.matrix[shortlist], dtype=np.float32) @ query
+            results.append([(int(shortlist[i]), float(exact[i])) for i in top_k(exact, N)])
+        return results
@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import threading
+import time
+import openai
+from .config import MONGODB_URL, FILE_REGISTRY_BACKEND, RESOURCE_LEDGER_FILE, RESOURCE_SWEEP_BATCH_SIZE, RESOURCE_SWEEP_RATE
+
+#Remote OpenAI objects created by the API, by kind
+KINDS = ("assistant", "vector_store", "file")
+#Delay before a failed delete is retried
+SWEEP_RETRY_SECONDS = 300
+
+def delete_remote(client, kind, remote_id):
+    if kind == "assistant":
+        client.beta.assistants.delete(remote_id)
+    elif kind == "vector_store":
+        client.beta.vector_stores.delete(remote_id)
+    elif kind == "file":
+        client.files.delete(remote_id)
+    else:
+        raise ValueError(f"Unknown resource kind {kind}")
+
+class SqliteLedgerStore:
+    #Ledger rows in a local SQLite table; expires_at and deleted_at are NULL until set
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _db(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS resources (remote_id TEXT PRIMARY KEY, kind TEXT, owner TEXT, created_at REAL, expires_at REAL, deleted_at REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS resources_expiry ON resources (deleted_at, expires_at)")
+            self._connection.commit()
+        return self._connection
+
+    def insert(self, record):
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO resources (remote_id, kind, owner, created_at, expires_at, deleted_at) VALUES (?, ?, ?, ?, ?, NULL)",
+                (record["remote_id"], record["kind"], record["owner"], record["created_at"], record["expires_at"]),
+            )
+            self._db().commit()
+
+    def update(self, remote_id, **fields):
+        with self._lock:
+            assignments = ", ".join(f"{field} = ?" for field in fields)
+            self._db().execute(f"UPDATE resources SET {assignments} WHERE remote_id = ?", [*fields.values(), remote_id])
+            self._db().commit()
+
+    def expired(self, now, limit):
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT remote_id, kind, owner, created_at, expires_at FROM resources WHERE deleted_at IS NULL AND expires_at <= ? ORDER BY expires_at LIMIT ?",
+                (now, limit),
+            ).fetchall()
+        return [dict(zip(("remote_id", "kind", "owner", "created_at", "expires_at"), row)) for row in rows]
+
+    def is_tracked(self, remote_id):
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM resources WHERE remote_id = ? AND deleted_at IS NULL", (remote_id,)).fetchone() is not None
+
+    def live_counts(self, now):
+        #{(kind, owner): (live, expired)} over rows not deleted yet
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT kind, owner, COUNT(*), SUM(CASE WHEN expires_at <= ? THEN 1 ELSE 0 END) FROM resources WHERE deleted_at IS NULL GROUP BY kind, owner",
+                (now,),
+            ).fetchall()
+        return {(kind, owner): (live, expired or 0) for kind, owner, live, expired in rows}
+
+class MongoLedgerStore:
+    #Ledger documents in MongoDB, shared by every host of the deployment
+
+    def __init__(self, url, database="consumeWise", collection="remote_resources"):
+        self.url = url
+        self.database = database
+        self.collection_name = collection
+        self._collection = None
+        self._lock = threading.Lock()
+
+    def _records(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    from pymongo import MongoClient
+                    self._collection = MongoClient(self.url)[self.database][self.collection_name]
+                    self._collection.create_index("remote_id", unique=True)
+                    self._collection.create_index([("deleted_at", 1), ("expires_at", 1)])
+        return self._collection
+
+    def insert(self, record):
+        self._records().replace_one({"remote_id": record["remote_id"]}, {**record, "deleted_at": None}, upsert=True)
+
+    def update(self, remote_id, **fields):
+        self._records().update_one({"remote_id": remote_id}, {"$set": fields})
+
+    def expired(self, now, limit):
+        query = {"deleted_at": None, "expires_at": {"$ne": None, "$lte": now}}
+        return list(self._records().find(query, {"_id": 0, "deleted_at": 0}).sort("expires_at", 1).limit(limit))
+
+    def is_tracked(self, remote_id):
+        return self._records().count_documents({"remote_id": remote_id, "deleted_at": None}, limit=1) > 0
+
+    def live_counts(self, now):
+        counts = {}
+        for record in self._records().find({"deleted_at": None}, {"_id": 0, "kind": 1, "owner": 1, "expires_at": 1}):
+            live, expired = counts.get((record["kind"], record["owner"]), (0, 0))
+            is_expired = record.get("expires_at") is not None and record["expires_at"] <= now
+            counts[(record["kind"], record["owner"])] = (live + 1, expired + int(is_expired))
+        return counts
+
+class ResourceLedger:
+    """
+    Ledger of every assistant, vector store and file the API creates, with its owner, creation time
+    and optional expiry. Owners delete their objects through delete_now when they can; whatever is
+    left past its expiry (crashed workers, failed deletes, superseded uploads) is removed by sweep.
+    """
+
+    def __init__(self, store, batch_size=RESOURCE_SWEEP_BATCH_SIZE, rate=RESOURCE_SWEEP_RATE):
+        self.store = store
+        self.batch_size = batch_size
+        self.rate = rate
+        self._lock = threading.Lock()
+        self.swept = 0
+        self.sweep_errors = 0
+        self.last_sweep = None
+
+    def record(self, kind, remote_id, owner, ttl=None):
+        #ttl None keeps the object until its owner deletes or expires it
+        now = time.time()
+        self.store.insert({"remote_id": remote_id, "kind": kind, "owner": owner, "created_at": now, "expires_at": now + ttl if ttl is not None else None})
+
+    def expire(self, remote_id, delay=0.0):
+        #Hands the object over to the sweeper after delay seconds
+        self.store.update(remote_id, expires_at=time.time() + delay)
+
+    def claim(self, kind, remote_id, owner):
+        #Hands an object over to owner and keeps it until that owner deletes or expires it
+        if self.store.is_tracked(remote_id):
+            self.store.update(remote_id, owner=owner, expires_at=None)
+        else:
+            self.record(kind, remote_id, owner)
+
+    def mark_deleted(self, remote_id):
+        self.store.update(remote_id, deleted_at=time.time())
+
+    def delete_now(self, client, kind, remote_id):
+        #Deletes an object right away; on failure it is expired so the sweeper retries it
+        try:
+            delete_remote(client, kind, remote_id)
+        except openai.NotFoundError:
+            pass
+        except Exception as e:
+            print(f"Failed to delete {kind} {remote_id}, leaving it to the sweeper : {e}")
+            self.expire(remote_id)
+            return False
+        self.mark_deleted(remote_id)
+        return True
+
+    def sweep(self, client, dry_run=False, max_batches=None):
+        #Deletes expired objects in batches, at most rate deletes per second; returns the records handled
+        if dry_run:
+            records = self.store.expired(time.time(), 1 << 31)
+            for record in records:
+                print(f"Would delete {record['kind']} {record['remote_id']} (owner {record['owner']})")
+            return records
+
+        handled = []
+        interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = self.store.expired(time.time(), self.batch_size)
+            if not batch:
+                break
+            batches += 1
+            for record in batch:
+                started = time.monotonic()
+                try:
+                    delete_remote(client, record["kind"], record["remote_id"])
+                except openai.NotFoundError:
+                    pass
+                except Exception as e:
+                    print(f"Failed to delete {record['kind']} {record['remote_id']} : {e}")
+                    with self._lock:
+                        self.sweep_errors += 1
+                    #Pushed back so the rest of the sweep moves on; retried by a later sweep
+                    self.store.update(record["remote_id"], expires_at=time.time() + SWEEP_RETRY_SECONDS)
+                    continue
+                self.mark_deleted(record["remote_id"])
+                handled.append(record)
+                with self._lock:
+                    self.swept += 1
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        self.last_sweep = time.time()
+        return handled
+
+    def stats(self):
+        counts = self.store.live_counts(time.time())
+        by_kind = {kind: sum(live for (count_kind, _), (live, _) in counts.items() if count_kind == kind) for kind in KINDS}
+        with self._lock:
+            return {
+                "live": by_kind,
+                "live_by_owner": {f"{kind}/{owner}": live for (kind, owner), (live, _) in counts.items()},
+                "expired_pending": sum(expired for _, expired in counts.values()),
+                "swept": self.swept,
+                "sweep_errors": self.sweep_errors,
+                "last_sweep": self.last_sweep,
+            }
+
+_resource_ledger = None
+_resource_ledger_lock = threading.Lock()
+
+def get_resource_ledger():
+    global _resource_ledger
+    if _resource_ledger is None:
+        with _resource_ledger_lock:
+            if _resource_ledger is None:
+                store = MongoLedgerStore(MONGODB_URL) if FILE_REGISTRY_BACKEND == "mongo" else SqliteLedgerStore(RESOURCE_LEDGER_FILE)
+                _resource_ledger = ResourceLedger(store)
+    return _resource_ledger
+
+_sweeper_thread = None
+_sweeper_lock = threading.Lock()
+
+def start_sweeper(client_factory, interval):
+    #Sweeps expired objects every interval seconds on a daemon thread; one per process, so entry points
+    #that rerun (the Streamlit script) or start several hooks can call it freely
+    global _sweeper_thread
+    with _sweeper_lock:
+        if _sweeper_thread is not None and _sweeper_thread.is_alive():
+            return _sweeper_thread
+
+        def run():
+            client = client_factory()
+            while True:
+                try:
+                    handled = get_resource_ledger().sweep(client)
+                    if handled:
+                        print(f"Resource sweeper deleted {len(handled)} expired objects")
+                except Exception as e:
+                    print(f"Resource sweep failed : {e}")
+                time.sleep(interval)
+
+        _sweeper_thread = threading.Thread(target=run, name="resource-sweeper", daemon=True)
+        _sweeper_thread.start()
+        return _sweeper_thread
@@ -0,0 +1,81 @@
+import hashlib
+import numpy as np
+
+#Rows scored per block when the matrix is stored in a narrower dtype than float32
+SCORE_BLOCK_ROWS = 4096
+
+def to_float32_matrix(embeddings):
+    #Accepts a 2D torch tensor, a numpy array or a list of 1D vectors (as stored in the .pkl files)
+    if hasattr(embeddings, "detach"):
+        return np.ascontiguousarray(embeddings.detach().cpu().numpy(), dtype=np.float32)
+    if isinstance(embeddings, np.ndarray):
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    rows = [e.detach().cpu().numpy() if hasattr(e, "detach") else np.asarray(e) for e in embeddings]
+    return np.ascontiguousarray(np.stack(rows).reshape(len(rows), -1), dtype=np.float32)
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def matrix_hash(matrix):
+    #sha256 of the rows as float32, read block by block so a memory-mapped matrix is never copied whole.
+    #Stored in .emb headers and .ivf.npz files so that files built from different embeddings are not mixed
+    digest = hashlib.sha256()
+    for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+        digest.update(np.ascontiguousarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+def top_k(scores, k):
+    #Partial selection of the k best scores followed by a sort of only those k entries
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[-1]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[-1])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+class TitleMatrix:
+    """
+    Title embeddings held as one contiguous, row-normalized float32 matrix so that
+    an ingredient is scored against every title with a single matrix-vector product.
+    """
+
+    def __init__(self, embeddings):
+        self.matrix = np.ascontiguousarray(normalize_rows(to_float32_matrix(embeddings)), dtype=np.float32)
+
+    @classmethod
+    def from_normalized(cls, matrix):
+        #Wraps an already row-normalized matrix (e.g. a read-only np.memmap) without copying it
+        title_matrix = cls.__new__(cls)
+        title_matrix.matrix = matrix
+        return title_matrix
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def score_batch(self, queries):
+        #(B, dim) queries -> (B, rows) cosine similarities from one matrix product
+        queries = normalize_rows(to_float32_matrix(queries).reshape(-1, self.matrix.shape[1]))
+        if self.matrix.dtype == np.float32:
+            return queries @ self.matrix.T
+        #float16 stores are upcast block by block so that scoring never materializes a full float32 copy
+        scores = np.empty((queries.shape[0], self.matrix.shape[0]), dtype=np.float32)
+        for start in range(0, self.matrix.shape[0], SCORE_BLOCK_ROWS):
+            block = self.matrix[start:start + SCORE_BLOCK_ROWS]
+            scores[:, start:start + block.shape[0]] = queries @ block.astype(np.float32).T
+        return scores
+
+    def scores(self, query):
+        return self.score_batch(query)[0]
+
+    def search(self, query, N=2):
+        #Returns [(row, cosine_sim)] for the N most similar titles, best first
+        return self.search_batch(query, N)[0]
+
+    def search_batch(self, queries, N=2):
+        #One [(row, cosine_sim)] list per query
+        scores = self.score_batch(queries)
+        return [[(int(row), float(query_scores[row])) for row in top_k(query_scores, N)] for query_scores in scores]
@@ -0,0 +1,170 @@
+#Shared admission control for LLM calls. Every analysis (an assistant run or a chat completion) takes a
+#global concurrency slot and draws from request and token budgets before it starts; a 429 pauses
+#admission for the whole process for the retry-after the API asks for, and the call is retried.
+#State is guarded by a threading lock and waiters are woken through their own event loop, so the
+#scheduler can be shared by the FastAPI loop and the short-lived loops of the Streamlit app.
+import asyncio
+import threading
+import time
+from collections import deque
+import openai
+from .async_runs import RunRateLimited
+from .config import LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_RETRIES
+
+class TokenBucket:
+    #capacity units, refilled continuously at capacity per minute; a rate of 0 disables the bucket
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        #Seconds until amount is available; amounts above capacity only wait for a full bucket
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.available) / self.rate)
+
+    def take(self, amount):
+        if self.rate > 0:
+            self.available -= min(amount, self.capacity)
+
+def retry_after_seconds(error, attempt):
+    #Server-provided delay of a rate-limit error, exponential backoff when there is none
+    if isinstance(error, RunRateLimited) and error.retry_after is not None:
+        return error.retry_after
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    return min(2.0 ** attempt, 60.0)
+
+class LLMScheduler:
+    """
+    Global concurrency cap plus request-per-minute and token-per-minute budgets for LLM calls.
+    run() queues a call until it is admitted, and retries it after the server's retry-after when it
+    is rate limited, so overload turns into queueing time instead of failed ingredients.
+    """
+
+    def __init__(self, max_concurrency, requests_per_minute, tokens_per_minute, max_retries=5):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waiters = deque()
+        self._paused_until = 0.0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def _acquire_slot(self):
+        with self._lock:
+            if self._running < self.max_concurrency and not self._waiters:
+                self._running += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            #The releasing call hands its slot over, so _running is not decremented in between
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+                    raise
+            #The slot was handed over just as this waiter was cancelled; pass it on
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                if loop.is_closed():
+                    continue
+                loop.call_soon_threadsafe(lambda waiter=waiter: waiter.done() or waiter.set_result(None))
+                return
+            self._running -= 1
+
+    async def _wait_budget(self, estimated_tokens):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = max(self._paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(estimated_tokens, now))
+                if delay <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(estimated_tokens)
+                    return
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        #Holds back every new call for seconds, e.g. after a 429
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def run(self, call, estimated_tokens=1000):
+        #call is a zero-argument coroutine function; it is called again on each retry
+        queued = time.monotonic()
+        await self._acquire_slot()
+        try:
+            attempt = 0
+            while True:
+                await self._wait_budget(estimated_tokens)
+                if attempt == 0:
+                    waited = time.monotonic() - queued
+                    with self._lock:
+                        self.admitted += 1
+                        self.total_wait += waited
+                        self.max_wait = max(self.max_wait, waited)
+                try:
+                    return await call()
+                except (openai.RateLimitError, RunRateLimited) as e:
+                    with self._lock:
+                        self.rate_limited += 1
+                    if attempt >= self.max_retries:
+                        with self._lock:
+                            self.failed += 1
+                        raise
+                    delay = retry_after_seconds(e, attempt)
+                    print(f"Rate limited, retrying in {delay:.1f}s (attempt {attempt + 1} of {self.max_retries}) : {e}")
+                    self.pause(delay)
+                    attempt += 1
+        finally:
+            self._release_slot()
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "running": self._running,
+                "queued": len(self._waiters),
+                "max_concurrency": self.max_concurrency,
+                "admitted": self.admitted,
+                "rate_limited": self.rate_limited,
+                "failed": self.failed,
+                "avg_queue_wait_ms": 1000 * self.total_wait / self.admitted if self.admitted else 0.0,
+                "max_queue_wait_ms": 1000 * self.max_wait,
+                "paused_for_ms": max(0.0, 1000 * (self._paused_until - now)),
+                "request_budget": self.requests.available if self.requests.rate > 0 else None,
+                "token_budget": self.tokens.available if self.tokens.rate > 0 else None,
+            }
+
+#One scheduler per process, shared by ingredient, processing level and claims analyses
+llm_scheduler = LLMScheduler(LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, max_retries=LLM_MAX_RETRIES)
@@ -0,0 +1,161 @@
+#Near-duplicate lookups for the analysis store. Labels spell one ingredient many ways ("Iodised Salt",
+#"Iodized salt", "Salt (Iodised)"), so an ingredient that misses the exact key reuses the stored analysis
+#of the most similar ingredient name, by cosine similarity of their MiniLM embeddings.
+import json
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+from .analysis_store import analysis_name
+
+#Pairs that embed close together but are different ingredients
+FALSE_FRIEND_PAIRS = {frozenset(pair) for pair in [
+    ("sugar", "sugar free"),
+    ("salt", "low sodium salt"),
+    ("sodium chloride", "potassium chloride"),
+    ("corn syrup", "high fructose corn syrup"),
+    ("palm oil", "palm kernel oil"),
+    ("coconut oil", "coconut milk"),
+    ("wheat flour", "refined wheat flour"),
+    ("whole wheat flour", "refined wheat flour"),
+    ("milk solids", "milk solids non fat"),
+    ("vegetable oil", "hydrogenated vegetable oil"),
+    ("cocoa butter", "cocoa butter equivalent"),
+    ("sucrose", "sucralose"),
+]}
+
+#Words that change what an ingredient is; names differing in any of them are never treated as the same
+DISTINGUISHING_WORDS = {"free", "low", "reduced", "no", "non", "hydrogenated", "partially", "refined", "whole", "skimmed", "artificial", "substitute", "equivalent", "modified", "flavour", "flavor", "extract"}
+
+#Additive codes such as "e102", "ins 471" or "e 322(i)"; "colour (e102)" and "colour (e150d)" are different additives
+_additive_code_pattern = re.compile(r"\b(?:ins|e)\s*-?\s*(\d+[a-z]?(?:\s*\([ivx]+\))?)")
+
+def _additive_codes(name):
+    return {re.sub(r"\s+", "", code) for code in _additive_code_pattern.findall(name)}
+
+def _words(name):
+    return set(name.replace("(", " ").replace(")", " ").replace("-", " ").split())
+
+def is_false_friend(name, other):
+    #name and other are analysis_name()s
+    if frozenset((name, other)) in FALSE_FRIEND_PAIRS:
+        return True
+    if _additive_codes(name) != _additive_codes(other):
+        return True
+    return bool((_words(name) ^ _words(other)) & DISTINGUISHING_WORDS)
+
+class SemanticAnalysisCache:
+    """
+    Index of the ingredient names in an AnalysisStore with their unit embeddings. lookup() returns the
+    stored analysis of the most similar name at or above threshold that is not a false friend, or None.
+    The index lives in a SQLite table next to the store, so names analyzed by other workers are picked
+    up incrementally.
+    """
+
+    def __init__(self, path, store, threshold=0.9):
+        self.path = path
+        self.store = store
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._connection = None
+        self._names = []
+        self._file_paths = []
+        self._positions = {}
+        self._matrix = None
+        self._last_rowid = 0
+        self.lookups = 0
+        self.hits = 0
+        self.guarded = 0
+        self.stale = 0
+        self.misses = 0
+
+    def _db(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS semantic_index (version TEXT, name TEXT, file_paths TEXT, vector BLOB, PRIMARY KEY (version, name))")
+            self._connection.commit()
+        return self._connection
+
+    def _add(self, name, file_paths, vector):
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        position = self._positions.get(name)
+        if position is not None:
+            self._file_paths[position] = file_paths
+            self._matrix[position] = vector
+            return
+        self._positions[name] = len(self._names)
+        self._names.append(name)
+        self._file_paths.append(file_paths)
+        self._matrix = vector[None, :] if self._matrix is None else np.vstack([self._matrix, vector])
+
+    def _refresh(self):
+        #Rows written since the last refresh, by this or any other worker
+        rows = self._db().execute(
+            "SELECT rowid, name, file_paths, vector FROM semantic_index WHERE version = ? AND rowid > ? ORDER BY rowid",
+            (self.store.version, self._last_rowid),
+        ).fetchall()
+        for rowid, name, file_paths, blob in rows:
+            self._add(name, json.loads(file_paths), np.frombuffer(blob, dtype=np.float32))
+            self._last_rowid = max(self._last_rowid, rowid)
+
+    def add(self, ingredient, file_paths, vector):
+        #Called with every analysis written to the store; the latest article set of a name wins
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO semantic_index (version, name, file_paths, vector) VALUES (?, ?, ?, ?)",
+                (self.store.version, analysis_name(ingredient), json.dumps(sorted(file_paths)), vector.tobytes()),
+            )
+            self._db().commit()
+
+    def lookup(self, ingredient, vector):
+        #(ingredient_analysis, refs, is_ingredient_not_found_in_doc) of the nearest stored ingredient, None otherwise
+        name = analysis_name(ingredient)
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            self.lookups += 1
+            self._refresh()
+            if self._matrix is None:
+                self.misses += 1
+                return None
+            similarities = self._matrix @ vector
+            candidates = [(position, similarities[position]) for position in np.argsort(-similarities) if similarities[position] >= self.threshold]
+            candidates = [(self._names[position], self._file_paths[position], similarity) for position, similarity in candidates if self._names[position] != name]
+        guarded = False
+        for other, file_paths, similarity in candidates:
+            if is_false_friend(name, other):
+                guarded = True
+                continue
+            entry = self.store.get(other, file_paths)
+            if entry is not None:
+                print(f"DEBUG : Reusing analysis of {other} for {ingredient} (similarity {similarity:.3f})")
+                with self._lock:
+                    self.hits += 1
+                return entry
+        with self._lock:
+            if guarded:
+                self.guarded += 1
+            elif candidates:
+                #Similar enough, but the stored analysis has expired
+                self.stale += 1
+            else:
+                self.misses += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "guarded": self.guarded,
+                "stale": self.stale,
+                "misses": self.misses,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "threshold": self.threshold,
+                "indexed_names": len(self._names),
+            }
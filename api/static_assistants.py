@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import openai
+from .file_registry import file_sha256
+from .resource_ledger import get_resource_ledger
+from .config import MONGODB_URL, FILE_REGISTRY_BACKEND, STATIC_ASSISTANTS_FILE, STATIC_ASSISTANT_MODEL, DOCX_FALLBACK_FILE
+
+#Knowledge assistants over a fixed document. They are created once per deployment and reused by every
+#request, process and restart until their document, model or instructions change.
+STATIC_ASSISTANT_SPECS = {
+    "ingredients": {
+        "name": "Harmful Ingredients",
+        "instructions": "You are an expert dietician. Use your knowledge base to answer questions about a given ingredient in a food product.",
+        "vector_store_name": "Harmful Ingredients Vec",
+        "file_path": DOCX_FALLBACK_FILE,
+        "chunking_strategy": {
+            "type": "static",
+            "static": {
+                "max_chunk_size_tokens": 400,
+                "chunk_overlap_tokens": 200
+            }
+        },
+    },
+    "claims": {
+        "name": "Misleading Claims",
+        "instructions": "You are an expert dietician. Use your knowledge base to answer questions about the misleading claims about food product.",
+        "vector_store_name": "Misleading Claims Vec",
+        "file_path": "docs/MisLeading_Claims.docx",
+    },
+    "processing_level": {
+        "name": "Processing Level",
+        "instructions": "You are an expert dietician. Use your knowledge base to answer questions about the processing level of food product.",
+        "vector_store_name": "Processing Level Vec",
+        "file_path": "docs/Processing_Level.docx",
+    },
+}
+
+class SqliteAssistantStore:
+    #One JSON record per static assistant in a local SQLite table
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _db(self):
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS static_assistants (key TEXT PRIMARY KEY, record TEXT)")
+            self._connection.commit()
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            row = self._db().execute("SELECT record FROM static_assistants WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key, record):
+        with self._lock:
+            self._db().execute("INSERT OR REPLACE INTO static_assistants (key, record) VALUES (?, ?)", (key, json.dumps(record)))
+            self._db().commit()
+
+    def records(self):
+        with self._lock:
+            rows = self._db().execute("SELECT key, record FROM static_assistants").fetchall()
+        return {key: json.loads(record) for key, record in rows}
+
+class MongoAssistantStore:
+    #Static assistant records in MongoDB, shared by every host of the deployment
+
+    def __init__(self, url, database="consumeWise", collection="static_assistants"):
+        self.url = url
+        self.database = database
+        self.collection_name = collection
+        self._collection = None
+        self._lock = threading.Lock()
+
+    def _records(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    from pymongo import MongoClient
+                    self._collection = MongoClient(self.url)[self.database][self.collection_name]
+        return self._collection
+
+    def get(self, key):
+        document = self._records().find_one({"key": key}, {"_id": 0})
+        return document["record"] if document is not None else None
+
+    def put(self, key, record):
+        self._records().replace_one({"key": key}, {"key": key, "record": record}, upsert=True)
+
+    def records(self):
+        return {document["key"]: document["record"] for document in self._records().find({}, {"_id": 0})}
+
+def create_static_assistant(client, spec, model, owner):
+    #Assistant with a file_search vector store over its own upload of the spec's document. Registry uploads expire
+    #with the registry TTL, while a static assistant is kept for as long as its fingerprint matches
+    #Returns (assistant, vector_store_id, file_id)
+    assistant = client.beta.assistants.create(
+      name=spec["name"],
+      instructions=spec["instructions"],
+      model=model,
+      tools=[{"type": "file_search"}],
+      temperature=0,
+      top_p = 0.85
+      )
+
+    # Create a vector store
+    if "chunking_strategy" in spec:
+        vector_store = client.beta.vector_stores.create(name=spec["vector_store_name"], chunking_strategy=spec["chunking_strategy"])
+    else:
+        vector_store = client.beta.vector_stores.create(name=spec["vector_store_name"])
+
+    # Kept until superseded, so recorded without expiry
+    get_resource_ledger().record("assistant", assistant.id, owner)
+    get_resource_ledger().record("vector_store", vector_store.id, owner)
+
+    # Upload the document, attach it and poll the status of the file batch for completion.
+    with open(spec["file_path"], "rb") as f:
+        uploaded = client.files.create(file=f, purpose="assistants")
+    get_resource_ledger().record("file", uploaded.id, owner)
+    file_batch = client.beta.vector_stores.file_batches.create_and_poll(vector_store_id=vector_store.id, file_ids=[uploaded.id])
+    print(file_batch.status)
+    print(file_batch.file_counts)
+
+    assistant = client.beta.assistants.update(
+      assistant_id=assistant.id,
+      tool_resources={"file_search": {"vector_store_ids": [vector_store.id]}},
+    )
+    return assistant, vector_store.id, uploaded.id
+
+class StaticAssistants:
+    """
+    Registry of the static knowledge assistants. A persisted assistant is reused while the content hash
+    of its document, its model and its instructions are unchanged and it still exists remotely;
+    otherwise a new one is created, recorded, and the superseded assistant and vector store are deleted.
+    A resolved assistant is re-verified every verify_interval seconds, and at once after invalidate().
+    """
+
+    def __init__(self, store, specs=STATIC_ASSISTANT_SPECS, model=STATIC_ASSISTANT_MODEL, verify_interval=600.0):
+        self.store = store
+        self.specs = specs
+        self.model = model
+        self.verify_interval = verify_interval
+        #key -> (fingerprint, assistant, verified_at) resolved by this process
+        self._assistants = {}
+        self._locks = {key: threading.Lock() for key in specs}
+
+    def fingerprint(self, key):
+        spec = self.specs[key]
+        return {"content_hash": file_sha256(spec["file_path"]), "model": self.model, "instructions": spec["instructions"]}
+
+    def _retrieve(self, client, record):
+        try:
+            return client.beta.assistants.retrieve(record["assistant_id"])
+        except openai.NotFoundError:
+            return None
+
+    def _claim_files(self, client, key, record):
+        #Assistants persisted before they had their own uploads use registry files, which the ledger expires
+        #with the registry TTL. Their files are handed over to the static owner without expiry; an assistant
+        #whose vector store already lost its files is rebuilt (returns None)
+        files = client.beta.vector_stores.files.list(vector_store_id=record["vector_store_id"]).data
+        if not files:
+            print(f"Static assistant {key} has no files left in {record['vector_store_id']}, rebuilding it")
+            return None
+        ledger = get_resource_ledger()
+        for vector_store_file in files:
+            ledger.claim("file", vector_store_file.id, f"static:{key}")
+        record = {**record, "file_ids": [vector_store_file.id for vector_store_file in files]}
+        self.store.put(key, record)
+        return record
+
+    def _delete(self, client, record):
+        #Failed deletes are left to the resource sweeper
+        ledger = get_resource_ledger()
+        ledger.delete_now(client, "assistant", record["assistant_id"])
+        ledger.delete_now(client, "vector_store", record["vector_store_id"])
+        for file_id in record.get("file_ids", []):
+            ledger.delete_now(client, "file", file_id)
+
+    def _cached(self, key, fingerprint):
+        cached = self._assistants.get(key)
+        if cached is not None and cached[0] == fingerprint and time.time() - cached[2] < self.verify_interval:
+            return cached[1]
+        return None
+
+    def invalidate(self, key, assistant_id):
+        #Drops the cached assistant if it is assistant_id, e.g. after a run reported it as not found; the next
+        #get() retrieves it again and recreates it if it is gone
+        cached = self._assistants.get(key)
+        if cached is not None and cached[1].id == assistant_id:
+            self._assistants.pop(key, None)
+
+    def get(self, client, key):
+        fingerprint = self.fingerprint(key)
+        assistant = self._cached(key, fingerprint)
+        if assistant is not None:
+            return assistant
+
+        with self._locks[key]:
+            assistant = self._cached(key, fingerprint)
+            if assistant is not None:
+                return assistant
+
+            record = self.store.get(key)
+            assistant = None
+            if record is not None and record["fingerprint"] == fingerprint:
+                assistant = self._retrieve(client, record)
+                ledger = get_resource_ledger()
+                if assistant is not None and not ledger.store.is_tracked(assistant.id):
+                    #Persisted before the ledger existed; tracked now so orphan sweeps leave it alone
+                    ledger.record("assistant", record["assistant_id"], f"static:{key}")
+                    ledger.record("vector_store", record["vector_store_id"], f"static:{key}")
+                if assistant is not None and "file_ids" not in record:
+                    claimed = self._claim_files(client, key, record)
+                    if claimed is None:
+                        assistant = None
+                    else:
+                        record = claimed
+            if assistant is None:
+                assistant, vector_store_id, file_id = create_static_assistant(client, self.specs[key], self.model, f"static:{key}")
+                self.store.put(key, {"assistant_id": assistant.id, "vector_store_id": vector_store_id, "file_ids": [file_id], "fingerprint": fingerprint, "created_at": time.time()})
+                print(f"Created static assistant {key} : {assistant.id}")
+                if record is not None and record["assistant_id"] != assistant.id:
+                    self._delete(client, record)
+            self._assistants[key] = (fingerprint, assistant, time.time())
+            return assistant
+
+_static_assistants = None
+_static_assistants_lock = threading.Lock()
+
+def get_assistant_store():
+    return MongoAssistantStore(MONGODB_URL) if FILE_REGISTRY_BACKEND == "mongo" else SqliteAssistantStore(STATIC_ASSISTANTS_FILE)
+
+def get_static_assistants():
+    global _static_assistants
+    if _static_assistants is None:
+        with _static_assistants_lock:
+            if _static_assistants is None:
+                _static_assistants = StaticAssistants(get_assistant_store())
+    return _static_assistants
+
+def get_static_assistant(client, key):
+    #key is one of STATIC_ASSISTANT_SPECS: "ingredients", "claims" or "processing_level"
+    return get_static_assistants().get(client, key)
+
+async def run_with_static_assistant(client, key, run, assistant_id=None):
+    #Awaits run(assistant_id), with the static assistant key when assistant_id is None. A run on an assistant
+    #deleted remotely raises NotFoundError: the cached assistant is dropped and run retried once on a re-verified one
+    if assistant_id is None:
+        assistant_id = (await asyncio.to_thread(get_static_assistant, client, key)).id
+    try:
+        return await run(assistant_id)
+    except openai.NotFoundError as e:
+        print(f"Static assistant {key} run failed on {assistant_id} ({e}), re-verifying it")
+        get_static_assistants().invalidate(key, assistant_id)
+        assistant = await asyncio.to_thread(get_static_assistant, client, key)
+        return await run(assistant.id)
@@ -10,8 +10,11 @@ from pydantic import BaseModel  # Import BaseModel for creating request body
 from api.nutrient_analyzer import get_nutrient_analysis
 from api.data_extractor import extract_data, find_product, get_product
 from api.ingredients_analysis import get_ingredient_analysis
-from api.claims_analysis import get_claims_analysis
+from api.claims_analysis import get_claims_analysis, get_claims_analysis_async
 from api.cumulative_analysis import generate_final_analysis
+from api.static_assistants import get_static_assistant
+from api.resource_ledger import start_sweeper
+from api.config import RESOURCE_SWEEPER, RESOURCE_SWEEP_INTERVAL_SECONDS
 #Used the @st.cache_resource decorator on this function. 
 #This Streamlit decorator ensures that the function is only executed once and its result (the OpenAI client) is cached. 
 #Subsequent calls to this function will return the cached client, avoiding unnecessary recreation.
@@ -23,46 +26,22 @@ def get_openai_client():
 
 client = get_openai_client()
 
+#The app runs the analyses in-process, so it also sweeps the assistants, vector stores and files they leave behind
 @st.cache_resource
-def create_assistant_and_embeddings():
+def start_resource_sweeper():
+    if RESOURCE_SWEEPER:
+        return start_sweeper(lambda: client, RESOURCE_SWEEP_INTERVAL_SECONDS)
 
-    global client
-    
-    assistant1 = client.beta.assistants.create(
-      name="Processing Level",
-      instructions="You are an expert dietician. Use your knowledge base to answer questions about the processing level of food product.",
-      model="gpt-4o",
-      tools=[{"type": "file_search"}],
-      temperature=0,
-      top_p = 0.85
-      )
-
-      # Create a vector store
-    vector_store1 = client.beta.vector_stores.create(name="Processing Level Vec")
-    
-    # Ready the files for upload to OpenAI
-    file_paths = ["docs/Processing_Level.docx"]
-    file_streams = [open(path, "rb") for path in file_paths]
-    
-    # Use the upload and poll SDK helper to upload the files, add them to the vector store,
-    # and poll the status of the file batch for completion.
-    file_batch1 = client.beta.vector_stores.file_batches.upload_and_poll(
-      vector_store_id=vector_store1.id, files=file_streams
-    )
-    
-    # You can print the status and the file counts of the batch to see the result of this operation.
-    print(file_batch1.status)
-    print(file_batch1.file_counts)
+start_resource_sweeper()
 
-    #Processing Level
-    assistant1 = client.beta.assistants.update(
-      assistant_id=assistant1.id,
-      tool_resources={"file_search": {"vector_store_ids": [vector_store1.id]}},
-    )
+#Not cached with st.cache_resource: get_static_assistant keeps it per process and re-verifies it, so an assistant
+#deleted remotely is recreated instead of being served for the life of the server
+def create_assistant_and_embeddings():
 
-    return assistant1
+    global client
     
-assistant_p = create_assistant_and_embeddings()
+    #Processing Level assistant over Processing_Level.docx, reused across server starts while the document is unchanged
+    return get_static_assistant(client, "processing_level")
 
 def extract_data_from_product_image(images_list):
     raw_response = extract_data({"images_list" : images_list})
@@ -117,7 +96,6 @@ def analyze_claims_list(product_info_from_db):
     return raw_response
   
 async def analyze_product(product_info_from_db):
-    global assistant_p
     
     if product_info_from_db:
         brand_name = product_info_from_db.get("brandName", "")
@@ -129,15 +107,15 @@ async def analyze_product(product_info_from_db):
         
         # Ensure each function is an async function and returns a coroutine
         nutrition_coro = analyze_nutrition_using_icmr_rda(product_info_from_db)
-        processing_coro = analyze_processing_level_and_ingredients(product_info_from_db, assistant_p.id)
+        processing_coro = analyze_processing_level_and_ingredients(product_info_from_db, create_assistant_and_embeddings().id)
         
         coroutines.append(nutrition_coro)
         coroutines.append(processing_coro)
 
         # Conditionally add claims analysis
-        # You can use asyncio.to_thread() to run the synchronous analyze_claims function in a separate thread, allowing it to run in parallel with your other asynchronous functions. Here’s how you can do it:
+        # The claims run is polled on the event loop, in parallel with the other analyses
         if product_info_from_db.get("claims"):
-            claims_coro = asyncio.to_thread(analyze_claims_list, product_info_from_db)
+            claims_coro = get_claims_analysis_async(product_info_from_db)
             coroutines.append(claims_coro)
 
         # Debug: Print coroutine types to verify
@@ -8,6 +8,7 @@ from typing import Dict, Any
 #from calc_cosine_similarity import  find_relevant_file_paths
 import pickle
 from calc_consumption_context import get_consumption_context
+from api.static_assistants import get_static_assistant
 import httpx
 from tenacity import retry, stop_after_attempt, wait_exponential
 
@@ -29,46 +30,14 @@ def get_openai_client():
 client = get_openai_client()
 render_host_url = "https://foodlabelanalyzer-api-2.onrender.com"
 
-@st.cache_resource
+#Not cached with st.cache_resource: get_static_assistant keeps it per process and re-verifies it, so an assistant
+#deleted remotely is recreated instead of being served for the life of the server
 def create_assistant_and_embeddings():
 
     global client
     
-    assistant1 = client.beta.assistants.create(
-      name="Processing Level",
-      instructions="You are an expert dietician. Use your knowledge base to answer questions about the processing level of food product.",
-      model="gpt-4o",
-      tools=[{"type": "file_search"}],
-      temperature=0,
-      top_p = 0.85
-      )
-
-      # Create a vector store
-    vector_store1 = client.beta.vector_stores.create(name="Processing Level Vec")
-    
-    # Ready the files for upload to OpenAI
-    file_paths = ["./Processing_Level.docx"]
-    file_streams = [open(path, "rb") for path in file_paths]
-    
-    # Use the upload and poll SDK helper to upload the files, add them to the vector store,
-    # and poll the status of the file batch for completion.
-    file_batch1 = client.beta.vector_stores.file_batches.upload_and_poll(
-      vector_store_id=vector_store1.id, files=file_streams
-    )
-    
-    # You can print the status and the file counts of the batch to see the result of this operation.
-    print(file_batch1.status)
-    print(file_batch1.file_counts)
-
-    #Processing Level
-    assistant1 = client.beta.assistants.update(
-      assistant_id=assistant1.id,
-      tool_resources={"file_search": {"vector_store_ids": [vector_store1.id]}},
-    )
-
-    return assistant1
-    
-assistant_p = create_assistant_and_embeddings()
+    #Processing Level assistant over Processing_Level.docx, reused across server starts while the document is unchanged
+    return get_static_assistant(client, "processing_level")
 
 async def extract_data_from_product_image(image_links):
     global render_host_url
@@ -302,7 +271,6 @@ async def analyze_claims(product_info_from_db):
         return None 
   
 async def analyze_product(product_info_from_db):
-    global assistant_p
     
     if product_info_from_db:
         brand_name = product_info_from_db.get("brandName", "")
@@ -314,7 +282,7 @@ async def analyze_product(product_info_from_db):
         
         # Ensure each function is an async function and returns a coroutine
         nutrition_coro = analyze_nutrition_using_icmr_rda(product_info_from_db)
-        processing_coro = analyze_processing_level_and_ingredients(product_info_from_db, assistant_p.id, start_time)
+        processing_coro = analyze_processing_level_and_ingredients(product_info_from_db, create_assistant_and_embeddings().id, start_time)
         
         coroutines.append(nutrition_coro)
         coroutines.append(processing_coro)
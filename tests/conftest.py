@@ -0,0 +1,23 @@
+import pytest
+from types import SimpleNamespace
+
+#Five short articles: two on xanthan gum, one naming raising agents, one saying "class ii", one on sugar
+ARTICLES = [
+    ("Xanthan Gum: Is This Food Additive Healthy?", "Xanthan gum is a thickener made by fermenting sugar. Xanthan gum keeps sauces and dressings smooth."),
+    ("9 Substitutes for Xanthan Gum", "Egg yolk is a natural emulsifier. Psyllium husk and chia seeds can replace xanthan gum in gluten free baking."),
+    ("Baking Soda vs Baking Powder", "Baking soda and baking powder are raising agents. Each agent releases carbon dioxide so the dough rises."),
+    ("Body Fat Percentage", "A body mass index of 35 to 40 is class ii obesity. Body fat is measured with calipers or scans."),
+    ("Is Sugar Bad for You?", "Added sugar raises blood sugar. Cane sugar and beet sugar are both sucrose."),
+]
+
+@pytest.fixture
+def bm25_corpus(tmp_path):
+    #(corpus, Bm25Index) over ARTICLES, shaped like api.corpus.Corpus for the retrieval functions
+    pytest.importorskip("numpy")
+    from api.bm25 import Bm25Index
+    folder = tmp_path / "articles"
+    folder.mkdir()
+    for article_id, (title, body) in enumerate(ARTICLES, start=1):
+        (folder / f"article{article_id}.txt").write_text(f"{title}\n{body}\nReferences:\n")
+    corpus = SimpleNamespace(source="test", folder_name=str(folder), titles=[title for title, _ in ARTICLES], journal_str=None, citations=None)
+    return corpus, Bm25Index.build([{"source": "test", "folder_name": str(folder)}])
@@ -0,0 +1,145 @@
+import itertools
+import threading
+import pytest
+from types import SimpleNamespace
+from api import assistant_pool
+from api.assistant_pool import AssistantPool
+
+class StubClient:
+    #Creates and deletes assistants with their vector stores, remembering which ones are still live remotely
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.live = set()
+        self.deleted = []
+
+    def create(self):
+        n = next(self._ids)
+        assistant = SimpleNamespace(id=f"asst_{n}")
+        self.live.add(assistant.id)
+        return assistant, f"vs_{n}"
+
+    def delete(self, assistant, vector_store_id):
+        self.live.discard(assistant.id)
+        self.deleted.append((assistant.id, vector_store_id))
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(assistant_pool, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+def lease(pool, client, key):
+    return pool.lease(key, client.create, client.delete)
+
+def test_reuses_assistant_for_same_key(clock):
+    pool, client = AssistantPool(max_size=4, ttl=60), StubClient()
+    with lease(pool, client, "a") as first:
+        pass
+    with lease(pool, client, "a") as second:
+        assert second is first
+    assert (pool.stats()["hits"], pool.stats()["misses"]) == (1, 1)
+
+def test_least_recently_used_idle_assistant_is_evicted(clock):
+    pool, client = AssistantPool(max_size=2, ttl=60), StubClient()
+    for key in ("a", "b", "a", "c"):
+        with lease(pool, client, key):
+            pass
+    #"a" was used after "b", so "b" is the one evicted when "c" joins
+    assert client.deleted == [("asst_2", "vs_2")]
+    assert client.live == {"asst_1", "asst_3"}
+    stats = pool.stats()
+    assert (stats["size"], stats["evictions"], stats["hits"], stats["misses"]) == (2, 1, 1, 3)
+
+def test_expired_assistant_is_replaced(clock):
+    pool, client = AssistantPool(max_size=4, ttl=60), StubClient()
+    with lease(pool, client, "a") as first:
+        pass
+    clock.now += 61
+    with lease(pool, client, "a") as second:
+        assert second.id != first.id
+    assert client.deleted == [("asst_1", "vs_1")]
+
+def test_expired_idle_assistants_are_trimmed_on_the_next_creation(clock):
+    pool, client = AssistantPool(max_size=4, ttl=60), StubClient()
+    with lease(pool, client, "a"):
+        pass
+    clock.now += 61
+    with lease(pool, client, "b"):
+        pass
+    assert client.deleted == [("asst_1", "vs_1")]
+    assert pool.stats()["size"] == 1
+
+def test_leased_assistant_is_deleted_when_released(clock):
+    pool, client = AssistantPool(max_size=4, ttl=60), StubClient()
+    with lease(pool, client, "a") as first:
+        clock.now += 61
+        #Expired under a running analysis: a fresh one is created, the leased one is kept until released
+        with lease(pool, client, "a") as second:
+            assert second.id != first.id
+        assert client.deleted == []
+        assert first.id in client.live
+    assert client.deleted == [("asst_1", "vs_1")]
+
+def test_leased_assistants_are_not_evicted_over_max_size(clock):
+    pool, client = AssistantPool(max_size=1, ttl=60), StubClient()
+    with lease(pool, client, "a"):
+        with lease(pool, client, "b"):
+            assert pool.stats()["leased"] == 2
+        assert client.deleted == []
+    with lease(pool, client, "c"):
+        pass
+    #Once idle, the least recently used entries over max_size go
+    assert [assistant_id for assistant_id, _ in client.deleted] == ["asst_1", "asst_2"]
+
+def test_clear_defers_leased_assistants(clock):
+    pool, client = AssistantPool(max_size=4, ttl=60), StubClient()
+    with lease(pool, client, "a"):
+        pass
+    with lease(pool, client, "b"):
+        pool.clear()
+        assert client.deleted == [("asst_1", "vs_1")]
+    assert client.deleted == [("asst_1", "vs_1"), ("asst_2", "vs_2")]
+    assert pool.stats()["size"] == 0
+
+def test_concurrent_misses_create_one_assistant(clock):
+    pool, client = AssistantPool(max_size=4, ttl=60), StubClient()
+    started = threading.Event()
+    proceed = threading.Event()
+    creations = []
+
+    def slow_create():
+        creations.append(1)
+        started.set()
+        proceed.wait(5)
+        return client.create()
+
+    leased = []
+
+    def worker():
+        with pool.lease("a", slow_create, client.delete) as assistant:
+            leased.append(assistant.id)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    proceed.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(creations) == 1
+    assert leased == ["asst_1"] * 4
+
+def test_failed_creation_is_not_pooled(clock):
+    pool, client = AssistantPool(max_size=4, ttl=60), StubClient()
+
+    def failing_create():
+        raise RuntimeError("vector store failed")
+
+    with pytest.raises(RuntimeError):
+        with pool.lease("a", failing_create, client.delete):
+            pass
+    with lease(pool, client, "a") as assistant:
+        assert assistant.id == "asst_1"
+    assert pool.stats()["size"] == 1
@@ -0,0 +1,38 @@
+import os
+import pytest
+
+#api.ingredients_analysis pulls in the whole service; skip where its dependencies are not installed
+for module in ("fastapi", "openai", "pymongo", "numpy", "pandas"):
+    pytest.importorskip(module)
+
+#Some modules build OpenAI clients at import time; nothing here calls the API
+os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "test"
+
+from api.bm25 import query_terms
+
+def test_query_terms_drop_label_noise():
+    assert query_terms("Emulsifier (INS 471)") == []
+    assert query_terms("Raising Agents (INS 500(ii))") == []
+    assert query_terms("Permitted Class II Preservative (INS 211)") == []
+    assert query_terms("Spices & Condiments") == []
+    assert query_terms("Colour (Caramel E150d)") == ["caramel"]
+    assert query_terms("Soy Lecithin (INS 322)") == ["lecithin", "soy"]
+    assert query_terms("Xanthan Gum") == ["gum", "xanthan"]
+
+def test_partial_match_scores_zero(bm25_corpus):
+    _, index = bm25_corpus
+    #"baking" and "gum" carry about the same IDF, so an article matching only one of them covers half the query
+    hits = index.search_articles("Baking Gum", N=5, min_coverage=0.6)
+    assert [article_id for _, article_id, _, _ in hits] == [2]
+    assert len(index.search_articles("Baking Gum", N=5)) == 3
+
+def test_unmatched_additive_falls_back_to_docx(bm25_corpus):
+    from api.config import DOCX_FALLBACK_FILE
+    from api.ingredients_analysis import find_relevant_file_paths_lexical, combine_relevant_files
+    corpus, index = bm25_corpus
+    for ingredient in ("Emulsifier (INS 471)", "Raising Agents (INS 500(ii))", "Permitted Class II Preservative (INS 211)"):
+        file_paths, refs = combine_relevant_files(find_relevant_file_paths_lexical(ingredient, index, [corpus]))
+        assert file_paths == [DOCX_FALLBACK_FILE]
+        assert refs == []
+    file_paths, _ = combine_relevant_files(find_relevant_file_paths_lexical("Xanthan Gum", index, [corpus]))
+    assert file_paths[0] == f"{corpus.folder_name}/article1.txt"
@@ -0,0 +1,86 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from api import corpus as corpus_module
+from api.embedding_store import quantized_store_path, write_embedding_store
+
+def make_embeddings(rows=64, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(rows, dim)).astype(np.float32)
+
+def corpus_spec(tmp_path):
+    return {
+        "source": "test",
+        "store_file": str(tmp_path / "embeddings.emb"),
+        "ann_index_file": str(tmp_path / "embeddings.ivf.npz"),
+        "embeddings_file": str(tmp_path / "missing.pkl"),
+        "titles_file": str(tmp_path / "missing.txt"),
+        "folder_name": str(tmp_path / "articles"),
+        "journal_str": None,
+    }
+
+def test_quantized_store_without_float32_store_skips_rescoring(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_module, "EMBEDDING_QUANTIZATION", "int8")
+    spec = corpus_spec(tmp_path)
+    embeddings = make_embeddings()
+    titles = [f"title {i}" for i in range(len(embeddings))]
+    write_embedding_store(quantized_store_path(spec["store_file"], "int8"), embeddings, titles, dtype="int8")
+    #The pickle does not exist either: it must not be read in place of the memory-mapped float32 store
+    corpus = corpus_module.load_corpus(**spec)
+    assert corpus.title_matrix is None
+    assert list(corpus.titles) == titles
+    assert corpus.title_search is corpus.quantized_matrix
+    hits = corpus.title_search.search(embeddings[5], 2)
+    assert hits[0][0] == 5
+    assert hits[0][1] == pytest.approx(1.0, abs=0.02)
+
+def test_quantized_store_rescores_against_the_mapped_float32_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_module, "EMBEDDING_QUANTIZATION", "int8")
+    spec = corpus_spec(tmp_path)
+    embeddings = make_embeddings()
+    titles = [f"title {i}" for i in range(len(embeddings))]
+    write_embedding_store(spec["store_file"], embeddings, titles)
+    write_embedding_store(quantized_store_path(spec["store_file"], "int8"), embeddings, titles, dtype="int8")
+    corpus = corpus_module.load_corpus(**spec)
+    assert isinstance(corpus.title_matrix.matrix, np.memmap)
+    assert corpus.quantized_matrix.title_matrix is corpus.title_matrix
+    assert corpus.title_search.search(embeddings[7], 1) == corpus.title_matrix.search(embeddings[7], 1)
+
+def test_ivf_index_built_from_other_embeddings_is_rejected(tmp_path, monkeypatch):
+    from utils.build_corpus import build_ann_index
+    from api.ann_index import IVFIndex
+    monkeypatch.setattr(corpus_module, "RETRIEVAL_INDEX", "ivf")
+    spec = corpus_spec(tmp_path)
+    titles = [f"title {i}" for i in range(64)]
+    write_embedding_store(spec["store_file"], make_embeddings(seed=0), titles)
+    build_ann_index(spec, force=False)
+    built_hash = IVFIndex.read_content_hash(spec["ann_index_file"])
+    assert corpus_module.load_corpus(**spec).ann_index is not None
+
+    #Same row count, different embeddings: the old index must not be used, and the builder replaces it
+    write_embedding_store(spec["store_file"], make_embeddings(seed=1), titles)
+    corpus = corpus_module.load_corpus(**spec)
+    assert corpus.ann_index is None
+    assert corpus.content_hash != built_hash
+    build_ann_index(spec, force=False)
+    assert IVFIndex.read_content_hash(spec["ann_index_file"]) == corpus.content_hash
+    assert corpus_module.load_corpus(**spec).ann_index is not None
+
+def test_quantized_store_from_other_embeddings_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_module, "EMBEDDING_QUANTIZATION", "int8")
+    spec = corpus_spec(tmp_path)
+    titles = [f"title {i}" for i in range(64)]
+    write_embedding_store(spec["store_file"], make_embeddings(seed=0), titles)
+    write_embedding_store(quantized_store_path(spec["store_file"], "int8"), make_embeddings(seed=1), titles, dtype="int8")
+    corpus = corpus_module.load_corpus(**spec)
+    assert corpus.quantized_matrix is None
+    assert corpus.title_search is corpus.title_matrix
+
+def test_sidecar_mode_requires_memory_mapped_stores(tmp_path, monkeypatch):
+    monkeypatch.setattr(corpus_module, "EMBEDDING_SERVER_SOCKET", "/tmp/embeddings.sock")
+    spec = corpus_spec(tmp_path)
+    #Only the pickle path is left: each worker would hold its own copy of the matrix
+    with pytest.raises(ValueError, match="EMBEDDING_SERVER_SOCKET"):
+        corpus_module.load_corpus(**spec)
+    write_embedding_store(spec["store_file"], make_embeddings(), [f"title {i}" for i in range(64)])
+    assert isinstance(corpus_module.load_corpus(**spec).title_matrix.matrix, np.memmap)
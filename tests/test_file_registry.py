@@ -0,0 +1,74 @@
+import itertools
+import pytest
+
+pytest.importorskip("openai")
+
+from types import SimpleNamespace
+from api import file_registry
+from api.file_registry import FileRegistry, SqliteFileStore, attach_files
+from api.resource_ledger import ResourceLedger, SqliteLedgerStore
+
+class StubClient:
+    #Files and vector store batches; attaching a file ID in self.broken fails, as for a file deleted remotely
+
+    def __init__(self):
+        ids = itertools.count(1)
+        self.broken = set()
+        self.uploaded = []
+        self.batches = []
+        self.files = SimpleNamespace(create=lambda file, purpose: self._upload(f"file_{next(ids)}"), retrieve=lambda file_id: SimpleNamespace(id=file_id))
+        file_batches = SimpleNamespace(create_and_poll=self._create_and_poll, list_files=self._list_files)
+        self.beta = SimpleNamespace(vector_stores=SimpleNamespace(file_batches=file_batches))
+
+    def _upload(self, file_id):
+        self.uploaded.append(file_id)
+        return SimpleNamespace(id=file_id)
+
+    def _create_and_poll(self, vector_store_id, file_ids):
+        files = [SimpleNamespace(id=file_id, status="failed" if file_id in self.broken else "completed") for file_id in file_ids]
+        self.batches.append(files)
+        failed = sum(vector_store_file.status == "failed" for vector_store_file in files)
+        return SimpleNamespace(id=f"batch_{len(self.batches)}", status="completed", file_counts=SimpleNamespace(failed=failed, completed=len(files) - failed))
+
+    def _list_files(self, vector_store_id, batch_id):
+        return self.batches[int(batch_id.split("_")[1]) - 1]
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    ledger = ResourceLedger(SqliteLedgerStore(str(tmp_path / "ledger.sqlite")))
+    registry = FileRegistry(SqliteFileStore(str(tmp_path / "files.sqlite")), verify_interval=3600)
+    monkeypatch.setattr(file_registry, "get_resource_ledger", lambda: ledger)
+    monkeypatch.setattr(file_registry, "_file_registry", registry)
+    return registry
+
+def write_articles(tmp_path, n):
+    paths = []
+    for i in range(n):
+        path = tmp_path / f"article{i + 1}.txt"
+        path.write_text(f"article {i + 1}")
+        paths.append(str(path))
+    return paths
+
+def test_only_failed_files_are_reuploaded_and_reattached(registry, tmp_path):
+    client = StubClient()
+    paths = write_articles(tmp_path, 3)
+    attach_files(client, "vs_1", paths)
+    assert sorted(client.uploaded) == ["file_1", "file_2", "file_3"]
+
+    #The upload of the second article was deleted remotely since it was last verified
+    stale_id = registry.file_id(client, paths[1])
+    client.broken.add(stale_id)
+    client.batches.clear()
+    attach_files(client, "vs_2", paths)
+    assert len(client.batches) == 2
+    assert len(client.batches[0]) == 3
+    #Only the failed file is uploaded again and attached in the retry batch
+    assert [vector_store_file.id for vector_store_file in client.batches[1]] == ["file_4"]
+    assert client.uploaded[-1] == "file_4"
+    assert registry.file_id(client, paths[1]) == "file_4"
+    assert registry.file_id(client, paths[0]) != "file_4"
+
+def test_no_retry_without_failures(registry, tmp_path):
+    client = StubClient()
+    attach_files(client, "vs_1", write_articles(tmp_path, 2))
+    assert len(client.batches) == 1
@@ -0,0 +1,39 @@
+import os
+import pytest
+from api.hybrid_retrieval import fuse_article_hits, reciprocal_rank_fusion
+
+def test_reciprocal_rank_fusion_sums_ranks():
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60)
+    assert [key for key, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+def test_fused_order_when_dense_and_lexical_disagree():
+    #Dense ranks rows 0, 1, 2; BM25 ranks rows 3, 2, 1; row 1 and row 2 are found by both
+    dense_hits = [(0, 0.9), (1, 0.8), (2, 0.7)]
+    lexical_hits = [(3, 20.0), (2, 15.0), (1, 12.0)]
+    fused = fuse_article_hits(dense_hits, lexical_hits, N=4, dense_thres=0.5, lexical_min_score=10.0, k=60)
+    #Rows 1 and 2 both sum 1/62 + 1/63 and keep the dense order; rows 0 and 3 each top one ranking
+    assert [row for row, _ in fused] == [1, 2, 0, 3]
+
+def test_hits_under_their_threshold_are_not_fused():
+    dense_hits = [(0, 0.9), (1, 0.4)]
+    lexical_hits = [(1, 20.0), (2, 5.0)]
+    fused = fuse_article_hits(dense_hits, lexical_hits, N=4, dense_thres=0.5, lexical_min_score=10.0, k=60)
+    #Row 1 is kept by BM25 alone, and ranks with row 0 instead of above it
+    assert [row for row, _ in fused] == [0, 1]
+    assert fused[0][1] == fused[1][1]
+
+def test_hybrid_fuses_only_coverage_gated_lexical_hits(bm25_corpus):
+    for module in ("fastapi", "openai", "pymongo", "numpy", "pandas"):
+        pytest.importorskip(module)
+    os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "test"
+    from api.config import BM25_MIN_COVERAGE
+    from api.hybrid_retrieval import LexicalSearches
+    from api.ingredients_analysis import find_relevant_file_paths_hybrid
+    corpus, index = bm25_corpus
+    #Dense prefers "Baking Soda vs Baking Powder" then "Xanthan Gum"; only article 2 mentions both baking and gum
+    dense_hits = [[(2, 0.8), (0, 0.6)]]
+    lexical_hits = LexicalSearches(index, ["Baking Gum"], 10, 1000, BM25_MIN_COVERAGE).results()[0]
+    assert [article_id for _, article_id, _, _ in lexical_hits] == [2]
+    (file_paths, _, _), = find_relevant_file_paths_hybrid("Baking Gum", dense_hits, [], lexical_hits, [corpus], N=3)
+    assert file_paths == [f"{corpus.folder_name}/article{article_id}.txt" for article_id in (3, 2, 1)]
@@ -0,0 +1,59 @@
+import pytest
+from api.config import DOCX_FALLBACK_FILE
+from api.ingredient_batching import code_name, group_ingredients, match_results
+
+def test_exact_keys_are_matched():
+    ingredients = ["Sugar", "Palm Oil"]
+    assert match_results(ingredients, {"Palm Oil": "...", "Sugar": "..."}) == {"Sugar": "Sugar", "Palm Oil": "Palm Oil"}
+
+def test_partial_output_leaves_missing_ingredients_unmatched():
+    #The answer stopped after two of three ingredients; the third is analyzed on its own
+    ingredients = ["Sugar", "Palm Oil", "Iodised Salt"]
+    assert match_results(ingredients, {"Sugar": "...", "Palm Oil": "..."}) == {"Sugar": "Sugar", "Palm Oil": "Palm Oil"}
+    assert match_results(ingredients, {}) == {}
+
+def test_keys_differing_in_case_and_whitespace_are_matched():
+    ingredients = ["Refined Wheat Flour", "Iodised Salt"]
+    results = {"refined  wheat flour": "...", " IODISED SALT ": "..."}
+    assert match_results(ingredients, results) == {"Refined Wheat Flour": "refined  wheat flour", "Iodised Salt": " IODISED SALT "}
+
+def test_misnamed_keys_are_not_paired_by_position():
+    #The model reworded one key and reordered the others: nothing is handed another ingredient's analysis
+    ingredients = ["Sugar", "Milk Solids", "Palm Oil"]
+    results = {"Palm Oil": "...", "Milk Powder": "...", "Sugar": "..."}
+    assert match_results(ingredients, results) == {"Sugar": "Sugar", "Palm Oil": "Palm Oil"}
+
+def test_additive_code_spellings_are_normalised():
+    ingredients = ["Emulsifier (INS 471)", "Raising Agent (INS 500(ii))", "Colour (E150d)"]
+    results = {"emulsifier (E471)": "...", "Raising Agent (INS500 (ii))": "...", "Colour (INS 150d)": "..."}
+    assert match_results(ingredients, results) == {
+        "Emulsifier (INS 471)": "emulsifier (E471)",
+        "Raising Agent (INS 500(ii))": "Raising Agent (INS500 (ii))",
+        "Colour (E150d)": "Colour (INS 150d)",
+    }
+    assert code_name("Emulsifier (E-471)") == code_name("emulsifier (ins 471)") == "emulsifier (ins 471)"
+
+def test_different_additive_codes_are_not_matched():
+    ingredients = ["Emulsifier (INS 471)", "Raising Agent (INS 500(ii))", "Colour (E150d)"]
+    results = {"Emulsifier (INS 472)": "...", "Raising Agent (INS 500(i))": "...", "Colour (E150c)": "..."}
+    assert match_results(ingredients, results) == {}
+
+def test_each_key_is_matched_once():
+    #Two label entries that fold to the same key cannot both take its analysis
+    ingredients = ["Emulsifier (INS 471)", "Emulsifier (E471)"]
+    assert match_results(ingredients, {"Emulsifier (INS 471)": "..."}) == {"Emulsifier (INS 471)": "Emulsifier (INS 471)"}
+    #Only the first key of a folded name is indexed, so the exact match wins and the duplicate is analyzed on its own
+    ingredients = ["Sugar", "sugar"]
+    assert match_results(ingredients, {"Sugar": "...", "SUGAR": "..."}) == {"Sugar": "Sugar"}
+
+def test_group_ingredients_shares_articles_and_separates_the_docx_fallback():
+    retrieved = [
+        (["docs/articles/article1.txt", "docs/articles/article2.txt"], []),
+        ([DOCX_FALLBACK_FILE], []),
+        (["docs/articles/article2.txt"], []),
+        ([DOCX_FALLBACK_FILE], []),
+        (["docs/articles/article9.txt"], []),
+    ]
+    assert group_ingredients(retrieved, token_budget=10000, base_tokens=1000, per_ingredient_tokens=500, max_files=4) == [[0, 2], [1, 3], [4]]
+    #A budget of two ingredients per run splits the fallback group
+    assert group_ingredients(retrieved * 2, token_budget=2000, base_tokens=1000, per_ingredient_tokens=500, max_files=4)[1] == [1, 3]
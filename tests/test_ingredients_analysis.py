@@ -0,0 +1,60 @@
+import asyncio
+import os
+import pytest
+
+#api.ingredients_analysis pulls in the whole service; skip where its dependencies are not installed
+for module in ("fastapi", "openai", "pymongo", "numpy", "pandas"):
+    pytest.importorskip(module)
+
+#Some modules build OpenAI clients at import time; nothing here calls the API
+os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "test"
+
+from types import SimpleNamespace
+from api import ingredients_analysis, static_assistants
+
+class StubAsyncOpenAI:
+    def __init__(self, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+@pytest.fixture
+def analysis_calls(monkeypatch):
+    #assistant IDs the processing level was analyzed with
+    calls = []
+
+    async def analyze_processing_level_async(ingredients, assistant_id, client):
+        calls.append(assistant_id)
+        return f"Group A ({assistant_id})"
+
+    async def async_process_ingredients(ingredients_list, client, corpora, default_assistant, async_client = None):
+        return [], "analysis"
+
+    static = {"processing_level": SimpleNamespace(id="asst_static_processing"), "ingredients": SimpleNamespace(id="asst_static_ingredients")}
+    monkeypatch.setattr(ingredients_analysis, "OpenAI", lambda **kwargs: SimpleNamespace())
+    monkeypatch.setattr(ingredients_analysis, "AsyncOpenAI", StubAsyncOpenAI)
+    monkeypatch.setattr(ingredients_analysis, "get_corpora", lambda: ())
+    monkeypatch.setattr(ingredients_analysis, "get_static_assistant", lambda client, key: static[key])
+    monkeypatch.setattr(static_assistants, "get_static_assistant", lambda client, key: static[key])
+    monkeypatch.setattr(ingredients_analysis, "analyze_processing_level_async", analyze_processing_level_async)
+    monkeypatch.setattr(ingredients_analysis, "async_process_ingredients", async_process_ingredients)
+    return calls
+
+PRODUCT = {"productName": "Biscuits", "ingredients": [{"name": "Wheat Flour"}, {"name": "Sugar"}]}
+
+def test_missing_assistant_p_id_uses_the_static_assistant(analysis_calls):
+    request = ingredients_analysis.IngredientAnalysisRequest(product_info_from_db=PRODUCT)
+    assert request.assistant_p_id is None
+    #The payload the endpoint builds from the request
+    result = asyncio.run(ingredients_analysis.get_ingredient_analysis({"product_info_from_db": request.product_info_from_db, "assistant_p_id": request.assistant_p_id}))
+    assert analysis_calls == ["asst_static_processing"]
+    assert result["processing_level"] == "Group A (asst_static_processing)"
+
+def test_given_assistant_p_id_is_used(analysis_calls):
+    result = asyncio.run(ingredients_analysis.get_ingredient_analysis({"product_info_from_db": PRODUCT, "assistant_p_id": "asst_caller"}))
+    assert analysis_calls == ["asst_caller"]
+    assert result["all_ingredient_analysis"] == "analysis"
@@ -0,0 +1,30 @@
+import os
+import pytest
+
+#api.main pulls in the whole service; skip where its dependencies are not installed
+for module in ("fastapi", "openai", "pymongo", "numpy", "pandas"):
+    pytest.importorskip(module)
+
+#Some modules build OpenAI clients at import time; nothing here calls the API
+os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "test"
+
+def test_main_app_imports():
+    from api.main import main_app
+    paths = {route.path for route in main_app.routes}
+    assert {"/healthz", "/readyz", "/analysis_store/stats", "/semantic_cache/stats"} <= paths
+    for mount in ("/data_extractor", "/nutrient_analyzer", "/ingredient_analysis", "/claims_analysis", "/cumulative_analysis"):
+        assert mount in paths
+
+def test_sub_apps_serve_the_routes_the_frontend_calls():
+    from api.data_extractor import app as data_extractor_app
+    from api.ingredients_analysis import app as ingredients_analyzer_app
+    from api.claims_analysis import app as claims_analyzer_app
+    from api.cumulative_analysis import app as cumulative_analyzer_app
+    expected = {
+        data_extractor_app: {"/api/extract-data", "/api/find-product", "/api/get-product"},
+        ingredients_analyzer_app: {"/api/processing_level-ingredient-analysis"},
+        claims_analyzer_app: {"/api/claims-analysis"},
+        cumulative_analyzer_app: {"/api/cumulative-analysis"},
+    }
+    for app, paths in expected.items():
+        assert paths <= {route.path for route in app.routes}
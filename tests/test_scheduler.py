@@ -0,0 +1,203 @@
+import asyncio
+import pytest
+
+openai = pytest.importorskip("openai")
+httpx = pytest.importorskip("httpx")
+
+from types import SimpleNamespace
+from api import scheduler
+from api.async_runs import RunRateLimited
+from api.scheduler import LLMScheduler, TokenBucket, retry_after_seconds
+
+class FakeClock:
+    #Stands in for time.monotonic and asyncio.sleep in api.scheduler: sleeping advances the clock at once
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+        self._real_sleep = asyncio.sleep
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += max(0.0, seconds)
+        await self._real_sleep(0)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler, "time", SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(scheduler, "asyncio", SimpleNamespace(sleep=clock.sleep, get_running_loop=asyncio.get_running_loop, CancelledError=asyncio.CancelledError))
+    return clock
+
+def rate_limit_error(headers):
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/threads/runs"))
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+def test_token_bucket_refills_continuously(clock):
+    bucket = TokenBucket(60)
+    assert bucket.wait_time(60, clock.now) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, clock.now) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.wait_time(1, clock.now) == pytest.approx(0.5)
+    clock.now += 120
+    #Never refilled beyond capacity, and larger amounts only wait for a full bucket
+    assert bucket.wait_time(60, clock.now) == 0.0
+    assert bucket.available == 60
+    bucket.take(500)
+    assert bucket.wait_time(500, clock.now) == pytest.approx(60.0)
+
+def test_disabled_bucket_never_waits(clock):
+    bucket = TokenBucket(0)
+    bucket.take(10)
+    assert bucket.wait_time(10 ** 6, clock.now) == 0.0
+
+def test_concurrency_cap(clock):
+    llm = LLMScheduler(max_concurrency=2, requests_per_minute=0, tokens_per_minute=0)
+    running = []
+    peak = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def call():
+            running.append(1)
+            peak.append(len(running))
+            await release.wait()
+            running.pop()
+            return "done"
+
+        tasks = [asyncio.ensure_future(llm.run(call)) for _ in range(5)]
+        for _ in range(5):
+            await asyncio.sleep(0)
+        stats = llm.stats()
+        release.set()
+        return stats, await asyncio.gather(*tasks)
+
+    stats, results = asyncio.run(main())
+    assert (stats["running"], stats["queued"]) == (2, 3)
+    assert max(peak) == 2
+    assert results == ["done"] * 5
+    assert (llm.stats()["running"], llm.stats()["queued"]) == (0, 0)
+
+def test_request_budget_spaces_out_calls(clock):
+    #Two requests per minute: the third call waits for one request to refill, 30 seconds
+    llm = LLMScheduler(max_concurrency=10, requests_per_minute=2, tokens_per_minute=0)
+    started = []
+
+    async def call():
+        started.append(clock.now)
+
+    async def main():
+        for _ in range(3):
+            await llm.run(call)
+
+    asyncio.run(main())
+    assert started[1] == started[0]
+    assert started[2] - started[0] == pytest.approx(30.0)
+
+def test_token_budget_holds_back_large_calls(clock):
+    llm = LLMScheduler(max_concurrency=10, requests_per_minute=0, tokens_per_minute=6000)
+    started = []
+
+    async def call():
+        started.append(clock.now)
+
+    async def main():
+        await llm.run(call, estimated_tokens=6000)
+        await llm.run(call, estimated_tokens=3000)
+
+    asyncio.run(main())
+    #3000 of the 6000 tokens per minute refill in 30 seconds
+    assert started[1] - started[0] == pytest.approx(30.0)
+
+def test_rate_limited_run_waits_retry_after_and_retries(clock):
+    llm = LLMScheduler(max_concurrency=1, requests_per_minute=0, tokens_per_minute=0, max_retries=2)
+    attempts = []
+
+    async def call():
+        attempts.append(clock.now)
+        if len(attempts) == 1:
+            raise RunRateLimited("Rate limit reached, try again in 7s", retry_after=7.0)
+        return "ok"
+
+    assert asyncio.run(llm.run(call)) == "ok"
+    assert attempts[1] - attempts[0] == pytest.approx(7.0)
+    stats = llm.stats()
+    assert (stats["rate_limited"], stats["failed"], stats["admitted"]) == (1, 0, 1)
+
+def test_rate_limit_pause_holds_back_other_calls(clock):
+    llm = LLMScheduler(max_concurrency=10, requests_per_minute=0, tokens_per_minute=0, max_retries=1)
+    llm.pause(5.0)
+    started = []
+
+    async def call():
+        started.append(clock.now)
+
+    asyncio.run(llm.run(call))
+    assert started == [pytest.approx(1005.0)]
+
+def test_rate_limited_run_fails_after_max_retries(clock):
+    llm = LLMScheduler(max_concurrency=1, requests_per_minute=0, tokens_per_minute=0, max_retries=2)
+
+    async def call():
+        raise rate_limit_error({"retry-after": "3"})
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(llm.run(call))
+    stats = llm.stats()
+    assert (stats["rate_limited"], stats["failed"], stats["running"]) == (3, 1, 0)
+    assert clock.sleeps == [pytest.approx(3.0), pytest.approx(3.0)]
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(RunRateLimited("limited", retry_after=6.5), 0) == 6.5
+    assert retry_after_seconds(rate_limit_error({"retry-after-ms": "1500"}), 0) == 1.5
+    assert retry_after_seconds(rate_limit_error({"retry-after": "4"}), 0) == 4.0
+    #Exponential backoff, capped, when the server gives no delay
+    assert retry_after_seconds(rate_limit_error({"retry-after": "soon"}), 3) == 8.0
+    assert retry_after_seconds(RunRateLimited("limited"), 10) == 60.0
+
+def test_cancelled_waiter_does_not_leak_its_slot(clock):
+    llm = LLMScheduler(max_concurrency=1, requests_per_minute=0, tokens_per_minute=0)
+
+    async def call():
+        return "ok"
+
+    async def main():
+        await llm._acquire_slot()
+        waiting = asyncio.ensure_future(llm.run(call))
+        await asyncio.sleep(0)
+        assert llm.stats()["queued"] == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert llm.stats()["queued"] == 0
+        llm._release_slot()
+        return await llm.run(call)
+
+    assert asyncio.run(main()) == "ok"
+    assert (llm.stats()["running"], llm.stats()["queued"]) == (0, 0)
+
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on(clock):
+    llm = LLMScheduler(max_concurrency=1, requests_per_minute=0, tokens_per_minute=0)
+
+    async def call():
+        return "ok"
+
+    async def main():
+        await llm._acquire_slot()
+        waiting = asyncio.ensure_future(llm.run(call))
+        await asyncio.sleep(0)
+        #The slot is handed over and the waiter cancelled before it wakes up
+        llm._release_slot()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert llm.stats()["running"] == 0
+        return await llm.run(call)
+
+    assert asyncio.run(main()) == "ok"
+    assert llm.stats()["running"] == 0
@@ -0,0 +1,107 @@
+import asyncio
+import itertools
+import pytest
+
+openai = pytest.importorskip("openai")
+httpx = pytest.importorskip("httpx")
+
+from types import SimpleNamespace
+from api import static_assistants
+from api.resource_ledger import ResourceLedger, SqliteLedgerStore
+from api.static_assistants import SqliteAssistantStore, StaticAssistants
+
+def not_found(message="No assistant found"):
+    response = httpx.Response(404, request=httpx.Request("GET", "https://api.openai.com/v1/assistants"))
+    return openai.NotFoundError(message, response=response, body=None)
+
+class StubAssistants:
+    #client.beta.assistants with a set of assistant IDs that still exist remotely
+
+    def __init__(self):
+        self.live = set()
+        self.retrieved = 0
+
+    def retrieve(self, assistant_id):
+        self.retrieved += 1
+        if assistant_id not in self.live:
+            raise not_found()
+        return SimpleNamespace(id=assistant_id)
+
+@pytest.fixture
+def assistants(tmp_path, monkeypatch):
+    ids = itertools.count(1)
+    remote = StubAssistants()
+
+    def create(client, spec, model, owner):
+        assistant = SimpleNamespace(id=f"asst_{next(ids)}")
+        remote.live.add(assistant.id)
+        return assistant, f"vs_{assistant.id}", f"file_{assistant.id}"
+
+    (tmp_path / "doc.docx").write_bytes(b"document")
+    specs = {"claims": {"name": "Misleading Claims", "instructions": "Answer", "vector_store_name": "Misleading Claims Vec", "file_path": str(tmp_path / "doc.docx")}}
+    ledger = ResourceLedger(SqliteLedgerStore(str(tmp_path / "ledger.sqlite")))
+    monkeypatch.setattr(static_assistants, "create_static_assistant", create)
+    monkeypatch.setattr(static_assistants, "get_resource_ledger", lambda: ledger)
+    registry = StaticAssistants(SqliteAssistantStore(str(tmp_path / "static.sqlite")), specs=specs, model="gpt-4o")
+    monkeypatch.setattr(static_assistants, "_static_assistants", registry)
+    client = SimpleNamespace(beta=SimpleNamespace(assistants=remote))
+    return registry, remote, client
+
+def test_cached_assistant_is_reused_until_invalidated(assistants):
+    registry, remote, client = assistants
+    first = registry.get(client, "claims")
+    assert registry.get(client, "claims") is first
+    assert remote.retrieved == 0
+
+    #Deleted remotely: the cache keeps serving it until a run reports it as not found
+    remote.live.discard(first.id)
+    assert registry.get(client, "claims") is first
+    registry.invalidate("claims", first.id)
+    second = registry.get(client, "claims")
+    assert second.id != first.id
+    assert registry.store.get("claims")["assistant_id"] == second.id
+
+def test_invalidate_ignores_other_assistant_ids(assistants):
+    registry, remote, client = assistants
+    first = registry.get(client, "claims")
+    registry.invalidate("claims", "asst_from_the_request")
+    assert registry.get(client, "claims") is first
+
+def test_cached_assistant_is_reverified_after_the_interval(assistants):
+    registry, remote, client = assistants
+    registry.verify_interval = 0.0
+    first = registry.get(client, "claims")
+    assert registry.get(client, "claims").id == first.id
+    assert remote.retrieved == 1
+    remote.live.discard(first.id)
+    assert registry.get(client, "claims").id != first.id
+
+def test_run_is_retried_on_a_recreated_assistant(assistants):
+    registry, remote, client = assistants
+    stale = registry.get(client, "claims")
+    remote.live.discard(stale.id)
+    calls = []
+
+    async def run(assistant_id):
+        calls.append(assistant_id)
+        if assistant_id not in remote.live:
+            raise not_found()
+        return "analysis"
+
+    assert asyncio.run(static_assistants.run_with_static_assistant(client, "claims", run)) == "analysis"
+    assert calls[0] == stale.id
+    assert calls[1] != stale.id and calls[1] in remote.live
+
+def test_orphans_exclude_persisted_static_assistants(assistants, tmp_path):
+    from utils.sweep_resources import static_assistant_ids, untracked_objects
+    registry, remote, client = assistants
+    static = registry.get(client, "claims")
+    #Persisted before the ledger existed: nothing tracks it
+    ledger = ResourceLedger(SqliteLedgerStore(str(tmp_path / "empty_ledger.sqlite")))
+    listing = [SimpleNamespace(id=static.id, name="Misleading Claims", created_at=0), SimpleNamespace(id="asst_old", name="Misleading Claims", created_at=0)]
+    client = SimpleNamespace(beta=SimpleNamespace(
+        assistants=SimpleNamespace(list=lambda limit: listing),
+        vector_stores=SimpleNamespace(list=lambda limit: [SimpleNamespace(id=f"vs_{static.id}", name="Misleading Claims Vec", created_at=0)]),
+    ))
+    orphans = list(untracked_objects(client, ledger, 3600, static_assistant_ids(registry.store)))
+    assert orphans == [("assistant", "asst_old", "Misleading Claims")]
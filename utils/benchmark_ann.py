@@ -0,0 +1,54 @@
+#Recall and latency of the IVF index against the exact title search, for a sweep of n_probe values.
+#Run from the repository root after utils.build_ann_index: python -m utils.benchmark_ann [--ingredients names.txt]
+#Without --ingredients, queries are title embeddings perturbed with gaussian noise.
+import argparse
+import os
+import time
+import numpy as np
+from api.corpus import CORPUS_SPECS, load_corpus
+from api.ann_index import IVFIndex
+from api.retrieval import normalize_rows
+
+def make_queries(title_matrix, n_queries, noise, seed, ingredients_file):
+    if ingredients_file:
+        from sentence_transformers import SentenceTransformer
+        with open(ingredients_file, 'r') as f:
+            names = [line.strip() for line in f if line.strip()]
+        return SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2').encode(names, convert_to_numpy=True)
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(title_matrix), min(n_queries, len(title_matrix)), replace=False)
+    queries = np.asarray(title_matrix.matrix[np.sort(rows)], dtype=np.float32)
+    return normalize_rows(queries + rng.normal(scale=noise, size=queries.shape).astype(np.float32))
+
+def timed_search(searcher, queries, N, **kwargs):
+    start = time.perf_counter()
+    results = [searcher.search(query, N, **kwargs) for query in queries]
+    return results, 1000 * (time.perf_counter() - start) / len(queries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall vs latency against the exact search")
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--top", type=int, default=2, help="N passed to the search, as in find_relevant_file_paths")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ingredients", default=None, help="file with one ingredient name per line to use as queries")
+    args = parser.parse_args()
+
+    for spec in CORPUS_SPECS:
+        if not os.path.exists(spec["ann_index_file"]):
+            print(f"Skipping {spec['source']} : {spec['ann_index_file']} not built")
+            continue
+        corpus = load_corpus(**spec)
+        if corpus.title_matrix is None:
+            print(f"Skipping {spec['source']} : {spec['store_file']} not found")
+            continue
+        index = IVFIndex.load(spec["ann_index_file"], corpus.title_matrix, content_hash=corpus.content_hash)
+        queries = make_queries(corpus.title_matrix, args.queries, args.noise, args.seed, args.ingredients)
+
+        exact, exact_ms = timed_search(corpus.title_matrix, queries, args.top)
+        print(f"{spec['source']} : {len(corpus.title_matrix)} rows, {index.n_lists} lists, exact {exact_ms:.3f} ms/query")
+        for n_probe in args.n_probe:
+            approx, approx_ms = timed_search(index, queries, args.top, n_probe=n_probe)
+            recall = np.mean([len({row for row, _ in a} & {row for row, _ in e}) / max(1, len(e)) for a, e in zip(approx, exact)])
+            print(f"  n_probe={n_probe:<4} recall@{args.top}={recall:.3f} {approx_ms:.3f} ms/query")
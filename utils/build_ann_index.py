@@ -0,0 +1,25 @@
+#Builds the IVF approximate nearest neighbour index of every corpus (docs/*.ivf.npz).
+#Run from the repository root after the embeddings change: python -m utils.build_ann_index [--lists 256]
+#utils.build_corpus rebuilds them itself whenever the title matrix changes.
+#The API only uses it when RETRIEVAL_INDEX=ivf.
+import argparse
+import time
+from api.corpus import CORPUS_SPECS, load_corpus
+from api.ann_index import IVFIndex
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build IVF indexes over the title embeddings")
+    parser.add_argument("--lists", type=int, default=None, help="number of IVF lists (default 4 * sqrt(rows))")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for spec in CORPUS_SPECS:
+        corpus = load_corpus(**spec)
+        if corpus.title_matrix is None:
+            print(f"Skipping {spec['source']} : {spec['store_file']} not found, run utils.convert_embeddings first")
+            continue
+        start = time.time()
+        index = IVFIndex.build(corpus.title_matrix, n_lists=args.lists, iterations=args.iterations, seed=args.seed, content_hash=corpus.content_hash)
+        index.save(spec["ann_index_file"])
+        print(f"Wrote {spec['ann_index_file']} : {len(index)} rows in {index.n_lists} lists ({time.time() - start:.1f}s)")
@@ -0,0 +1,18 @@
+#Builds docs/bm25_index.npz, the BM25 passage index over docs/articles and docs/articles_harvard.
+#Run from the repository root whenever articles change: python -m utils.build_bm25_index [--window 120]
+#The API uses it when RETRIEVAL_MODE=lexical.
+import argparse
+import time
+from api.corpus import CORPUS_SPECS
+from api.bm25 import BM25_INDEX_FILE, Bm25Index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the BM25 passage index over the article bodies")
+    parser.add_argument("--window", type=int, default=120, help="words per passage")
+    parser.add_argument("--output", default=BM25_INDEX_FILE)
+    args = parser.parse_args()
+
+    start = time.time()
+    index = Bm25Index.build(CORPUS_SPECS, window=args.window)
+    index.save(args.output)
+    print(f"Wrote {args.output} : {len(index)} passages, {len(index.term_ids)} terms, {index.postings.nbytes} bytes of postings ({time.time() - start:.1f}s)")
@@ -0,0 +1,9 @@
+#Builds docs/citations.json.gz, the per-article reference index used by find_relevant_file_paths.
+#Run from the repository root whenever articles are added or changed: python -m utils.build_citation_index
+from api.corpus import CORPUS_SPECS
+from api.citation_index import CITATION_INDEX_FILE, build_citation_index, write_citation_index
+
+if __name__ == "__main__":
+    index = build_citation_index(CORPUS_SPECS)
+    write_citation_index(index, CITATION_INDEX_FILE)
+    print(f"Wrote {CITATION_INDEX_FILE}")
@@ -0,0 +1,219 @@
+#Incremental, resumable builder for the retrieval corpus of docs/articles and docs/articles_harvard.
+#Run from the repository root: python -m utils.build_corpus [--workers 4] [--chunk-size 256] [--quantize int8] [--passages]
+#
+#Every title and article is hashed; only titles whose text is not yet in the embedding checkpoint
+#(cache/corpus_build.sqlite) are encoded, in chunks, optionally across several worker processes.
+#Each finished chunk is committed, so an interrupted build resumes where it stopped. The outputs are
+#the files the API loads: titles*.txt, the memory-mapped embeddings*.emb stores, the embeddings*.ivf.npz
+#approximate indexes, docs/citations.json.gz and docs/bm25_index.npz. With --passages, overlapping article passages are embedded the same way into
+#docs/passages.emb and docs/passages.map.npz.
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from multiprocessing import Pool
+import numpy as np
+from api.corpus import CORPUS_SPECS
+from api.citation_index import CITATION_INDEX_FILE, build_citation_index, list_article_ids, write_citation_index
+from api.embedding_store import QUANTIZED_DTYPES, open_embedding_store, quantized_store_path, read_header, write_embedding_store
+from api.ann_index import IVFIndex
+from api.retrieval import TitleMatrix
+from api.bm25 import BM25_INDEX_FILE, Bm25Index
+from api.passages import read_article_words, split_passages
+from api.passage_index import PASSAGE_MAP_FILE, PASSAGE_STORE_FILE, passage_label, write_passage_map
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+CHECKPOINT_FILE = "cache/corpus_build.sqlite"
+
+_worker_model = None
+
+def _init_worker():
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(MODEL_NAME)
+
+def _encode_chunk(chunk):
+    hashes, texts = chunk
+    return hashes, _worker_model.encode(texts, convert_to_numpy=True).astype(np.float32)
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def open_checkpoint(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE IF NOT EXISTS embeddings (model TEXT, hash TEXT, vector BLOB, PRIMARY KEY (model, hash))")
+    connection.execute("CREATE TABLE IF NOT EXISTS articles (source TEXT, article_id INTEGER, hash TEXT, PRIMARY KEY (source, article_id))")
+    connection.commit()
+    return connection
+
+def read_articles(folder_name):
+    #Article numbers map to rows of the embedding matrix, so they must run 1..N without gaps
+    article_ids = list_article_ids(folder_name)
+    if article_ids != list(range(1, len(article_ids) + 1)):
+        missing = sorted(set(range(1, max(article_ids, default=0) + 1)) - set(article_ids))
+        raise ValueError(f"{folder_name} article numbers are not contiguous, missing {missing[:10]}")
+
+    titles = []
+    article_hashes = {}
+    for article_id in article_ids:
+        with open(f"{folder_name}/article{article_id}.txt", "rb") as f:
+            content = f.read()
+        first_line = content.split(b"\n", 1)[0].decode("utf-8").strip()
+        titles.append(first_line[len("Title:"):].strip() if first_line.startswith("Title:") else first_line)
+        article_hashes[article_id] = sha256(content)
+    return titles, article_hashes
+
+def embed_missing(connection, texts_by_hash, chunk_size, workers):
+    known = {row[0] for row in connection.execute("SELECT hash FROM embeddings WHERE model = ?", (MODEL_NAME,))}
+    missing = [(text_hash, text) for text_hash, text in texts_by_hash.items() if text_hash not in known]
+    if not missing:
+        return 0
+
+    chunks = [
+        ([text_hash for text_hash, _ in missing[i:i + chunk_size]], [text for _, text in missing[i:i + chunk_size]])
+        for i in range(0, len(missing), chunk_size)
+    ]
+    print(f"Encoding {len(missing)} new or changed texts in {len(chunks)} chunks with {workers} worker(s)")
+
+    done = 0
+    start = time.time()
+    if workers > 1:
+        pool = Pool(workers, initializer=_init_worker)
+        results = pool.imap_unordered(_encode_chunk, chunks)
+    else:
+        pool = None
+        _init_worker()
+        results = map(_encode_chunk, chunks)
+    try:
+        for hashes, vectors in results:
+            #Commit every chunk: this is the checkpoint an interrupted build resumes from
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [(MODEL_NAME, text_hash, vector.tobytes()) for text_hash, vector in zip(hashes, vectors)],
+            )
+            connection.commit()
+            done += len(hashes)
+            print(f"  {done}/{len(missing)} encoded ({time.time() - start:.0f}s)")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return len(missing)
+
+def load_vectors(connection, hashes):
+    vectors = {}
+    unique = sorted(set(hashes))
+    for i in range(0, len(unique), 500):
+        batch = unique[i:i + 500]
+        placeholders = ",".join("?" * len(batch))
+        for text_hash, blob in connection.execute(
+            f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})", [MODEL_NAME, *batch]
+        ):
+            vectors[text_hash] = np.frombuffer(blob, dtype=np.float32)
+    return np.stack([vectors[text_hash] for text_hash in hashes])
+
+def changed_articles(connection, source, article_hashes):
+    previous = dict(connection.execute("SELECT article_id, hash FROM articles WHERE source = ?", (source,)).fetchall())
+    return [article_id for article_id, article_hash in article_hashes.items() if previous.get(article_id) != article_hash] + \
+        [article_id for article_id in previous if article_id not in article_hashes]
+
+def build_corpus(connection, spec, chunk_size, workers, quantize, force):
+    titles, article_hashes = read_articles(spec["folder_name"])
+    title_hashes = [sha256(title.encode("utf-8")) for title in titles]
+
+    encoded = embed_missing(connection, dict(zip(title_hashes, titles)), chunk_size, workers)
+    changed = changed_articles(connection, spec["source"], article_hashes)
+    print(f"{spec['source']} : {len(titles)} articles, {len(changed)} new or changed, {encoded} titles encoded")
+
+    outputs = [(spec["store_file"], "float32")] + [(quantized_store_path(spec["store_file"], dtype), dtype) for dtype in quantize]
+    if not force and not changed and all(os.path.exists(path) for path, _ in outputs):
+        print(f"{spec['source']} is up to date")
+        return False
+
+    with open(spec["titles_file"], "w") as f:
+        for title in titles:
+            f.write(title + "\n")
+    embeddings = load_vectors(connection, title_hashes)
+    for path, dtype in outputs:
+        header = write_embedding_store(path, embeddings, titles, dtype=dtype)
+        print(f"Wrote {path} : {header['rows']} x {header['dim']} {header['dtype']}")
+
+    connection.execute("DELETE FROM articles WHERE source = ?", (spec["source"],))
+    connection.executemany(
+        "INSERT INTO articles (source, article_id, hash) VALUES (?, ?, ?)",
+        [(spec["source"], article_id, article_hash) for article_id, article_hash in article_hashes.items()],
+    )
+    connection.commit()
+    return True
+
+def build_ann_index(spec, force):
+    #The IVF lists hold row numbers of the float32 store, so the index is rebuilt whenever the store's matrix_hash changes
+    store = open_embedding_store(spec["store_file"])
+    content_hash = store.header.get("matrix_hash")
+    if not force and content_hash is not None and IVFIndex.read_content_hash(spec["ann_index_file"]) == content_hash:
+        print(f"{spec['ann_index_file']} is up to date")
+        return
+    start = time.time()
+    index = IVFIndex.build(TitleMatrix.from_normalized(store.matrix), content_hash=content_hash)
+    index.save(spec["ann_index_file"])
+    print(f"Wrote {spec['ann_index_file']} : {len(index)} rows in {index.n_lists} lists ({time.time() - start:.1f}s)")
+
+def build_passages(connection, specs, chunk_size, workers, window, overlap, force):
+    sources = [spec["source"] for spec in specs]
+    texts, labels, passage_sources, passage_articles, passage_spans = [], [], [], [], []
+    for source_id, spec in enumerate(specs):
+        for article_id in list_article_ids(spec["folder_name"]):
+            words = read_article_words(f"{spec['folder_name']}/article{article_id}.txt")
+            for start, end in split_passages(words, window, overlap):
+                texts.append(" ".join(words[start:end]))
+                labels.append(passage_label(spec["source"], article_id, start, end))
+                passage_sources.append(source_id)
+                passage_articles.append(article_id)
+                passage_spans.append((start, end))
+
+    text_hashes = [sha256(text.encode("utf-8")) for text in texts]
+    encoded = embed_missing(connection, dict(zip(text_hashes, texts)), chunk_size, workers)
+    print(f"passages : {len(texts)} passages, {encoded} encoded")
+
+    #The digest of every passage hash, in order, tells whether the existing store still matches the articles
+    content_hash = sha256("".join(text_hashes).encode("utf-8"))
+    if not force and os.path.exists(PASSAGE_STORE_FILE) and os.path.exists(PASSAGE_MAP_FILE):
+        if read_header(PASSAGE_STORE_FILE)[0].get("content_hash") == content_hash:
+            print("passages are up to date")
+            return
+
+    extra_header = {"window": window, "overlap": overlap, "content_hash": content_hash}
+    header = write_embedding_store(PASSAGE_STORE_FILE, load_vectors(connection, text_hashes), labels, extra_header=extra_header)
+    write_passage_map(PASSAGE_MAP_FILE, sources, passage_sources, passage_articles, passage_spans)
+    print(f"Wrote {PASSAGE_STORE_FILE} and {PASSAGE_MAP_FILE} : {header['rows']} x {header['dim']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally build the retrieval corpus from docs/articles*")
+    parser.add_argument("--workers", type=int, default=1, help="encoder processes, each loads its own model")
+    parser.add_argument("--chunk-size", type=int, default=256, help="titles encoded and checkpointed per chunk")
+    parser.add_argument("--quantize", choices=QUANTIZED_DTYPES, nargs="*", default=[], help="also write quantized stores")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--force", action="store_true", help="rewrite outputs even if no article changed")
+    parser.add_argument("--passages", action="store_true", help="also build the dense passage index")
+    parser.add_argument("--passage-window", type=int, default=120, help="words per passage")
+    parser.add_argument("--passage-overlap", type=int, default=40, help="words shared by consecutive passages")
+    args = parser.parse_args()
+
+    connection = open_checkpoint(args.checkpoint)
+    rebuilt = [build_corpus(connection, spec, args.chunk_size, args.workers, args.quantize, args.force) for spec in CORPUS_SPECS]
+    for spec in CORPUS_SPECS:
+        build_ann_index(spec, args.force)
+
+    #Reference lines only change with the articles, so the citation index follows the corpus rebuild
+    if any(rebuilt) or not os.path.exists(CITATION_INDEX_FILE):
+        write_citation_index(build_citation_index(CORPUS_SPECS), CITATION_INDEX_FILE)
+        print(f"Wrote {CITATION_INDEX_FILE}")
+
+    if any(rebuilt) or not os.path.exists(BM25_INDEX_FILE):
+        Bm25Index.build(CORPUS_SPECS).save(BM25_INDEX_FILE)
+        print(f"Wrote {BM25_INDEX_FILE}")
+
+    if args.passages:
+        build_passages(connection, CORPUS_SPECS, args.chunk_size, args.workers, args.passage_window, args.passage_overlap, args.force)
@@ -0,0 +1,39 @@
+#Converts the pickled title embeddings (docs/embeddings*.pkl) into memory-mapped .emb stores.
+#Run from the repository root: python -m utils.convert_embeddings [--dtype float16] [--quantize int8]
+#--quantize also writes docs/embeddings.<dtype>.emb copies used for the coarse scan when EMBEDDING_QUANTIZATION=<dtype>.
+import argparse
+import os
+import pickle
+from api.corpus import CORPUS_SPECS
+from api.embedding_store import QUANTIZED_DTYPES, quantized_store_path, write_embedding_store
+
+def convert(embeddings_file, titles_file, store_file, dtype, quantize):
+    with open(embeddings_file, 'rb') as f:
+        loaded_data = pickle.load(f)
+
+    #Titles in titles.txt decide the article numbering, so they take precedence over the pickled sentences
+    if os.path.exists(titles_file):
+        with open(titles_file, 'r') as file:
+            titles = [line.strip() for line in file.readlines()]
+    else:
+        titles = list(loaded_data['sentences'])
+
+    header = write_embedding_store(store_file, loaded_data['embeddings'], titles, dtype=dtype)
+    print(f"Wrote {store_file} : {header['rows']} x {header['dim']} {header['dtype']}")
+
+    for quantized_dtype in quantize:
+        quantized_file = quantized_store_path(store_file, quantized_dtype)
+        header = write_embedding_store(quantized_file, loaded_data['embeddings'], titles, dtype=quantized_dtype)
+        print(f"Wrote {quantized_file} : {header['rows']} x {header['dim']} {header['dtype']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert pickled title embeddings into memory-mapped embedding stores")
+    parser.add_argument("--dtype", choices=("float32", "float16"), default="float32", help="dtype of the main store")
+    parser.add_argument("--quantize", choices=QUANTIZED_DTYPES, nargs="*", default=[], help="also write quantized copies for the coarse scan")
+    args = parser.parse_args()
+
+    for spec in CORPUS_SPECS:
+        if not os.path.exists(spec["embeddings_file"]):
+            print(f"Skipping {spec['source']} : {spec['embeddings_file']} not found")
+            continue
+        convert(spec["embeddings_file"], spec["titles_file"], spec["store_file"], args.dtype, args.quantize)
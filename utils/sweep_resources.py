@@ -0,0 +1,69 @@
+#Deletes expired assistants, vector stores and files recorded in the resource ledger (api/resource_ledger.py).
+#Run from the repository root: python -m utils.sweep_resources [--dry-run] [--stats]
+#--orphans also handles objects created before the ledger existed: remote assistants and vector stores with the
+#names this API uses that the ledger does not track and that are older than --min-age-hours are recorded as expired.
+#It needs the shared ledger (FILE_REGISTRY_BACKEND=mongo): a local ledger does not track the objects of other hosts,
+#whose live pooled assistants carry the same names. Static assistants in the persisted store are never orphans.
+import argparse
+import json
+import os
+import time
+from openai import OpenAI
+from api.resource_ledger import get_resource_ledger
+from api.static_assistants import STATIC_ASSISTANT_SPECS, get_assistant_store
+from api.config import FILE_REGISTRY_BACKEND
+
+ASSISTANT_NAMES = {"Harmful Ingredients"} | {spec["name"] for spec in STATIC_ASSISTANT_SPECS.values()}
+VECTOR_STORE_NAMES = {"Harmful Ingredients Vec"} | {spec["vector_store_name"] for spec in STATIC_ASSISTANT_SPECS.values()}
+
+def static_assistant_ids(store):
+    #Remote IDs of the persisted static assistants, which may predate the ledger and never expire
+    ids = set()
+    for record in store.records().values():
+        ids.update([record["assistant_id"], record["vector_store_id"], *record.get("file_ids", [])])
+    return ids
+
+def untracked_objects(client, ledger, min_age_seconds, keep_ids=frozenset()):
+    #(kind, remote id, name) of remote objects this API created that the ledger does not track, other than keep_ids
+    cutoff = time.time() - min_age_seconds
+    for assistant in client.beta.assistants.list(limit=100):
+        if assistant.name in ASSISTANT_NAMES and assistant.created_at < cutoff and assistant.id not in keep_ids and not ledger.store.is_tracked(assistant.id):
+            yield "assistant", assistant.id, assistant.name
+    for vector_store in client.beta.vector_stores.list(limit=100):
+        if vector_store.name in VECTOR_STORE_NAMES and vector_store.created_at < cutoff and vector_store.id not in keep_ids and not ledger.store.is_tracked(vector_store.id):
+            yield "vector_store", vector_store.id, vector_store.name
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete expired OpenAI objects recorded in the resource ledger")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be deleted without deleting anything")
+    parser.add_argument("--stats", action="store_true", help="print live object counts and exit")
+    parser.add_argument("--orphans", action="store_true", help="also expire untracked objects created by this API before the ledger existed")
+    parser.add_argument("--min-age-hours", type=float, default=24.0, help="minimum age of an untracked object for --orphans")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--rate", type=float, default=None, help="maximum deletes per second")
+    args = parser.parse_args()
+    if args.orphans and FILE_REGISTRY_BACKEND != "mongo":
+        parser.error("--orphans needs the shared Mongo ledger (FILE_REGISTRY_BACKEND=mongo)")
+
+    ledger = get_resource_ledger()
+    if args.stats:
+        print(json.dumps(ledger.stats(), indent=2))
+        raise SystemExit(0)
+    if args.batch_size is not None:
+        ledger.batch_size = args.batch_size
+    if args.rate is not None:
+        ledger.rate = args.rate
+
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    if args.orphans:
+        orphans = list(untracked_objects(client, ledger, args.min_age_hours * 3600, static_assistant_ids(get_assistant_store())))
+        for kind, remote_id, name in orphans:
+            if args.dry_run:
+                print(f"Would delete untracked {kind} {remote_id} ({name})")
+            else:
+                ledger.record(kind, remote_id, "untracked", ttl=0)
+        print(f"{len(orphans)} untracked objects older than {args.min_age_hours}h")
+
+    start = time.time()
+    handled = ledger.sweep(client, dry_run=args.dry_run)
+    print(f"{'Would delete' if args.dry_run else 'Deleted'} {len(handled)} expired objects ({time.time() - start:.1f}s)")